@@ -4,6 +4,7 @@ Provides a compatible interface with the existing database structure
 """
 import os
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Dict, Optional, Any
 
 # Try to import Firestore (only available when deployed to GCP or with credentials)
@@ -15,6 +16,14 @@ except ImportError:
     FIRESTORE_AVAILABLE = False
     print("⚠️  Firestore not available - install google-cloud-firestore for GCP deployment")
 
+
+@lru_cache(maxsize=1)
+def get_firestore_client():
+    """Get the process-wide Firestore client so all managers share one gRPC channel"""
+    from google.cloud import firestore
+    return firestore.Client()
+
+
 class FirestoreManager:
     """Manages Firestore database operations with SQLite-like interface"""
     
@@ -31,7 +40,7 @@ class FirestoreManager:
         try:
             # On Google Cloud Run, credentials are automatic
             # For local testing, set GOOGLE_APPLICATION_CREDENTIALS environment variable
-            self.db = firestore.Client()
+            self.db = get_firestore_client()
             print("✅ Firestore initialized successfully")
         except Exception as e:
             print(f"⚠️  Firestore initialization error: {e}")
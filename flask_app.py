@@ -15,12 +15,16 @@ from db_manager import db
 import os
 from datetime import datetime, timedelta
 import json
+import logging
 import sqlite3
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Route module loggers (prompt/preference managers, AI agents) to stdout
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(message)s')
+
 # Verify API key is loaded
 anthropic_key = os.getenv('ANTHROPIC_API_KEY')
 if anthropic_key:
@@ -1129,6 +1133,85 @@ def preferences():
                          organic_prefs=organic_prefs,
                          defaults=defaults)
 
+def _get_session_chat_agent():
+    """Chat agent for the current session, creating the session id if needed"""
+    session_id = session.get('session_id')
+    if not session_id:
+        import uuid
+        session_id = str(uuid.uuid4())
+        session['session_id'] = session_id
+    
+    return get_shopping_chat_agent(session_id)
+
+def _save_chat_preferred_product(result):
+    """Save the product the agent picked as preferred, updating result's reply"""
+    stockcode = result.get('stockcode')
+    ingredient = result.get('ingredient')
+    
+    if stockcode and ingredient:
+        # Get product details from Woolworths
+        try:
+            matcher = get_shopping_list_matcher()
+            if not matcher:
+                result['response'] = "❌ Shopping list matcher not available"
+                return
+            
+            product_details = matcher.get_product_details(stockcode)
+            
+            if product_details:
+                # Save as preferred product
+                if db.db_type == 'postgresql':
+                    query = """
+                        INSERT INTO preferred_products 
+                        (ingredient, product_name, stockcode, brand, size, price, is_organic, image_url)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (ingredient) DO UPDATE SET
+                            product_name = EXCLUDED.product_name,
+                            stockcode = EXCLUDED.stockcode,
+                            brand = EXCLUDED.brand,
+                            size = EXCLUDED.size,
+                            price = EXCLUDED.price,
+                            is_organic = EXCLUDED.is_organic,
+                            image_url = EXCLUDED.image_url
+                    """
+                else:
+                    query = """
+                        INSERT OR REPLACE INTO preferred_products 
+                        (ingredient, product_name, stockcode, brand, size, price, is_organic, image_url)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """
+                
+                db.execute_query(query, (
+                    ingredient,
+                    product_details.get('name', product_details.get('Name', '')),
+                    stockcode,
+                    product_details.get('brand', product_details.get('Brand')),
+                    product_details.get('size', product_details.get('Size')),
+                    product_details.get('price', product_details.get('Price')),
+                    1 if product_details.get('isOrganic') else 0,
+                    product_details.get('imageUrl', product_details.get('ImageUrl'))
+                ))
+                
+                result['response'] = f"✅ Set preferred product for '{ingredient}': {product_details.get('name', 'Product')} (${product_details.get('price', 'N/A')})"
+                result['preferred_product_set'] = True
+            else:
+                result['response'] = f"❌ Could not find product details for stockcode {stockcode}"
+        
+        except Exception as e:
+            print(f"Error setting preferred product: {e}")
+            result['response'] = f"❌ Error setting preferred product: {str(e)}"
+
+def _chat_result_payload(result):
+    """JSON body for a finished shopping-chat turn"""
+    return {
+        'success': True,
+        'response': result.get('response', 'No response'),
+        'action': result.get('action', 'none'),
+        'changes_made': result.get('changes_made'),
+        'updated_list': result.get('updated_list') if result.get('action') != 'none' else None,
+        'preferred_product_set': result.get('preferred_product_set', False)
+    }
+
 @app.route('/api/shopping-chat', methods=['POST'])
 def shopping_chat():
     """Chat with AI agent about shopping list"""
@@ -1139,13 +1222,7 @@ def shopping_chat():
         return jsonify({'success': False, 'error': 'No message provided'}), 400
     
     # Get or create chat agent for this session
-    session_id = session.get('session_id')
-    if not session_id:
-        import uuid
-        session_id = str(uuid.uuid4())
-        session['session_id'] = session_id
-    
-    agent = get_shopping_chat_agent(session_id)
+    agent = _get_session_chat_agent()
     if not agent:
         return jsonify({
             'success': False,
@@ -1165,79 +1242,14 @@ def shopping_chat():
         
         # If the agent wants to set a preferred product
         if result.get('action') == 'set_preferred':
-            stockcode = result.get('stockcode')
-            ingredient = result.get('ingredient')
-            
-            if stockcode and ingredient:
-                # Get product details from Woolworths
-                try:
-                    matcher = get_shopping_list_matcher()
-                    if not matcher:
-                        result['response'] = "❌ Shopping list matcher not available"
-                        return jsonify({
-                            'success': True,
-                            'response': result['response'],
-                            'action': result.get('action', 'none')
-                        })
-                    
-                    product_details = matcher.get_product_details(stockcode)
-                    
-                    if product_details:
-                        # Save as preferred product
-                        if db.db_type == 'postgresql':
-                            query = """
-                                INSERT INTO preferred_products 
-                                (ingredient, product_name, stockcode, brand, size, price, is_organic, image_url)
-                                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                                ON CONFLICT (ingredient) DO UPDATE SET
-                                    product_name = EXCLUDED.product_name,
-                                    stockcode = EXCLUDED.stockcode,
-                                    brand = EXCLUDED.brand,
-                                    size = EXCLUDED.size,
-                                    price = EXCLUDED.price,
-                                    is_organic = EXCLUDED.is_organic,
-                                    image_url = EXCLUDED.image_url
-                            """
-                        else:
-                            query = """
-                                INSERT OR REPLACE INTO preferred_products 
-                                (ingredient, product_name, stockcode, brand, size, price, is_organic, image_url)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                            """
-                        
-                        db.execute_query(query, (
-                            ingredient,
-                            product_details.get('name', product_details.get('Name', '')),
-                            stockcode,
-                            product_details.get('brand', product_details.get('Brand')),
-                            product_details.get('size', product_details.get('Size')),
-                            product_details.get('price', product_details.get('Price')),
-                            1 if product_details.get('isOrganic') else 0,
-                            product_details.get('imageUrl', product_details.get('ImageUrl'))
-                        ))
-                        
-                        result['response'] = f"✅ Set preferred product for '{ingredient}': {product_details.get('name', 'Product')} (${product_details.get('price', 'N/A')})"
-                        result['preferred_product_set'] = True
-                    else:
-                        result['response'] = f"❌ Could not find product details for stockcode {stockcode}"
-                        
-                except Exception as e:
-                    print(f"Error setting preferred product: {e}")
-                    result['response'] = f"❌ Error setting preferred product: {str(e)}"
+            _save_chat_preferred_product(result)
         
         # If the agent modified the list, update session
         elif result.get('action') != 'none' and 'updated_list' in result:
             session['shopping_list_categories'] = result['updated_list']
             session.modified = True
         
-        return jsonify({
-            'success': True,
-            'response': result.get('response', 'No response'),
-            'action': result.get('action', 'none'),
-            'changes_made': result.get('changes_made'),
-            'updated_list': result.get('updated_list') if result.get('action') != 'none' else None,
-            'preferred_product_set': result.get('preferred_product_set', False)
-        })
+        return jsonify(_chat_result_payload(result))
         
     except Exception as e:
         print(f"Chat error: {e}")
@@ -1248,6 +1260,68 @@ def shopping_chat():
             'error': str(e)
         }), 500
 
+@app.route('/api/shopping-chat/stream', methods=['POST'])
+def shopping_chat_stream():
+    """
+    Chat with AI agent about shopping list, streaming the reply (Server-Sent Events)
+    
+    Sends {"delta": text} events while Claude writes the reply, then one
+    {"done": body} event where body matches /api/shopping-chat's JSON. The
+    session cookie goes out before the body, so a changed list is saved by
+    posting done.updated_list to /api/shopping-chat/list.
+    """
+    data = request.json
+    user_message = data.get('message', '')
+    
+    if not user_message:
+        return jsonify({'success': False, 'error': 'No message provided'}), 400
+    
+    agent = _get_session_chat_agent()
+    if not agent:
+        return jsonify({
+            'success': False,
+            'error': 'Chat agent not available. Please set OPENAI_API_KEY.'
+        }), 503
+    
+    shopping_list_categories = session.get('shopping_list_categories', {})
+    
+    def generate():
+        try:
+            for event in agent.chat_stream(user_message, shopping_list_categories):
+                if "delta" in event:
+                    yield f"data: {json.dumps(event)}\n\n"
+                    continue
+                
+                result = event["result"]
+                if result.get('action') == 'set_preferred':
+                    _save_chat_preferred_product(result)
+                yield f"data: {json.dumps({'done': _chat_result_payload(result)})}\n\n"
+        
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            import traceback
+            traceback.print_exc()
+            yield f"data: {json.dumps({'done': {'success': False, 'error': str(e)}})}\n\n"
+    
+    from flask import Response
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/shopping-chat/list', methods=['POST'])
+def save_chat_list():
+    """Save the shopping list returned by a streamed chat turn"""
+    data = request.json
+    categories = data.get('categories')
+    if not isinstance(categories, dict):
+        return jsonify({'success': False, 'error': 'No categories provided'}), 400
+    
+    session['shopping_list_categories'] = categories
+    session.modified = True
+    return jsonify({'success': True})
+
 @app.route('/api/reset-chat', methods=['POST'])
 def reset_chat():
     """Reset chat conversation"""
@@ -3,12 +3,15 @@ Woolworths API Service
 REST API wrapper with Playwright authentication for cart management
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import requests
 import os
 import json
 import asyncio
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
 
 app = Flask(__name__)
 
@@ -16,6 +19,100 @@ WOOLWORTHS_API_BASE = "https://www.woolworths.com.au/apis/ui"
 
 # Store session cookies (in production, use Redis or similar)
 user_sessions = {}
+user_sessions_lock = threading.Lock()
+
+# How often the background janitor sweeps expired sessions (seconds)
+SESSION_SWEEP_INTERVAL = 60
+
+# How long a login job's state is kept after its last update (seconds);
+# also bounds a placeholder for a login that never reports back
+LOGIN_JOB_TTL = 300
+
+
+def _sweep_sessions():
+    """Periodically drop sessions that are expired or marked invalid, and stale login jobs"""
+    while True:
+        time.sleep(SESSION_SWEEP_INTERVAL)
+        now = time.time()
+        with user_sessions_lock:
+            for session_id, session in list(user_sessions.items()):
+                if session.get('expired') or now > session['expires_at_ts']:
+                    user_sessions.pop(session_id, None)
+                elif 'login' in session and now - session['login']['updated_ts'] > LOGIN_JOB_TTL:
+                    session.pop('login', None)
+
+
+threading.Thread(target=_sweep_sessions, daemon=True).start()
+
+
+def _get_live_session(session_id):
+    """Session for session_id, or None if it is missing, tombstoned or past expiry"""
+    session = user_sessions.get(session_id)
+    # Placeholders for a first login in progress carry no cookies yet
+    if session is None or session.get('expired') or 'cookies' not in session:
+        return None
+    if time.time() > session['expires_at_ts']:
+        # Mark invalid; the janitor thread removes it from user_sessions
+        session['expired'] = True
+        return None
+    return session
+
+
+def _prebuilt(payload):
+    """Serialize a fixed-shape JSON payload once at import time"""
+    return json.dumps(payload).encode('utf-8')
+
+
+def _prebuilt_response(body, status=200):
+    """Wrap a prebuilt JSON body without going through jsonify"""
+    return Response(body, status=status, mimetype='application/json')
+
+
+# Constant response bodies, encoded once instead of on every request
+_BODY_HEALTH = _prebuilt({"status": "healthy", "service": "woolworths-api"})
+_BODY_SEARCH_TERM_REQUIRED = _prebuilt({"error": "searchTerm is required"})
+_BODY_STOCKCODE_REQUIRED = _prebuilt({"error": "stockcode is required"})
+_BODY_PLAYWRIGHT_UNAVAILABLE = _prebuilt({
+    "success": False,
+    "error": "Playwright not available - authentication disabled"
+})
+_BODY_CREDENTIALS_REQUIRED = _prebuilt({
+    "success": False,
+    "error": "Email and password are required"
+})
+_BODY_NO_SESSION = _prebuilt({
+    "authenticated": False,
+    "message": "No session found"
+})
+_BODY_SESSION_EXPIRED_STATUS = _prebuilt({
+    "authenticated": False,
+    "message": "Session expired"
+})
+_BODY_LOGIN_REQUIRED = _prebuilt({
+    "success": False,
+    "error": "Not authenticated. Please login first."
+})
+_BODY_NOT_AUTHENTICATED = _prebuilt({
+    "success": False,
+    "error": "Not authenticated"
+})
+_BODY_LOGIN_AGAIN = _prebuilt({
+    "success": False,
+    "error": "Session expired. Please login again."
+})
+_BODY_SESSION_EXPIRED = _prebuilt({
+    "success": False,
+    "error": "Session expired"
+})
+_BODY_CART_STOCKCODE_REQUIRED = _prebuilt({
+    "success": False,
+    "error": "Stockcode is required"
+})
+_BODY_CART_UPDATE_REQUIRED = _prebuilt({
+    "success": False,
+    "error": "Stockcode and quantity are required"
+})
+
 
 # Check if Playwright is available
 PLAYWRIGHT_AVAILABLE = False
@@ -69,19 +166,203 @@ async def playwright_login(email: str, password: str):
         # Close browser
         await browser.close()
         
+        # Keep an epoch timestamp alongside the ISO string so expiry checks
+        # are a float comparison instead of a datetime parse per request
+        expires_at_ts = time.time() + 86400
+        
         return {
             "success": True,
             "cookies": cookie_dict,
-            "expires_at": (datetime.now() + timedelta(hours=24)).isoformat()
+            "expires_at": datetime.fromtimestamp(expires_at_ts).isoformat(),
+            "expires_at_ts": expires_at_ts
         }
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+
+class CartCoalescer:
+    """Coalesce cart writes that queue up behind an in-flight write for the same item.
+
+    Adds and updates for a (session, stockcode) pair share one queue. A write
+    for an idle key goes upstream immediately, with no added delay. Writes
+    arriving while it is in flight wait, then the first of them sends all
+    queued writes, merged where the result is unchanged: adds sum, a later
+    update replaces the quantity, and an add following an update adds to it.
+    An update after an add is sent separately, in order. Each caller still
+    sees the result of the upstream call that carried its write.
+    """
+
+    def __init__(self, senders):
+        self._senders = senders
+        self._lock = threading.Lock()
+        # key -> writes queued behind the in-flight one
+        self._queued = {}
+
+    def submit(self, op, session_id, stockcode, quantity, cookies):
+        key = (session_id, stockcode)
+        entry = {'op': op, 'quantity': quantity, 'cookies': cookies,
+                 'done': threading.Event(), 'batch': None, 'result': None, 'error': None}
+        with self._lock:
+            queued = self._queued.get(key)
+            if queued is None:
+                self._queued[key] = []
+                entry['batch'] = [entry]
+            else:
+                queued.append(entry)
+
+        if entry['batch'] is None:
+            # Woken either with our result or to send the queued batch ourselves
+            entry['done'].wait()
+        if entry['batch'] is not None:
+            self._send_batch(key, stockcode, entry['batch'])
+
+        if entry['error'] is not None:
+            raise entry['error']
+        return entry['result']
+
+    def _send_batch(self, key, stockcode, batch):
+        """Send a batch as few in-order upstream calls, then hand the queue on"""
+        cookies = batch[-1]['cookies']
+        for op, quantity, entries in self._merge(batch):
+            result = error = None
+            try:
+                result = self._senders[op](stockcode, quantity, cookies)
+            except Exception as e:
+                error = e
+            for entry in entries:
+                entry['result'] = result
+                entry['error'] = error
+                entry['done'].set()
+
+        with self._lock:
+            queued = self._queued[key]
+            if not queued:
+                del self._queued[key]
+                return
+            self._queued[key] = []
+        # The first waiter becomes the sender for everything that queued up
+        queued[0]['batch'] = queued
+        queued[0]['done'].set()
+
+    @staticmethod
+    def _merge(batch):
+        """Fold consecutive writes into (op, quantity, entries) without changing the outcome"""
+        merged = []
+        for entry in batch:
+            if merged and not (merged[-1][0] == 'add' and entry['op'] == 'update'):
+                op, quantity, entries = merged[-1]
+                if entry['op'] == 'update':
+                    quantity = entry['quantity']
+                else:
+                    quantity = quantity + entry['quantity']
+                entries.append(entry)
+                merged[-1] = (op, quantity, entries)
+            else:
+                merged.append((entry['op'], entry['quantity'], [entry]))
+        return merged
+
+
+def _cart_request(method, path):
+    """Build a sender that writes a single cart item upstream"""
+    def send(stockcode, quantity, cookies):
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        return requests.request(
+            method,
+            f"{WOOLWORTHS_API_BASE}{path}",
+            json={
+                'stockcode': stockcode,
+                'quantity': quantity
+            },
+            cookies=cookies,
+            headers=headers,
+            timeout=10
+        )
+    return send
+
+
+cart_coalescer = CartCoalescer({
+    'add': _cart_request('POST', '/cart/add'),
+    'update': _cart_request('PUT', '/cart/update')
+})
+
+
+# Catalog responses are served from memory for this long, after which they
+# are revalidated upstream with a conditional GET
+CATALOG_CACHE_TTL = 300
+# Entries kept (stale ones too, for revalidation) before the least recently used is evicted
+CATALOG_CACHE_SIZE = 2048
+
+# url/params -> {'etag', 'last_modified', 'body', 'fetched_at'}, in LRU order
+catalog_cache = OrderedDict()
+catalog_cache_lock = threading.Lock()
+
+
+def _catalog_cache_get(key):
+    """Cached entry for key (fresh or stale), marking it recently used"""
+    with catalog_cache_lock:
+        entry = catalog_cache.get(key)
+        if entry is not None:
+            catalog_cache.move_to_end(key)
+        return entry
+
+
+def _catalog_cache_put(key, entry):
+    """Store entry for key, evicting the least recently used entry when full"""
+    with catalog_cache_lock:
+        catalog_cache[key] = entry
+        catalog_cache.move_to_end(key)
+        if len(catalog_cache) > CATALOG_CACHE_SIZE:
+            catalog_cache.popitem(last=False)
+
+
+def conditional_get(url, params=None, headers=None, timeout=10):
+    """GET a catalog resource, revalidating cached copies via ETag/Last-Modified.
+
+    Returns (status_code, body) where body is the decoded JSON for a 200.
+    A 304 from upstream refreshes the cached entry and serves it as a 200.
+    """
+    key = (url, tuple(sorted((params or {}).items())))
+    entry = _catalog_cache_get(key)
+
+    if entry and time.time() - entry['fetched_at'] < CATALOG_CACHE_TTL:
+        return 200, entry['body']
+
+    request_headers = dict(headers or {})
+    if entry:
+        if entry['etag']:
+            request_headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            request_headers['If-Modified-Since'] = entry['last_modified']
+
+    response = requests.get(url, params=params, headers=request_headers, timeout=timeout)
+
+    if response.status_code == 304 and entry:
+        with catalog_cache_lock:
+            entry['fetched_at'] = time.time()
+        return 200, entry['body']
+
+    if response.status_code != 200:
+        return response.status_code, None
+
+    body = response.json()
+    _catalog_cache_put(key, {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'body': body,
+        'fetched_at': time.time()
+    })
+    return 200, body
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "service": "woolworths-api"})
+    return _prebuilt_response(_BODY_HEALTH)
 
 
 @app.route('/api/search', methods=['POST'])
@@ -92,7 +373,7 @@ def search_products():
     page_size = data.get('pageSize', 20)
     
     if not search_term:
-        return jsonify({"error": "searchTerm is required"}), 400
+        return _prebuilt_response(_BODY_SEARCH_TERM_REQUIRED, 400)
     
     try:
         # Call Woolworths API with proper headers
@@ -163,15 +444,15 @@ def search_products():
 def get_product_details(stockcode):
     """Get detailed product information"""
     try:
-        response = requests.get(
+        status_code, product = conditional_get(
             f"{WOOLWORTHS_API_BASE}/products/{stockcode}",
             timeout=10
         )
         
-        if response.status_code == 200:
+        if status_code == 200:
             return jsonify({
                 "success": True,
-                "product": response.json()
+                "product": product
             })
         else:
             return jsonify({
@@ -193,7 +474,7 @@ def get_product_by_stockcode():
     stockcode = data.get('stockcode')
     
     if not stockcode:
-        return jsonify({"error": "stockcode is required"}), 400
+        return _prebuilt_response(_BODY_STOCKCODE_REQUIRED, 400)
     
     try:
         headers = {
@@ -201,16 +482,16 @@ def get_product_by_stockcode():
             'Accept': 'application/json'
         }
         
-        response = requests.get(
+        status_code, product = conditional_get(
             f"{WOOLWORTHS_API_BASE}/products/{stockcode}",
             headers=headers,
             timeout=10
         )
         
-        if response.status_code == 200:
+        if status_code == 200:
             return jsonify({
                 "success": True,
-                "product": response.json()
+                "product": product
             })
         else:
             return jsonify({
@@ -232,7 +513,7 @@ def get_specials():
         category = request.args.get('category', '')
         page_size = int(request.args.get('pageSize', 20))
         
-        response = requests.get(
+        status_code, specials = conditional_get(
             f"{WOOLWORTHS_API_BASE}/specials",
             params={
                 "category": category,
@@ -241,16 +522,16 @@ def get_specials():
             timeout=10
         )
         
-        if response.status_code == 200:
+        if status_code == 200:
             return jsonify({
                 "success": True,
-                "specials": response.json()
+                "specials": specials
             })
         else:
             return jsonify({
                 "success": False,
                 "error": "Could not fetch specials"
-            }), response.status_code
+            }), status_code
             
     except Exception as e:
         return jsonify({
@@ -259,14 +540,56 @@ def get_specials():
         }), 500
 
 
+# Playwright logins run as jobs on this background loop so a slow browser
+# session never ties up a request worker
+login_loop = asyncio.new_event_loop()
+threading.Thread(target=login_loop.run_forever, daemon=True).start()
+
+
+def _set_login_state(session_id: str, state: str, error: str = None):
+    """Record a login job's state on the session record, creating a placeholder if needed"""
+    now = time.time()
+    with user_sessions_lock:
+        session = _get_live_session(session_id)
+        if session is None:
+            # No logged-in session to hang the job on; the placeholder expires
+            # with the job so abandoned logins are swept
+            session = {'expires_at_ts': now + LOGIN_JOB_TTL}
+            user_sessions[session_id] = session
+        session['login'] = {'state': state, 'error': error, 'updated_ts': now}
+
+
+async def login_job(email: str, password: str, session_id: str):
+    """Run a Playwright login and store the session cookies on success"""
+    try:
+        result = await playwright_login(email, password)
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    
+    if result.get('success'):
+        # Store cookies for this session, replacing any placeholder or job state
+        with user_sessions_lock:
+            user_sessions[session_id] = {
+                'cookies': result['cookies'],
+                'expires_at': result['expires_at'],
+                'expires_at_ts': result['expires_at_ts'],
+                'email': email,
+                'login': {'state': 'done', 'error': None, 'updated_ts': time.time()}
+            }
+    else:
+        _set_login_state(session_id, 'failed', result.get('error', 'Login failed'))
+
+
 @app.route('/api/auth/login', methods=['POST'])
 def login():
-    """Login to Woolworths and capture session cookies"""
+    """
+    Start a Woolworths login job and return 202 straight away
+    
+    Poll /api/auth/status?session_id=... until login_state is "done"
+    (authenticated) or "failed" (error holds the reason).
+    """
     if not PLAYWRIGHT_AVAILABLE:
-        return jsonify({
-            "success": False,
-            "error": "Playwright not available - authentication disabled"
-        }), 503
+        return _prebuilt_response(_BODY_PLAYWRIGHT_UNAVAILABLE, 503)
     
     data = request.json or {}
     email = data.get('email')
@@ -274,63 +597,48 @@ def login():
     session_id = data.get('session_id', 'default')
     
     if not email or not password:
-        return jsonify({
-            "success": False,
-            "error": "Email and password are required"
-        }), 400
+        return _prebuilt_response(_BODY_CREDENTIALS_REQUIRED, 400)
     
-    # Run async login in event loop
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(playwright_login(email, password))
-    loop.close()
+    _set_login_state(session_id, 'pending')
+    asyncio.run_coroutine_threadsafe(login_job(email, password, session_id), login_loop)
     
-    if result.get('success'):
-        # Store cookies for this session
-        user_sessions[session_id] = {
-            'cookies': result['cookies'],
-            'expires_at': result['expires_at'],
-            'email': email
-        }
-        
-        return jsonify({
-            "success": True,
-            "session_id": session_id,
-            "message": "Logged in successfully",
-            "expires_at": result['expires_at']
-        })
-    else:
-        return jsonify(result), 401
+    return jsonify({
+        "success": True,
+        "session_id": session_id,
+        "login_state": "pending",
+        "status_url": f"/api/auth/status?session_id={session_id}"
+    }), 202
 
 
 @app.route('/api/auth/status', methods=['GET'])
 def auth_status():
-    """Check if session is authenticated"""
+    """Check if session is authenticated, including the state of a recent login job"""
     session_id = request.args.get('session_id', 'default')
     
-    session = user_sessions.get(session_id)
+    record = user_sessions.get(session_id)
+    login_job_state = record.get('login') if record else None
+    session = _get_live_session(session_id)
     
     if not session:
-        return jsonify({
-            "authenticated": False,
-            "message": "No session found"
-        })
-    
-    # Check if session expired
-    expires_at = datetime.fromisoformat(session['expires_at'])
-    if datetime.now() > expires_at:
-        # Remove expired session
-        del user_sessions[session_id]
-        return jsonify({
-            "authenticated": False,
-            "message": "Session expired"
-        })
+        if login_job_state:
+            return jsonify({
+                "authenticated": False,
+                "login_state": login_job_state['state'],
+                "error": login_job_state['error']
+            })
+        if record is not None:
+            return _prebuilt_response(_BODY_SESSION_EXPIRED_STATUS)
+        return _prebuilt_response(_BODY_NO_SESSION)
     
-    return jsonify({
+    status = {
         "authenticated": True,
         "email": session['email'],
         "expires_at": session['expires_at']
-    })
+    }
+    if login_job_state:
+        status["login_state"] = login_job_state['state']
+        status["error"] = login_job_state['error']
+    return jsonify(status)
 
 
 @app.route('/api/cart', methods=['GET'])
@@ -338,13 +646,10 @@ def get_cart():
     """Get cart contents (requires authentication)"""
     session_id = request.args.get('session_id', 'default')
     
-    session = user_sessions.get(session_id)
+    session = _get_live_session(session_id)
     
     if not session:
-        return jsonify({
-            "success": False,
-            "error": "Not authenticated. Please login first."
-        }), 401
+        return _prebuilt_response(_BODY_LOGIN_REQUIRED, 401)
     
     try:
         headers = {
@@ -365,10 +670,7 @@ def get_cart():
                 "cart": response.json()
             })
         elif response.status_code == 401:
-            return jsonify({
-                "success": False,
-                "error": "Session expired. Please login again."
-            }), 401
+            return _prebuilt_response(_BODY_LOGIN_AGAIN, 401)
         else:
             return jsonify({
                 "success": False,
@@ -391,36 +693,15 @@ def add_to_cart():
     quantity = data.get('quantity', 1)
     
     if not stockcode:
-        return jsonify({
-            "success": False,
-            "error": "Stockcode is required"
-        }), 400
+        return _prebuilt_response(_BODY_CART_STOCKCODE_REQUIRED, 400)
     
-    session = user_sessions.get(session_id)
+    session = _get_live_session(session_id)
     
     if not session:
-        return jsonify({
-            "success": False,
-            "error": "Not authenticated. Please login first."
-        }), 401
+        return _prebuilt_response(_BODY_LOGIN_REQUIRED, 401)
     
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.post(
-            f"{WOOLWORTHS_API_BASE}/cart/add",
-            json={
-                'stockcode': stockcode,
-                'quantity': quantity
-            },
-            cookies=session['cookies'],
-            headers=headers,
-            timeout=10
-        )
+        response = cart_coalescer.submit('add', session_id, stockcode, quantity, session['cookies'])
         
         if response.status_code == 200:
             return jsonify({
@@ -430,10 +711,7 @@ def add_to_cart():
                 "quantity": quantity
             })
         elif response.status_code == 401:
-            return jsonify({
-                "success": False,
-                "error": "Session expired. Please login again."
-            }), 401
+            return _prebuilt_response(_BODY_LOGIN_AGAIN, 401)
         else:
             return jsonify({
                 "success": False,
@@ -456,36 +734,15 @@ def update_cart():
     quantity = data.get('quantity')
     
     if not stockcode or quantity is None:
-        return jsonify({
-            "success": False,
-            "error": "Stockcode and quantity are required"
-        }), 400
+        return _prebuilt_response(_BODY_CART_UPDATE_REQUIRED, 400)
     
-    session = user_sessions.get(session_id)
+    session = _get_live_session(session_id)
     
     if not session:
-        return jsonify({
-            "success": False,
-            "error": "Not authenticated"
-        }), 401
+        return _prebuilt_response(_BODY_NOT_AUTHENTICATED, 401)
     
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.put(
-            f"{WOOLWORTHS_API_BASE}/cart/update",
-            json={
-                'stockcode': stockcode,
-                'quantity': quantity
-            },
-            cookies=session['cookies'],
-            headers=headers,
-            timeout=10
-        )
+        response = cart_coalescer.submit('update', session_id, stockcode, quantity, session['cookies'])
         
         if response.status_code == 200:
             return jsonify({
@@ -493,10 +750,7 @@ def update_cart():
                 "message": "Cart updated"
             })
         elif response.status_code == 401:
-            return jsonify({
-                "success": False,
-                "error": "Session expired"
-            }), 401
+            return _prebuilt_response(_BODY_SESSION_EXPIRED, 401)
         else:
             return jsonify({
                 "success": False,
@@ -1,22 +1,31 @@
 """
 AI Agent for Intelligent Meal Planning
-Uses LangChain for structured meal planning (Pydantic models)
-Native Anthropic SDK for shopping list optimization (simpler, faster)
+Uses Pydantic models with Anthropic tool use for structured meal planning
+Native Anthropic SDK with prompt caching for meal plans and shopping list optimization
 """
 
 from langchain_anthropic import ChatAnthropic
-from langchain.prompts import ChatPromptTemplate
-from langchain.output_parsers import PydanticOutputParser
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Dict, Optional, Tuple
+from functools import lru_cache
 import anthropic
+import copy
+import hashlib
 import json
+import logging
 import os
+import re
+import threading
+import time
 from prompt_manager import get_prompt_manager
 
+logger = logging.getLogger(__name__)
+
+
 # Set up the LLM
+@lru_cache(maxsize=1)
 def get_llm():
-    """Get the language model"""
+    """Get the shared language model (one client and connection pool per process)"""
     api_key = os.getenv('ANTHROPIC_API_KEY')
     if not api_key:
         raise ValueError("ANTHROPIC_API_KEY environment variable not set")
@@ -28,6 +37,254 @@ def get_llm():
         max_retries=2  # Retry on failures
     )
 
+
+@lru_cache(maxsize=1)
+def get_anthropic_client():
+    """Get the shared native Anthropic client (supports structured system blocks and prompt caching)"""
+    api_key = os.getenv('ANTHROPIC_API_KEY')
+    if not api_key:
+        raise ValueError("ANTHROPIC_API_KEY environment variable not set")
+    return anthropic.Anthropic(
+        api_key=api_key,
+        timeout=60.0,  # 60 second timeout
+        max_retries=2  # Retry on failures
+    )
+
+
+# Shortest prefix Claude 3 Haiku will cache; a cache_control breakpoint on a
+# shorter prefix is silently ignored (Sonnet/Opus cache from 1024 tokens)
+CACHE_MIN_PREFIX_TOKENS = 2048
+
+
+def build_cached_system(*parts: str) -> List[Dict]:
+    """
+    Build a system prompt block marked for Anthropic prompt caching
+    
+    The static instructions never change between calls, so caching them means
+    only the per-request data is prefilled on repeat calls - once the prefix
+    reaches CACHE_MIN_PREFIX_TOKENS. On claude-3-haiku the current prefixes
+    are below it (meal plan: tool schema 2.1k + system 1.6k chars, about 1.0k
+    tokens; optimization: 4.4k chars, about 1.1k tokens), so the breakpoints
+    are inactive until the prompts grow or the model changes. log_cache_usage
+    shows whether a call actually read from the cache.
+    """
+    return [{
+        "type": "text",
+        "text": "\n\n".join(part for part in parts if part),
+        "cache_control": {"type": "ephemeral"}
+    }]
+
+
+def log_cache_usage(label: str, usage) -> None:
+    """Log prompt-cache reads/writes reported by the API (both 0 when nothing was cached)"""
+    if usage is None:
+        return
+    logger.debug("%s prompt cache: read %s, written %s, uncached input %s tokens", label,
+                 getattr(usage, "cache_read_input_tokens", 0) or 0,
+                 getattr(usage, "cache_creation_input_tokens", 0) or 0,
+                 usage.input_tokens)
+
+
+def ingredient_sort_key(item: Dict) -> tuple:
+    """Canonical ordering key so identical inputs always produce identical prompt bytes"""
+    name = item.get('name', item.get('ingredient_name', '')) or ''
+    return (name.lower(), str(item.get('quantity', '')), str(item.get('unit', '')))
+
+
+def format_item_line(item: Dict) -> str:
+    """Format an ingredient or staple as a '- name quantity unit' prompt line"""
+    name = item.get('name', item.get('ingredient_name', 'Unknown'))
+    return f"- {name} {item.get('quantity', '')} {item.get('unit', '')}".strip()
+
+
+def substitution_sort_key(sub: Dict) -> tuple:
+    """Canonical ordering key for substitutions"""
+    return (str(sub.get('original', '')).lower(), str(sub.get('substitute', '')).lower())
+
+
+def recipes_fingerprint(recipes: List[Dict]) -> tuple:
+    """Immutable snapshot of the recipe fields used in prompts (hashable cache key)"""
+    return tuple(
+        (
+            recipe.get('name', 'Unknown'),
+            recipe.get('meal_type', 'Any'),
+            recipe.get('cuisine', 'Not specified'),
+            recipe.get('difficulty', 'Medium'),
+            recipe.get('total_time', 'Not specified'),
+            recipe.get('description', 'No description'),
+            tuple(recipe.get('tags') or ()),
+            len(recipe.get('ingredients') or ())
+        )
+        for recipe in recipes
+    )
+
+
+@lru_cache(maxsize=32)
+def format_recipes(fingerprint: tuple) -> str:
+    """Format recipes for the prompt (memoized on the recipes fingerprint)"""
+    return "\n".join(
+        f"""
+Recipe: {name}
+- Meal Type: {meal_type}
+- Cuisine: {cuisine}
+- Difficulty: {difficulty}
+- Time: {total_time}
+- Description: {description}
+- Tags: {', '.join(tags) if tags else 'none'}
+""" + (f"- Ingredients: {ingredient_count} items\n" if ingredient_count else "")
+        for name, meal_type, cuisine, difficulty, total_time, description, tags, ingredient_count
+        in fingerprint
+    )
+
+
+def preferences_fingerprint(family_preferences: Dict) -> tuple:
+    """Immutable snapshot of family preferences (hashable cache key)"""
+    if not family_preferences:
+        return ()
+    
+    fingerprint = []
+    for member, prefs in family_preferences.items():
+        if isinstance(prefs, dict):
+            prefs = tuple(
+                (key, tuple(prefs[key]))
+                for key in ('general_preferences', 'liked_recipes', 'disliked_recipes')
+                if key in prefs
+            )
+            fingerprint.append((member, 'dict', prefs))
+        elif isinstance(prefs, list):
+            fingerprint.append((member, 'list', tuple(prefs)))
+        else:
+            fingerprint.append((member, 'other', str(prefs)))
+    return tuple(fingerprint)
+
+
+PREFERENCE_LABELS = {
+    'general_preferences': 'General',
+    'liked_recipes': 'Likes',
+    'disliked_recipes': 'Dislikes'
+}
+
+
+@lru_cache(maxsize=32)
+def format_family_preferences(fingerprint: tuple) -> str:
+    """Format family preferences for the prompt (memoized on the preferences fingerprint)"""
+    if not fingerprint:
+        return "No specific family preferences provided."
+    
+    formatted = []
+    
+    for member, kind, prefs in fingerprint:
+        pref_text = f"\n{member.title()}:"
+        
+        if kind == 'dict':
+            # Handle structured preferences
+            for key, values in prefs:
+                pref_text += f"\n  {PREFERENCE_LABELS[key]}: {', '.join(values)}"
+        elif kind == 'list':
+            # Handle simple list of preferences
+            pref_text += f"\n  Preferences: {', '.join(prefs)}"
+        else:
+            pref_text += f"\n  {prefs}"
+        
+        formatted.append(pref_text)
+    
+    return "\n".join(formatted)
+
+
+_json_decoder = json.JSONDecoder()
+
+
+def parse_json_response(text: str) -> Dict:
+    """
+    Parse the first JSON object embedded in an LLM response
+    
+    Handles code fences, leading prose and trailing text in one pass by
+    decoding from each opening brace until one parses.
+    
+    Raises:
+        json.JSONDecodeError: If no JSON object can be decoded
+    """
+    start = text.find('{')
+    while start != -1:
+        try:
+            value, _ = _json_decoder.raw_decode(text, start)
+            return value
+        except json.JSONDecodeError:
+            start = text.find('{', start + 1)
+    raise json.JSONDecodeError("No JSON object found in response", text, 0)
+
+
+_WORD_RE = re.compile(r"[a-z]+")
+_PLURAL_ES_RE = re.compile(r"(?:oes|ches|shes|sses|xes)$")
+
+# Token-set similarity at or above this counts as the same item
+TOKEN_MATCH_THRESHOLD = 0.5
+
+
+def _stem(word: str) -> str:
+    """Tiny plural→singular normalizer (berries→berry, tomatoes→tomato, olives→olive)"""
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if _PLURAL_ES_RE.search(word):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def item_tokens(name: str) -> frozenset:
+    """Normalized word set for an item name"""
+    return frozenset(_stem(word) for word in _WORD_RE.findall(name.lower()))
+
+
+class ItemMatcher:
+    """
+    Answers "is this ingredient already covered by one of the AI items?"
+    
+    An ingredient matches when it is a substring of an AI item or vice versa
+    (one C-level scan each way: a newline-joined haystack and an alternation
+    regex), or when their normalized word sets overlap enough - one is a
+    subset of the other or Jaccard similarity >= TOKEN_MATCH_THRESHOLD. The
+    token check catches plural/word-order variants such as "tomato" vs
+    "roma tomatoes" and only compares against items sharing a word.
+    """
+    
+    def __init__(self, items):
+        self.items = set(items)
+        self._haystack = "\n".join(self.items)
+        self._pattern = re.compile("|".join(
+            re.escape(item) for item in sorted(self.items, key=len, reverse=True)
+        )) if self.items else None
+        
+        # word -> token sets of the AI items containing it
+        self._token_index = {}
+        for item in self.items:
+            tokens = item_tokens(item)
+            for token in tokens:
+                self._token_index.setdefault(token, set()).add(tokens)
+    
+    def matches(self, name: str) -> bool:
+        if not self.items:
+            return False
+        if name in self.items:
+            return True
+        if "\n" not in name and name in self._haystack:
+            return True
+        if self._pattern.search(name) is not None:
+            return True
+        
+        tokens = item_tokens(name)
+        candidates = set()
+        for token in tokens:
+            candidates.update(self._token_index.get(token, ()))
+        for candidate in candidates:
+            if tokens <= candidate or candidate <= tokens:
+                return True
+            if len(tokens & candidate) / len(tokens | candidate) >= TOKEN_MATCH_THRESHOLD:
+                return True
+        return False
+
+
 # Output schema for meal plan
 class DayMealPlan(BaseModel):
     """Meal plan for a single day"""
@@ -49,8 +306,16 @@ class MealPlanAgent:
     """AI Agent for generating intelligent meal plans"""
     
     def __init__(self):
-        self.llm = get_llm()
-        self.parser = PydanticOutputParser(pydantic_object=WeeklyMealPlan)
+        self.client = get_anthropic_client()
+        self.model = "claude-3-haiku-20240307"
+        # The schema goes out-of-band as a forced tool call, so the response is
+        # structured JSON rather than text that has to be parsed
+        self.tools = [{
+            "name": "submit_meal_plan",
+            "description": "Submit the completed weekday meal plan",
+            "input_schema": WeeklyMealPlan.model_json_schema()
+        }]
+        self._system_cache = (None, None)
         
     def generate_meal_plan(self, recipes: List[Dict], family_preferences: Dict, 
                           additional_context: str = "") -> WeeklyMealPlan:
@@ -66,6 +331,15 @@ class MealPlanAgent:
             WeeklyMealPlan object with daily meal assignments
         """
         
+        response = self.client.messages.create(
+            **self._meal_plan_request(recipes, family_preferences, additional_context)
+        )
+        log_cache_usage("Meal plan", response.usage)
+        return self._parse_meal_plan(response)
+    
+    def _meal_plan_request(self, recipes: List[Dict], family_preferences: Dict,
+                           additional_context: str) -> Dict:
+        """Build the Messages API parameters for meal plan generation"""
         # Format recipes for the prompt
         recipes_text = self._format_recipes(recipes)
         family_prefs_text = self._format_family_preferences(family_preferences)
@@ -73,93 +347,61 @@ class MealPlanAgent:
         # Load prompts from prompt manager
         pm = get_prompt_manager()
         system_prompt = pm.get_prompt("meal_plan_generation.system")
-        user_prompt_template = pm.get_prompt("meal_plan_generation.user_template")
-        
-        # Create the prompt with format instructions
-        system_with_format = system_prompt + "\n\n{format_instructions}"
-        user_prompt = user_prompt_template.format(
+        instructions = pm.get_prompt("meal_plan_generation.instructions")
+        user_prompt = pm.get_prompt(
+            "meal_plan_generation.user_template",
             recipes_text=recipes_text,
             preferences_text=family_prefs_text,
             additional_context=additional_context or "No additional constraints"
         )
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_with_format),
-            ("human", user_prompt)
-        ])
-        
-        # Format the prompt
-        formatted_prompt = prompt.format_messages(
-            format_instructions=self.parser.get_format_instructions()
+        # Tools + static instructions form the cached prefix; only the
+        # recipes/preferences vary per call
+        return {
+            "model": self.model,
+            "max_tokens": 4096,
+            "temperature": 0.7,
+            "tools": self.tools,
+            "tool_choice": {"type": "tool", "name": "submit_meal_plan"},
+            "system": self._system_blocks(system_prompt, instructions),
+            "messages": [{"role": "user", "content": user_prompt}]
+        }
+    
+    def _parse_meal_plan(self, response) -> WeeklyMealPlan:
+        """Validate the submit_meal_plan tool input as a WeeklyMealPlan"""
+        tool_input = next(
+            (block.input for block in response.content if block.type == "tool_use"), None
         )
-        
-        # Get response from LLM
-        response = self.llm.invoke(formatted_prompt)
-        
-        # Parse the response
+        if tool_input is None:
+            # e.g. stop_reason "max_tokens" cut the reply off before the tool call
+            logger.error("Meal plan response has no submit_meal_plan call (stop_reason: %s)",
+                         response.stop_reason)
+            raise ValueError(
+                f"Meal plan response contained no submit_meal_plan tool call "
+                f"(stop_reason: {response.stop_reason})"
+            )
         try:
-            meal_plan = self.parser.parse(response.content)
-            return meal_plan
-        except Exception as e:
-            print(f"Error parsing response: {e}")
-            print(f"Raw response: {response.content}")
+            return WeeklyMealPlan.model_validate(tool_input)
+        except ValidationError as e:
+            logger.error("Error parsing meal plan (stop_reason: %s): %s", response.stop_reason, e)
+            logger.debug("Raw meal plan tool input: %s", tool_input)
             raise
     
+    def _system_blocks(self, system_prompt: str, instructions: str) -> List[Dict]:
+        """Build the cached system block, reusing it until the prompts change"""
+        key, blocks = self._system_cache
+        if key != (system_prompt, instructions):
+            blocks = build_cached_system(system_prompt, instructions)
+            self._system_cache = ((system_prompt, instructions), blocks)
+        return blocks
+    
     def _format_recipes(self, recipes: List[Dict]) -> str:
         """Format recipes for the prompt"""
-        formatted = []
-        
-        for recipe in recipes:
-            recipe_text = f"""
-Recipe: {recipe.get('name', 'Unknown')}
-- Meal Type: {recipe.get('meal_type', 'Any')}
-- Cuisine: {recipe.get('cuisine', 'Not specified')}
-- Difficulty: {recipe.get('difficulty', 'Medium')}
-- Time: {recipe.get('total_time', 'Not specified')}
-- Description: {recipe.get('description', 'No description')}
-"""
-            # Add tags (CRITICAL for filtering)
-            tags = recipe.get('tags', [])
-            if tags:
-                recipe_text += f"- Tags: {', '.join(tags)}\n"
-            else:
-                recipe_text += "- Tags: none\n"
-            
-            # Add ingredient count if available
-            if 'ingredients' in recipe and recipe['ingredients']:
-                recipe_text += f"- Ingredients: {len(recipe['ingredients'])} items\n"
-            
-            formatted.append(recipe_text)
-        
-        return "\n".join(formatted)
+        return format_recipes(recipes_fingerprint(recipes))
     
     def _format_family_preferences(self, family_preferences: Dict) -> str:
         """Format family preferences for the prompt"""
-        if not family_preferences:
-            return "No specific family preferences provided."
-        
-        formatted = []
-        
-        for member, prefs in family_preferences.items():
-            pref_text = f"\n{member.title()}:"
-            
-            if isinstance(prefs, dict):
-                # Handle structured preferences
-                if 'general_preferences' in prefs:
-                    pref_text += f"\n  General: {', '.join(prefs['general_preferences'])}"
-                if 'liked_recipes' in prefs:
-                    pref_text += f"\n  Likes: {', '.join(prefs['liked_recipes'])}"
-                if 'disliked_recipes' in prefs:
-                    pref_text += f"\n  Dislikes: {', '.join(prefs['disliked_recipes'])}"
-            elif isinstance(prefs, list):
-                # Handle simple list of preferences
-                pref_text += f"\n  Preferences: {', '.join(prefs)}"
-            else:
-                pref_text += f"\n  {prefs}"
-            
-            formatted.append(pref_text)
-        
-        return "\n".join(formatted)
+        return format_family_preferences(preferences_fingerprint(family_preferences))
     
     def suggest_alternative(self, current_plan: WeeklyMealPlan, day: str, 
                           meal_type: str, recipes: List[Dict]) -> str:
@@ -199,8 +441,13 @@ Suggest a better alternative for {meal_type} on {day}.
 Consider variety, balance, and family preferences.
 Return ONLY the recipe name, nothing else."""
         
-        response = self.llm.invoke(prompt)
-        return response.content.strip()
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=100,
+            temperature=0.7,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        return response.content[0].text.strip()
 
 
 def get_family_preferences_from_db(recipe_db):
@@ -257,25 +504,26 @@ class ShoppingListOptimizer:
         # Format the raw data
         ingredients_text = self._format_ingredients(raw_ingredients)
         staples_text = self._format_staples(staples)
-        organic_text = ", ".join(organic_preferences) if organic_preferences else "None specified"
+        organic_text = ", ".join(sorted(organic_preferences)) if organic_preferences else "None specified"
         subs_text = self._format_substitutions(substitutions)
         
         # Log input counts for debugging
-        print(f"🔍 AI Shopping List Input: {len(raw_ingredients)} ingredients + {len([s for s in staples if not s.get('in_stock')])} staples")
+        logger.debug("AI Shopping List Input: %d ingredients + %d staples",
+                     len(raw_ingredients), sum(1 for s in staples if not s.get('in_stock')))
         
         prompt = f"""You are an expert grocery shopping assistant. Analyze this shopping list and organize it intelligently.
 
-RAW INGREDIENTS FROM RECIPES:
-{ingredients_text}
-
-STAPLES (items to add if not in stock):
-{staples_text}
-
 ORGANIC PREFERENCES: {organic_text}
 
 INGREDIENT SUBSTITUTIONS:
 {subs_text}
 
+STAPLES (items to add if not in stock):
+{staples_text}
+
+RAW INGREDIENTS FROM RECIPES:
+{ingredients_text}
+
 CRITICAL: You MUST return ONLY valid JSON. No explanations, no markdown, just pure JSON.
 
 ⚠️ CRITICAL REQUIREMENT: Include EVERY SINGLE ingredient listed above. Do NOT drop any items.
@@ -318,66 +566,45 @@ IMPORTANT: Return ONLY the JSON object above. No markdown, no ```json blocks, no
         try:
             response = self.llm.invoke(prompt)
             
-            # Clean the response content
-            content = response.content.strip()
-            
-            # Remove markdown code blocks if present
-            if content.startswith('```json'):
-                content = content.replace('```json', '', 1).strip()
-            if content.startswith('```'):
-                content = content.replace('```', '', 1).strip()
-            if content.endswith('```'):
-                content = content.rsplit('```', 1)[0].strip()
-            
-            # Parse the JSON response
-            result = json.loads(content)
+            # Parse the JSON response (tolerates code fences and surrounding text)
+            result = parse_json_response(response.content)
             
             # CRITICAL: Validate that all ingredients are accounted for
             result = self._validate_and_fix_missing_items(result, raw_ingredients, staples)
             
-            print(f"✅ AI Shopping List: {result.get('total_items', 0)} items organized into {len(result.get('categories', {}))} categories")
+            logger.debug("AI Shopping List: %d items organized into %d categories",
+                         result.get('total_items', 0), len(result.get('categories', {})))
             return result
         except json.JSONDecodeError as e:
-            print(f"Error parsing AI response: {e}")
-            print(f"Raw response: {response.content[:500]}")  # Limit output
+            logger.warning("Error parsing AI response: %s", e)
+            logger.debug("Raw response: %s", response.content[:500])  # Limit output
             # Return basic fallback
             return self._fallback_organization(raw_ingredients, staples)
         except Exception as e:
-            print(f"Error in AI optimization: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in AI optimization: %s", e)
             return self._fallback_organization(raw_ingredients, staples)
     
     def _format_ingredients(self, ingredients: List[Dict]) -> str:
         """Format ingredients for prompt"""
-        lines = []
-        for ing in ingredients:
-            name = ing.get('name', ing.get('ingredient_name', 'Unknown'))
-            qty = ing.get('quantity', '')
-            unit = ing.get('unit', '')
-            lines.append(f"- {name} {qty} {unit}".strip())
-        return "\n".join(lines) if lines else "No ingredients"
+        return "\n".join(
+            map(format_item_line, sorted(ingredients, key=ingredient_sort_key))
+        ) or "No ingredients"
     
     def _format_staples(self, staples: List[Dict]) -> str:
         """Format staples for prompt"""
-        lines = []
-        for staple in staples:
-            if not staple.get('in_stock', False):
-                name = staple.get('name', 'Unknown')
-                qty = staple.get('quantity', '')
-                unit = staple.get('unit', '')
-                lines.append(f"- {name} {qty} {unit}".strip())
-        return "\n".join(lines) if lines else "All staples in stock"
+        return "\n".join(
+            format_item_line(staple)
+            for staple in sorted(staples, key=ingredient_sort_key)
+            if not staple.get('in_stock', False)
+        ) or "All staples in stock"
     
     def _format_substitutions(self, substitutions: List[Dict]) -> str:
         """Format substitutions for prompt"""
-        lines = []
-        for sub in substitutions:
-            orig = sub.get('original', '')
-            subst = sub.get('substitute', '')
-            reason = sub.get('reason', '')
-            lines.append(f"- Replace '{orig}' with '{subst}' {f'({reason})' if reason else ''}")
-        return "\n".join(lines) if lines else "No substitutions"
+        return "\n".join(
+            f"- Replace '{sub.get('original', '')}' with '{sub.get('substitute', '')}' "
+            f"{'({})'.format(sub['reason']) if sub.get('reason') else ''}"
+            for sub in sorted(substitutions, key=substitution_sort_key)
+        ) or "No substitutions"
     
     def _validate_and_fix_missing_items(self, ai_result: Dict, raw_ingredients: List[Dict], staples: List[Dict]) -> Dict:
         """Validate AI result has all ingredients, add any missing ones"""
@@ -390,27 +617,21 @@ IMPORTANT: Return ONLY the JSON object above. No markdown, no ```json blocks, no
                 item_name = item.get('item', '').lower().strip()
                 ai_items_lower.add(item_name)
         
+        matcher = ItemMatcher(ai_items_lower)
+        
         # Check each raw ingredient
         missing_items = []
         for ing in raw_ingredients:
             name = ing.get('name', ing.get('ingredient_name', 'Unknown')).lower().strip()
-            # Check if this ingredient or a variation exists in AI result
-            found = False
-            for ai_item in ai_items_lower:
-                # Check if ingredient is in AI item or vice versa (handles combinations)
-                if name in ai_item or ai_item in name:
-                    found = True
-                    break
-            
-            if not found:
+            # Check if ingredient is in AI item or vice versa (handles combinations)
+            if not matcher.matches(name):
                 missing_items.append(ing)
         
         # Check staples that should be added
         for staple in staples:
             if not staple.get('in_stock', False):
                 name = staple.get('name', '').lower().strip()
-                found = any(name in ai_item or ai_item in name for ai_item in ai_items_lower)
-                if not found:
+                if not matcher.matches(name):
                     missing_items.append({
                         'name': staple['name'],
                         'quantity': staple.get('quantity', ''),
@@ -420,7 +641,7 @@ IMPORTANT: Return ONLY the JSON object above. No markdown, no ```json blocks, no
         
         # Add missing items to Other category
         if missing_items:
-            print(f"⚠️  AI dropped {len(missing_items)} items - adding them back to 'Other' category")
+            logger.warning("AI dropped %d items - adding them back to 'Other' category", len(missing_items))
             if 'Other' not in categories:
                 categories['Other'] = []
             
@@ -481,19 +702,89 @@ IMPORTANT: Return ONLY the JSON object above. No markdown, no ```json blocks, no
         }
 
 
+class ShoppingItem(BaseModel):
+    """A single item in an optimized shopping list"""
+    item: str = Field(description="Item name")
+    quantity: str = Field(default="", description="Combined quantity")
+    notes: str = Field(default="", description="Notes such as organic preference or substitution")
+
+class OptimizedShoppingList(BaseModel):
+    """Optimized shopping list grouped by store category"""
+    categories: Dict[str, List[ShoppingItem]] = Field(description="Items grouped by store category")
+    shopping_tips: List[str] = Field(default_factory=list, description="Helpful shopping tips")
+    cost_saving_suggestions: List[str] = Field(default_factory=list, description="Cost-saving opportunities")
+    total_items: int = Field(default=0, description="Total number of items")
+
+
+# Exact-match cache of optimized shopping lists, keyed on the canonical
+# (sorted) prompt so identical weekly inputs skip the LLM call entirely
+RESPONSE_CACHE_TTL = 7 * 24 * 60 * 60  # 7 days
+RESPONSE_CACHE_MAX_ENTRIES = 256
+_response_cache = {}  # key -> (stored_at, result)
+_response_cache_lock = threading.Lock()
+
+
+def response_cache_key(*parts: str) -> str:
+    """Hash the exact request content into a cache key"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def get_cached_response(key: str) -> Optional[Dict]:
+    """Return a copy of a cached result, or None if missing/expired"""
+    with _response_cache_lock:
+        entry = _response_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.time() - stored_at > RESPONSE_CACHE_TTL:
+            del _response_cache[key]
+            return None
+    return copy.deepcopy(result)
+
+
+def store_cached_response(key: str, result: Dict):
+    """Cache a result, evicting the oldest entry when full"""
+    with _response_cache_lock:
+        if key not in _response_cache and len(_response_cache) >= RESPONSE_CACHE_MAX_ENTRIES:
+            del _response_cache[next(iter(_response_cache))]
+        _response_cache[key] = (time.time(), copy.deepcopy(result))
+
+
+# Output budget for shopping list optimization: a fixed allowance for tips and
+# JSON structure plus a per-item allowance, capped at Haiku's maximum (4096;
+# 8192 would require Sonnet). An item line such as
+#   {"item": "chicken thigh fillets", "quantity": "1.2kg total", "notes": "Combined from 3 recipes"},
+# averages ~85 characters (p90 ~120) - about 28 tokens (p90 ~40) at the ~3
+# characters per token JSON tokenizes to - so 45 covers long notes. A reply
+# that still hits the budget is retried once at MAX_OUTPUT_TOKENS.
+MAX_OUTPUT_TOKENS = 4096
+BASE_OUTPUT_TOKENS = 400
+OUTPUT_TOKENS_PER_ITEM = 45
+
+# Deliberate-then-format: when enabled, the optimizer reasons over the list in
+# plain text and a formatting-only second call always produces the JSON, rather
+# than asking the reasoning call for JSON directly. Costs one extra (short)
+# call per list, so it is off by default; without it _format_json is only a
+# fallback for malformed JSON. The cached system prompt is shared by both
+# modes - the plain-text override goes in the uncached user message.
+TWO_STAGE_OPTIMIZATION = os.getenv('TWO_STAGE_OPTIMIZATION', 'false').lower() == 'true'
+PLAIN_TEXT_OUTPUT_INSTRUCTION = (
+    "\n\nOUTPUT FORMAT OVERRIDE: do NOT return JSON. Write the organized list as plain "
+    "text - one line per category heading, then one '- item - quantity (notes)' line "
+    "per item - followed by 'Shopping tips:' and 'Cost saving suggestions:' lines."
+)
+
+
 # Alternative: Native Anthropic SDK optimizer (no LangChain dependency)
 class ShoppingListOptimizerNative:
     """Simple shopping list optimizer using native Anthropic SDK"""
     
     def __init__(self):
-        api_key = os.getenv('ANTHROPIC_API_KEY')
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY environment variable not set")
-        self.client = anthropic.Anthropic(
-            api_key=api_key,
-            timeout=60.0,  # 60 second timeout
-            max_retries=2  # Retry on failures
-        )
+        self.client = get_anthropic_client()
         self.model = "claude-3-haiku-20240307"
     
     def optimize_shopping_list(self, raw_ingredients: List[Dict], 
@@ -503,35 +794,78 @@ class ShoppingListOptimizerNative:
         """
         Optimize shopping list using native Anthropic SDK (faster than LangChain)
         """
+        params, cache_key = self._optimization_request(
+            raw_ingredients, organic_preferences, substitutions, staples
+        )
+        cached = get_cached_response(cache_key)
+        if cached is not None:
+            logger.debug("AI Shopping List: served from cache (%d items)", cached.get('total_items', 0))
+            return cached
         
+        try:
+            content, stop_reason = self._stream_text(params)
+            
+            # A reply cut off at the sized budget is incomplete; retry at the cap
+            if stop_reason == "max_tokens" and params["max_tokens"] < MAX_OUTPUT_TOKENS:
+                logger.warning("AI shopping list hit max_tokens=%d - retrying with %d",
+                               params["max_tokens"], MAX_OUTPUT_TOKENS)
+                params = {**params, "max_tokens": MAX_OUTPUT_TOKENS}
+                content, stop_reason = self._stream_text(params)
+            
+            return self._finish_optimization(
+                content, stop_reason, params, cache_key, raw_ingredients, staples
+            )
+            
+        except Exception as e:
+            logger.exception("Native optimizer error: %s", e)
+            # Fallback to basic organization
+            return self._fallback_organization(raw_ingredients, staples)
+    
+    def _stream_text(self, params: Dict) -> Tuple[str, str]:
+        """Stream a response, joining the chunks once at the end; returns (text, stop_reason)"""
+        with self.client.messages.stream(**params) as stream:
+            chunks = [text for text in stream.text_stream]
+            final = stream.get_final_message()
+        log_cache_usage("Shopping list", final.usage)
+        return "".join(chunks), final.stop_reason
+    
+    def _optimization_request(self, raw_ingredients: List[Dict],
+                              organic_preferences: List[str],
+                              substitutions: List[Dict],
+                              staples: List[Dict]) -> Tuple[Dict, str]:
+        """Build the Messages API parameters and exact-match cache key for optimization"""
         # Format inputs
-        ingredients_list = "\n".join([
-            f"- {ing.get('name', ing.get('ingredient_name', 'Unknown'))} {ing.get('quantity', '')} {ing.get('unit', '')}".strip()
-            for ing in raw_ingredients
-        ])
-        
-        staples_list = "\n".join([
-            f"- {s.get('name')} {s.get('quantity', '')} {s.get('unit', '')}".strip()
-            for s in staples if not s.get('in_stock', False)
-        ])
+        ingredient_lines = [
+            format_item_line(ing) for ing in sorted(raw_ingredients, key=ingredient_sort_key)
+        ]
+        ingredients_list = "\n".join(ingredient_lines)
+        
+        staples_list = "\n".join(
+            format_item_line(s)
+            for s in sorted(staples, key=ingredient_sort_key) if not s.get('in_stock', False)
+        )
         
-        organic_text = ", ".join(organic_preferences) if organic_preferences else "None"
+        organic_text = ", ".join(sorted(organic_preferences)) if organic_preferences else "None"
         
-        subs_text = "\n".join([
+        subs_text = "\n".join(
             f"- {s.get('original')} → {s.get('substitute')}"
-            for s in substitutions
-        ]) if substitutions else "None"
+            for s in sorted(substitutions, key=substitution_sort_key)
+        ) if substitutions else "None"
         
-        print(f"🔍 AI Shopping List Input: {len(raw_ingredients)} ingredients + {len([s for s in staples if not s.get('in_stock')])} staples")
+        logger.debug("AI Shopping List Input: %d ingredients + %d staples",
+                     len(raw_ingredients), sum(1 for s in staples if not s.get('in_stock')))
         
-        # Debug: Log a few sample ingredients to verify
-        if raw_ingredients:
-            print(f"   Sample ingredients:")
-            for i, ing in enumerate(raw_ingredients[:5]):
-                print(f"   - {ing.get('name', ing.get('ingredient_name', 'Unknown'))} {ing.get('quantity', '')} {ing.get('unit', '')}".strip())
+        # Debug: Log a few sample ingredients (reusing the already formatted lines)
+        if ingredient_lines:
+            logger.debug("Sample ingredients: %s", ingredient_lines[:5])
         
-        # Load prompt from prompt manager
+        # Load prompts from prompt manager - the static rules/schema are cached,
+        # the ingredient data is sent uncached in the user message
         pm = get_prompt_manager()
+        system = build_cached_system(
+            pm.get_prompt("shopping_list_optimization.system"),
+            pm.get_prompt("shopping_list_optimization.instructions")
+        )
         prompt = pm.get_prompt(
             "shopping_list_optimization.user_template",
             ingredients_list=ingredients_list,
@@ -539,41 +873,76 @@ class ShoppingListOptimizerNative:
             organic_text=organic_text,
             subs_text=subs_text
         )
-        
-        try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=4096,  # Maximum for Haiku (8192 would require Sonnet)
-                temperature=0.3,  # Lower temperature for more consistent results
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            # Extract JSON from response
-            content = response.content[0].text.strip()
-            
-            # Clean markdown if present
-            if content.startswith('```json'):
-                content = content.replace('```json', '').replace('```', '').strip()
-            elif content.startswith('```'):
-                content = content.replace('```', '').strip()
-            
-            result = json.loads(content)
-            
-            # Validate all items are present
-            result = self._validate_items(result, raw_ingredients, staples)
-            
-            print(f"✅ AI Shopping List: {result.get('total_items', 0)} items organized into {len(result.get('categories', {}))} categories")
-            return result
-            
-        except Exception as e:
-            print(f"Native optimizer error: {e}")
-            import traceback
-            traceback.print_exc()
-            # Fallback to basic organization
-            return self._fallback_organization(raw_ingredients, staples)
+        if TWO_STAGE_OPTIMIZATION:
+            prompt += PLAIN_TEXT_OUTPUT_INSTRUCTION
+        
+        # Size the output budget to the list instead of always reserving the max
+        item_count = len(raw_ingredients) + sum(1 for s in staples if not s.get('in_stock', False))
+        max_tokens = min(MAX_OUTPUT_TOKENS, BASE_OUTPUT_TOKENS + OUTPUT_TOKENS_PER_ITEM * item_count)
+        
+        params = {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "temperature": 0.3,  # Lower temperature for more consistent results
+            "system": system,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        return params, response_cache_key(self.model, system[0]["text"], prompt)
+    
+    def _finish_optimization(self, content: str, stop_reason: str, params: Dict, cache_key: str,
+                             raw_ingredients: List[Dict], staples: List[Dict]) -> Dict:
+        """Parse, validate and cache the optimizer output"""
+        # Only a complete reply that parsed first time and kept every item is
+        # cached; anything repaired would otherwise be replayed for a week
+        clean = stop_reason != "max_tokens"
+        
+        # Extract JSON from response (tolerates code fences and surrounding text).
+        # In two-stage mode the reasoning call wrote plain text, so formatting is
+        # the only JSON step; otherwise malformed JSON is reformatted with a
+        # short formatting-only call rather than discarded.
+        result = None
+        if not TWO_STAGE_OPTIMIZATION:
+            try:
+                result = parse_json_response(content)
+            except json.JSONDecodeError:
+                clean = False
+                logger.warning("AI returned malformed JSON - reformatting")
+        if result is None:
+            try:
+                result = self._format_json(content, params["max_tokens"])
+            except (json.JSONDecodeError, ValidationError) as e:
+                logger.warning("Formatted shopping list invalid (%s) - using basic organization", e)
+                return self._fallback_organization(raw_ingredients, staples)
+        
+        # Validate all items are present
+        result, readded = self._validate_items(result, raw_ingredients, staples)
+        if clean and not readded:
+            store_cached_response(cache_key, result)
+        else:
+            logger.debug("AI Shopping List: not cached (stop_reason=%s, %d items re-added)",
+                         stop_reason, readded)
+        
+        logger.debug("AI Shopping List: %d items organized into %d categories",
+                     result.get('total_items', 0), len(result.get('categories', {})))
+        return result
+    
+    def _format_json(self, raw_text: str, max_tokens: int) -> Dict:
+        """Second-stage call: convert an organized list into the JSON schema only"""
+        schema = json.dumps(OptimizedShoppingList.model_json_schema())
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            temperature=0,
+            system=f"Convert the shopping list you are given into JSON matching this schema. "
+                   f"Keep every item and quantity exactly as given. Return ONLY the JSON.\n\n{schema}",
+            messages=[{"role": "user", "content": raw_text}]
+        )
+        result = parse_json_response(response.content[0].text)
+        return OptimizedShoppingList.model_validate(result).model_dump()
     
-    def _validate_items(self, result: Dict, raw_ingredients: List[Dict], staples: List[Dict]) -> Dict:
-        """Ensure all items are in the result"""
+    def _validate_items(self, result: Dict, raw_ingredients: List[Dict],
+                        staples: List[Dict]) -> Tuple[Dict, int]:
+        """Ensure all items are in the result; returns (result, number of items re-added)"""
         categories = result.get('categories', {})
         
         # Collect all AI items
@@ -582,22 +951,24 @@ class ShoppingListOptimizerNative:
             for item in items:
                 ai_items.add(item.get('item', '').lower().strip())
         
+        matcher = ItemMatcher(ai_items)
+        
         # Check for missing items
         missing = []
         for ing in raw_ingredients:
             name = ing.get('name', ing.get('ingredient_name', '')).lower().strip()
-            if not any(name in ai_item or ai_item in name for ai_item in ai_items):
+            if not matcher.matches(name):
                 missing.append(ing)
         
         for staple in staples:
             if not staple.get('in_stock', False):
                 name = staple.get('name', '').lower().strip()
-                if not any(name in ai_item or ai_item in name for ai_item in ai_items):
+                if not matcher.matches(name):
                     missing.append({'name': staple['name'], 'quantity': staple.get('quantity', ''), 'unit': staple.get('unit', '')})
         
         # Add missing items
         if missing:
-            print(f"⚠️  AI dropped {len(missing)} items - adding them back")
+            logger.warning("AI dropped %d items - adding them back", len(missing))
             if 'Other' not in categories:
                 categories['Other'] = []
             for item in missing:
@@ -612,7 +983,7 @@ class ShoppingListOptimizerNative:
         
         result['total_items'] = sum(len(items) for items in categories.values())
         result['categories'] = categories
-        return result
+        return result, len(missing)
     
     def _fallback_organization(self, ingredients: List[Dict], staples: List[Dict]) -> Dict:
         """Basic fallback if AI fails"""
@@ -3,27 +3,102 @@ Preferred Products Manager
 Manages user's preferred product choices for shopping list ingredients
 """
 
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 from datetime import datetime
+from functools import lru_cache
+from itertools import islice
 from google.cloud import firestore
-import re
+from firestore_manager import get_firestore_client
+import atexit
+import logging
+import string
+import threading
+import time
+
+try:
+    # google-re2: linear-time matching for the package-size pattern
+    import re2 as re
+except ImportError:
+    import re
+
+logger = logging.getLogger(__name__)
+
+# Words dropped when normalizing ingredient names
+_DESCRIPTORS = frozenset({'organic', 'fresh', 'frozen', 'dried'})
+# Words dropped when extracting an ingredient from a product name
+_EXTRACT_STOPWORDS = _DESCRIPTORS | {'sliced', 'diced', 'chopped', 'woolworths', 'macro', 'essentials'}
+# Stripped from each word before the stopword lookup, so "organic," and "woolworths'" still match
+_WORD_PUNCTUATION = string.punctuation + '‘’“”'
+# Maximum number of values Firestore accepts in a single 'in' filter
+FIRESTORE_IN_QUERY_LIMIT = 10
+# Maximum number of writes Firestore accepts in a single WriteBatch commit
+FIRESTORE_BATCH_LIMIT = 500
+# Fields read back by get_preferred_product and list_all_preferences
+_LOOKUP_FIELDS = ['ingredient_name', 'stockcode', 'product_name', 'price', 'image_url', 'use_count']
+_LIST_FIELDS = ['ingredient_name', 'original_name', 'stockcode', 'product_name', 'price', 'use_count', 'last_used']
+# list_all_preferences row template: missing fields are None, use_count 0
+_LIST_DEFAULTS = {**dict.fromkeys(_LIST_FIELDS), 'use_count': 0}
+# Cart item field -> (Woolworths API key, snake_case key), first non-empty wins
+_CART_KEYS = {
+    'stockcode': ('Stockcode', 'stockcode'),
+    'display_name': ('DisplayName', 'display_name'),
+    'price': ('Price', 'price'),
+}
+# Seconds a looked-up preference is served from memory
+PREFERENCE_CACHE_TTL = 60.0
+# Buffered use_count increments are written after this many seconds or uses,
+# so a killed process loses at most one interval's worth
+USAGE_FLUSH_INTERVAL = 30.0
+USAGE_FLUSH_THRESHOLD = 100
+# Package sizes (compiled once at import instead of on every call)
+_SIZE_RE = re.compile(r'\d+(?:g|kg|ml|l| pack)')
+# Descriptors as the earlier regex normalization removed them, leaving their spaces behind
+_LEGACY_DESCRIPTORS_RE = re.compile(r'\b(organic|fresh|frozen|dried)\b')
 
 class PreferredProductsManager:
     """Manages preferred product mappings for ingredients"""
     
     def __init__(self, db=None):
-        self.db = db or firestore.Client()
+        self.db = db or get_firestore_client()
         self.collection_name = 'preferred_products'
+        
+        # (user_id, normalized_name) -> (cached_at, doc ref, payload)
+        self._pref_cache = {}
+        # (user_id, normalized_name) -> [doc ref, uses not yet written]
+        self._pending_increments = {}
+        self._pending_uses = 0
+        self._flush_timer = None
+        self._cache_lock = threading.Lock()
+        atexit.register(self.flush_usage)
+    
+    @staticmethod
+    @lru_cache(maxsize=2048)
+    def _normalize_ingredient(ingredient: str) -> str:
+        """Normalize ingredient name for consistent matching (memoized - pure function)"""
+        # Lowercase, collapse whitespace and drop descriptor words in one pass
+        return ' '.join(
+            word for word in ingredient.lower().split()
+            if word.strip(_WORD_PUNCTUATION) not in _DESCRIPTORS
+        )
     
-    def _normalize_ingredient(self, ingredient: str) -> str:
-        """Normalize ingredient name for consistent matching"""
-        # Remove extra spaces, lowercase
-        normalized = ingredient.lower().strip()
-        # Remove common variations
-        normalized = re.sub(r'\s+', ' ', normalized)
-        # Remove quantity indicators
-        normalized = re.sub(r'\b(organic|fresh|frozen|dried)\b', '', normalized).strip()
-        return normalized
+    @staticmethod
+    @lru_cache(maxsize=2048)
+    def _legacy_normalize_ingredient(ingredient: str) -> str:
+        """
+        Normalize the way older documents were keyed (memoized - pure function)
+        
+        The regex version collapsed whitespace before dropping descriptors, so
+        'greek organic yogurt' was stored as 'greek  yogurt'. Lookups fall back
+        to this key; writes move the document to the current key.
+        """
+        normalized = ' '.join(ingredient.lower().split())
+        return _LEGACY_DESCRIPTORS_RE.sub('', normalized).strip()
+    
+    def _lookup_names(self, ingredient: str) -> List[str]:
+        """Current key for an ingredient, then its legacy key when that differs"""
+        normalized_name = self._normalize_ingredient(ingredient)
+        legacy_name = self._legacy_normalize_ingredient(ingredient)
+        return [normalized_name] if legacy_name == normalized_name else [normalized_name, legacy_name]
     
     def set_preferred_product(
         self, 
@@ -52,9 +127,10 @@ class PreferredProductsManager:
         """
         try:
             normalized_name = self._normalize_ingredient(ingredient_name)
+            self._invalidate(user_id, normalized_name)
             
             # Check if preference already exists
-            existing = self._get_preference_doc(normalized_name, user_id)
+            existing = self._get_preference_doc(ingredient_name, user_id)
             
             data = {
                 'user_id': user_id,
@@ -70,19 +146,19 @@ class PreferredProductsManager:
             
             if existing:
                 # Update existing preference
-                existing['ref'].update(data)
-                print(f"✅ Updated preference for '{ingredient_name}' → {stockcode}")
+                existing.update(data)
+                logger.info("✅ Updated preference for '%s' → %s", ingredient_name, stockcode)
             else:
                 # Create new preference
                 data['added_date'] = firestore.SERVER_TIMESTAMP
                 data['use_count'] = 0
                 self.db.collection(self.collection_name).add(data)
-                print(f"✅ Added preference for '{ingredient_name}' → {stockcode}")
+                logger.info("✅ Added preference for '%s' → %s", ingredient_name, stockcode)
             
             return True
             
         except Exception as e:
-            print(f"❌ Error setting preferred product: {e}")
+            logger.error("❌ Error setting preferred product: %s", e)
             return False
     
     def get_preferred_product(
@@ -102,17 +178,40 @@ class PreferredProductsManager:
         """
         try:
             normalized_name = self._normalize_ingredient(ingredient_name)
-            doc = self._get_preference_doc(normalized_name, user_id)
+            key = (user_id, normalized_name)
+            
+            # Served from memory: buffer the usage instead of writing it now
+            hit = None
+            with self._cache_lock:
+                cached = self._pref_cache.get(key)
+                if cached and time.monotonic() - cached[0] < PREFERENCE_CACHE_TTL:
+                    _, ref, payload = cached
+                    pending = self._pending_increments.setdefault(key, [ref, 0])
+                    pending[1] += 1
+                    self._pending_uses += 1
+                    flush_now = self._pending_uses >= USAGE_FLUSH_THRESHOLD
+                    if not flush_now and self._flush_timer is None:
+                        self._flush_timer = threading.Timer(USAGE_FLUSH_INTERVAL, self.flush_usage)
+                        self._flush_timer.daemon = True
+                        self._flush_timer.start()
+                    hit = dict(payload)
+            
+            if hit is not None:
+                if flush_now:
+                    self.flush_usage()
+                return hit
+            
+            doc = self._get_preference_doc(ingredient_name, user_id, fetch_data=True)
             
             if doc:
                 # Update use count and last used
-                doc['ref'].update({
+                doc.reference.update({
                     'use_count': firestore.Increment(1),
                     'last_used': firestore.SERVER_TIMESTAMP
                 })
                 
-                data = doc['data']
-                return {
+                data = doc.to_dict()
+                payload = {
                     'ingredient_name': data.get('ingredient_name'),
                     'stockcode': data.get('stockcode'),
                     'product_name': data.get('product_name'),
@@ -120,25 +219,99 @@ class PreferredProductsManager:
                     'image_url': data.get('image_url'),
                     'use_count': data.get('use_count', 0)
                 }
+                with self._cache_lock:
+                    self._pref_cache[key] = (time.monotonic(), doc.reference, payload)
+                return dict(payload)
             
             return None
             
         except Exception as e:
-            print(f"❌ Error getting preferred product: {e}")
+            logger.error("❌ Error getting preferred product: %s", e)
             return None
     
-    def _get_preference_doc(self, normalized_name: str, user_id: str) -> Optional[Dict]:
-        """Helper to get preference document"""
-        docs = self.db.collection(self.collection_name)\
-            .where('user_id', '==', user_id)\
-            .where('ingredient_name', '==', normalized_name)\
-            .limit(1)\
+    def _get_preference_doc(self, ingredient_name: str, user_id: str, fetch_data: bool = False):
+        """
+        Helper to get preference document
+        
+        Returns the DocumentSnapshot when fetch_data is True (fields are only
+        deserialized if the caller calls to_dict()), otherwise just the
+        DocumentReference for callers that overwrite or delete it. None if
+        there is no preference. A document under the current key wins over
+        one still stored under the legacy key.
+        """
+        names = self._lookup_names(ingredient_name)
+        query = self.db.collection(self.collection_name).where('user_id', '==', user_id)
+        if len(names) == 1:
+            query = query.where('ingredient_name', '==', names[0])
+        else:
+            query = query.where('ingredient_name', 'in', names)
+        docs = query\
+            .select(_LOOKUP_FIELDS if fetch_data else ['ingredient_name'])\
+            .limit(len(names))\
             .stream()
         
+        found = None
         for doc in docs:
-            return {'ref': doc.reference, 'data': doc.to_dict()}
+            if found is None or doc.get('ingredient_name') == names[0]:
+                found = doc
         
-        return None
+        if found is None:
+            return None
+        return found if fetch_data else found.reference
+    
+    def flush_usage(self) -> int:
+        """
+        Write buffered use_count increments from cached lookups in one batch
+        
+        Runs on a timer, after USAGE_FLUSH_THRESHOLD buffered uses, before a
+        cached preference changes and at exit. A batch commit is all or
+        nothing, so if it fails (e.g. one preference was deleted meanwhile)
+        each increment is retried on its own and only the failing ones are
+        dropped.
+        
+        Returns:
+            Number of preferences updated
+        """
+        with self._cache_lock:
+            pending = self._pending_increments
+            self._pending_increments = {}
+            self._pending_uses = 0
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        
+        if not pending:
+            return 0
+        
+        updates = [
+            (ref, {'use_count': firestore.Increment(delta), 'last_used': firestore.SERVER_TIMESTAMP})
+            for ref, delta in pending.values()
+        ]
+        try:
+            batch = self.db.batch()
+            for ref, data in updates:
+                batch.update(ref, data)
+            batch.commit()
+            return len(updates)
+            
+        except Exception as e:
+            logger.warning("⚠️ Batched usage flush failed, retrying per preference: %s", e)
+        
+        updated = 0
+        for ref, data in updates:
+            try:
+                ref.update(data)
+                updated += 1
+            except Exception as e:
+                logger.error("❌ Error flushing preference usage: %s", e)
+        return updated
+    
+    def _invalidate(self, user_id: str, *normalized_names: str):
+        """Drop cached lookups for ingredients about to change, saving their usage first"""
+        with self._cache_lock:
+            for normalized_name in normalized_names:
+                self._pref_cache.pop((user_id, normalized_name), None)
+        self.flush_usage()
     
     def remove_preferred_product(
         self, 
@@ -148,45 +321,46 @@ class PreferredProductsManager:
         """Remove preferred product for an ingredient"""
         try:
             normalized_name = self._normalize_ingredient(ingredient_name)
-            doc = self._get_preference_doc(normalized_name, user_id)
+            self._invalidate(user_id, normalized_name)
+            doc = self._get_preference_doc(ingredient_name, user_id)
             
             if doc:
-                doc['ref'].delete()
-                print(f"✅ Removed preference for '{ingredient_name}'")
+                doc.delete()
+                logger.info("✅ Removed preference for '%s'", ingredient_name)
                 return True
             else:
-                print(f"⚠️ No preference found for '{ingredient_name}'")
+                logger.warning("⚠️ No preference found for '%s'", ingredient_name)
                 return False
                 
         except Exception as e:
-            print(f"❌ Error removing preferred product: {e}")
+            logger.error("❌ Error removing preferred product: %s", e)
             return False
     
+    def iter_all_preferences(self, user_id: str = "default") -> Iterator[Dict]:
+        """
+        Yield preferred products for a user one at a time, in ingredient order
+        
+        Documents are converted as they arrive from the stream, so callers
+        that stop early or only count never hold the full list. Firestore
+        errors propagate to the caller.
+        """
+        docs = self.db.collection(self.collection_name)\
+            .where('user_id', '==', user_id)\
+            .order_by('ingredient_name')\
+            .select(_LIST_FIELDS)\
+            .stream()
+        
+        # The select() projection means to_dict() holds only _LIST_FIELDS
+        for doc in docs:
+            yield {**_LIST_DEFAULTS, **doc.to_dict()}
+    
     def list_all_preferences(self, user_id: str = "default") -> List[Dict]:
         """Get all preferred products for a user"""
         try:
-            docs = self.db.collection(self.collection_name)\
-                .where('user_id', '==', user_id)\
-                .order_by('ingredient_name')\
-                .stream()
-            
-            preferences = []
-            for doc in docs:
-                data = doc.to_dict()
-                preferences.append({
-                    'ingredient_name': data.get('ingredient_name'),
-                    'original_name': data.get('original_name'),
-                    'stockcode': data.get('stockcode'),
-                    'product_name': data.get('product_name'),
-                    'price': data.get('price'),
-                    'use_count': data.get('use_count', 0),
-                    'last_used': data.get('last_used')
-                })
-            
-            return preferences
+            return list(self.iter_all_preferences(user_id))
             
         except Exception as e:
-            print(f"❌ Error listing preferences: {e}")
+            logger.error("❌ Error listing preferences: %s", e)
             return []
     
     def import_from_cart(self, cart_items: List[Dict], user_id: str = "default") -> int:
@@ -200,51 +374,139 @@ class PreferredProductsManager:
         Returns:
             Number of preferences imported
         """
-        count = 0
+        # Normalize both cart schemas once so the rest reads a single one
+        items = [
+            {field: item.get(api_key) or item.get(key) for field, (api_key, key) in _CART_KEYS.items()}
+            for item in cart_items
+        ]
         
-        for item in cart_items:
-            stockcode = item.get('Stockcode') or item.get('stockcode')
-            display_name = item.get('DisplayName') or item.get('display_name')
-            price = item.get('Price') or item.get('price', 0)
-            
-            if not stockcode or not display_name:
+        preferences = []
+        
+        for item in items:
+            if not item['stockcode'] or not item['display_name']:
                 continue
             
             # Try to extract ingredient name from product name
             # This is a heuristic - you can improve based on patterns
-            ingredient = self._extract_ingredient_from_product(display_name)
+            ingredient = self._extract_ingredient_from_product(item['display_name'])
             
             if ingredient:
-                success = self.set_preferred_product(
-                    ingredient_name=ingredient,
-                    stockcode=stockcode,
-                    product_name=display_name,
-                    price=price,
-                    user_id=user_id
-                )
-                
-                if success:
-                    count += 1
+                preferences.append({
+                    'ingredient_name': ingredient,
+                    'stockcode': item['stockcode'],
+                    'product_name': item['display_name'],
+                    'price': item['price'] or 0
+                })
         
-        print(f"✅ Imported {count} preferred products from cart")
+        count = self.set_preferred_product_many(preferences, user_id=user_id)
+        logger.info("✅ Imported %d preferred products from cart", count)
         return count
     
-    def _extract_ingredient_from_product(self, product_name: str) -> Optional[str]:
+    def set_preferred_product_many(self, preferences: List[Dict], user_id: str = "default") -> int:
         """
-        Extract ingredient name from full product name
-        This is a heuristic - improve as needed
+        Set or update several preferred products with batched reads and writes
+        
+        Existing preferences are fetched with 'in' queries (10 names per query)
+        and creates/updates are committed in WriteBatches of up to 500 writes,
+        instead of one query and one write per ingredient. If a commit fails,
+        the batches already committed stay written.
+        
+        Args:
+            preferences: Dicts with the set_preferred_product arguments
+                (ingredient_name, stockcode, and optionally product_name,
+                price, image_url, fallback_stockcodes)
+            user_id: User identifier
+            
+        Returns:
+            Number of preferences written, one per distinct ingredient
+            (repeated ingredients count once, the last entry winning)
         """
-        # Remove brand names and package sizes
-        name = product_name.lower()
+        if not preferences:
+            return 0
         
-        # Common patterns to remove
-        name = re.sub(r'\d+g|\d+kg|\d+ml|\d+l|\d+ pack', '', name)
-        name = re.sub(r'woolworths|macro|essentials', '', name)
-        name = re.sub(r'\b(organic|fresh|frozen|dried|sliced|diced|chopped)\b', '', name)
-        name = re.sub(r'\s+', ' ', name).strip()
+        written = 0
+        try:
+            # Later entries for the same ingredient win, as with sequential calls
+            by_name = {}
+            for pref in preferences:
+                by_name[self._normalize_ingredient(pref['ingredient_name'])] = pref
+            
+            self._invalidate(user_id, *by_name)
+            # Stored key -> current key, so documents still under a legacy key are updated in place
+            lookup = {name: name for name in by_name}
+            for normalized_name, pref in by_name.items():
+                for name in self._lookup_names(pref['ingredient_name'])[1:]:
+                    lookup.setdefault(name, normalized_name)
+            
+            names = list(lookup)
+            existing = {}
+            legacy = {}
+            for i in range(0, len(names), FIRESTORE_IN_QUERY_LIMIT):
+                docs = self.db.collection(self.collection_name)\
+                    .where('user_id', '==', user_id)\
+                    .where('ingredient_name', 'in', names[i:i + FIRESTORE_IN_QUERY_LIMIT])\
+                    .select(['ingredient_name'])\
+                    .stream()
+                for doc in docs:
+                    stored_name = doc.get('ingredient_name')
+                    target = existing if stored_name in by_name else legacy
+                    target.setdefault(lookup[stored_name], doc.reference)
+            for normalized_name, ref in legacy.items():
+                existing.setdefault(normalized_name, ref)
+            
+            writes = []
+            for normalized_name, pref in by_name.items():
+                data = {
+                    'user_id': user_id,
+                    'ingredient_name': normalized_name,
+                    'original_name': pref['ingredient_name'],
+                    'stockcode': pref['stockcode'],
+                    'product_name': pref.get('product_name', ''),
+                    'price': pref.get('price', 0.0),
+                    'image_url': pref.get('image_url', ''),
+                    'fallback_stockcodes': pref.get('fallback_stockcodes') or [],
+                    'last_updated': firestore.SERVER_TIMESTAMP
+                }
+                
+                ref = existing.get(normalized_name)
+                if ref:
+                    writes.append(('update', ref, data))
+                else:
+                    data['added_date'] = firestore.SERVER_TIMESTAMP
+                    data['use_count'] = 0
+                    writes.append(('set', self.db.collection(self.collection_name).document(), data))
+            
+            for i in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+                batch = self.db.batch()
+                for action, ref, data in writes[i:i + FIRESTORE_BATCH_LIMIT]:
+                    if action == 'update':
+                        batch.update(ref, data)
+                    else:
+                        batch.set(ref, data)
+                batch.commit()
+                written = min(i + FIRESTORE_BATCH_LIMIT, len(writes))
+            
+            return written
+            
+        except Exception as e:
+            logger.error("❌ Error setting preferred products (%d written): %s", written, e)
+            return written
+    
+    @staticmethod
+    @lru_cache(maxsize=2048)
+    def _extract_ingredient_from_product(product_name: str) -> Optional[str]:
+        """
+        Extract ingredient name from full product name (memoized - pure function)
+        This is a heuristic - improve as needed
+        """
+        # Remove package sizes - the only regex scan over the name
+        name = _SIZE_RE.sub('', product_name.lower())
         
-        # Take first 2-3 meaningful words
-        words = [w for w in name.split() if len(w) > 2]
+        # Drop brand names and descriptors, stopping at the first 2 meaningful words
+        words = list(islice(
+            (w for w in name.split()
+             if len(w) > 2 and w.strip(_WORD_PUNCTUATION) not in _EXTRACT_STOPWORDS), 2
+        ))
         if words:
             return ' '.join(words[:2])
         
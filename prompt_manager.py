@@ -4,9 +4,38 @@ Loads AI prompts from JSON file or Firestore for easy updates without redeployme
 """
 
 import json
+import logging
 import os
-from typing import Dict, Optional
-from datetime import datetime, timedelta
+import string
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=128)
+def _parse_template(template: str) -> Optional[Tuple]:
+    """
+    Parse a str.format template once into (literal, field_name) pairs
+    
+    Returns None if the template uses positional fields, attribute/index
+    access, conversions or format specs - those go through str.format.
+    """
+    parts = []
+    for literal, field_name, format_spec, conversion in string.Formatter().parse(template):
+        if field_name is not None and (
+            format_spec or conversion or not field_name.isidentifier()
+        ):
+            return None
+        parts.append((literal, field_name))
+    return tuple(parts)
+
+# Seconds a first get_prompts call waits for the startup Firestore preload
+PRELOAD_WAIT_TIMEOUT = 5.0
+
 
 class PromptManager:
     """Manages AI prompts with support for file and Firestore storage"""
@@ -14,29 +43,53 @@ class PromptManager:
     def __init__(self, prompts_file: str = "prompts.json"):
         self.prompts_file = prompts_file
         self._prompts_cache = None
+        self._flat_prompts = {}  # Dotted key -> value, multi-line lists pre-joined
         self._cache_timestamp = None
-        self._cache_ttl = timedelta(minutes=5)  # Reload every 5 minutes
+        self._file_prompts = None  # Last parse of prompts_file
+        self._file_mtime = None  # st_mtime_ns of prompts_file at that parse
+        self._cache_ttl = 300.0  # Reload every 5 minutes (seconds, monotonic clock)
         self.use_firestore = os.getenv('USE_FIRESTORE_PROMPTS', 'false').lower() == 'true'
         self.db = None
+        self._load_lock = threading.Lock()  # One reload in flight at a time
+        self._ready_event = threading.Event()  # Set once the startup preload finishes
         
         if self.use_firestore:
             try:
-                from google.cloud import firestore
-                self.db = firestore.Client()
-                print("✅ Firestore prompt storage enabled")
+                from firestore_manager import get_firestore_client
+                self.db = get_firestore_client()
+                logger.info("✅ Firestore prompt storage enabled")
             except Exception as e:
-                print(f"⚠️ Firestore prompts disabled: {e}")
+                logger.warning("⚠️ Firestore prompts disabled: %s", e)
                 self.use_firestore = False
+        
+        if self.use_firestore:
+            # Fetch from Firestore off the request path
+            threading.Thread(target=self._preload, daemon=True).start()
+        else:
+            self._ready_event.set()
+    
+    def _preload(self):
+        """Background startup load of prompts"""
+        try:
+            self.get_prompts(force_reload=True)
+        finally:
+            self._ready_event.set()
     
     def _load_from_file(self) -> Dict:
-        """Load prompts from JSON file"""
+        """Load prompts from JSON file (skips the parse if the file is unchanged)"""
         try:
-            with open(self.prompts_file, 'r') as f:
-                prompts = json.load(f)
-            print(f"✅ Loaded prompts from {self.prompts_file}")
+            mtime = os.stat(self.prompts_file).st_mtime_ns
+            if self._file_prompts is not None and mtime == self._file_mtime:
+                return self._file_prompts
+            
+            with open(self.prompts_file, 'rb') as f:
+                prompts = json.loads(f.read())
+            self._file_prompts = prompts
+            self._file_mtime = mtime
+            logger.debug("✅ Loaded prompts from %s", self.prompts_file)
             return prompts
         except Exception as e:
-            print(f"❌ Error loading prompts from file: {e}")
+            logger.error("❌ Error loading prompts from file: %s", e)
             return self._get_default_prompts()
     
     def _load_from_firestore(self) -> Optional[Dict]:
@@ -50,13 +103,13 @@ class PromptManager:
             
             if doc.exists:
                 prompts = doc.to_dict()
-                print("✅ Loaded prompts from Firestore")
+                logger.debug("✅ Loaded prompts from Firestore")
                 return prompts
             else:
-                print("⚠️ No prompts found in Firestore, using file")
+                logger.warning("⚠️ No prompts found in Firestore, using file")
                 return None
         except Exception as e:
-            print(f"⚠️ Error loading from Firestore: {e}")
+            logger.warning("⚠️ Error loading from Firestore: %s", e)
             return None
     
     def get_prompts(self, force_reload: bool = False) -> Dict:
@@ -69,24 +122,59 @@ class PromptManager:
         Returns:
             Dictionary of prompts
         """
-        # Check if cache is still valid
-        if not force_reload and self._prompts_cache and self._cache_timestamp:
-            if datetime.now() - self._cache_timestamp < self._cache_ttl:
+        if not force_reload:
+            if self._prompts_cache is None:
+                # Share the startup preload instead of issuing a duplicate read
+                self._ready_event.wait(timeout=PRELOAD_WAIT_TIMEOUT)
+            if self._cache_is_fresh():
                 return self._prompts_cache
         
-        # Try Firestore first if enabled
-        if self.use_firestore:
-            prompts = self._load_from_firestore()
-            if prompts:
-                self._prompts_cache = prompts
-                self._cache_timestamp = datetime.now()
-                return prompts
-        
-        # Fall back to file
-        prompts = self._load_from_file()
+        with self._load_lock:
+            # Another caller may have reloaded while we waited for the lock
+            if not force_reload and self._cache_is_fresh():
+                return self._prompts_cache
+            
+            # Try Firestore first if enabled
+            if self.use_firestore:
+                prompts = self._load_from_firestore()
+                if prompts:
+                    self._set_cache(prompts)
+                    return prompts
+            
+            # Fall back to file
+            prompts = self._load_from_file()
+            self._set_cache(prompts)
+            return prompts
+    
+    def _cache_is_fresh(self) -> bool:
+        """Check if the cached prompts are within the TTL"""
+        return (
+            self._prompts_cache is not None
+            and self._cache_timestamp is not None
+            and time.monotonic() - self._cache_timestamp < self._cache_ttl
+        )
+    
+    def _set_cache(self, prompts: Dict):
+        """Cache loaded prompts along with their flattened lookup table"""
+        self._flat_prompts = self._flatten(prompts)
         self._prompts_cache = prompts
-        self._cache_timestamp = datetime.now()
-        return prompts
+        self._cache_timestamp = time.monotonic()
+    
+    @staticmethod
+    def _flatten(prompts: Dict, prefix: str = "") -> Dict:
+        """Map every dotted key path to its value, joining list values once"""
+        flat = {}
+        for key, value in prompts.items():
+            path = prefix + key
+            if isinstance(value, dict):
+                flat[path] = value
+                flat.update(PromptManager._flatten(value, path + '.'))
+            elif isinstance(value, list):
+                # Multi-line prompts are stored as arrays of lines
+                flat[path] = ''.join(value)
+            else:
+                flat[path] = value
+        return flat
     
     def get_prompt(self, prompt_key: str, **kwargs) -> str:
         """
@@ -99,28 +187,32 @@ class PromptManager:
         Returns:
             Formatted prompt string
         """
-        prompts = self.get_prompts()
+        # Warm cache: skip the get_prompts() call entirely
+        timestamp = self._cache_timestamp
+        if timestamp is None or time.monotonic() - timestamp >= self._cache_ttl:
+            self.get_prompts()
         
-        # Navigate nested keys
-        keys = prompt_key.split('.')
-        value = prompts
-        for key in keys:
-            if isinstance(value, dict) and key in value:
-                value = value[key]
-            else:
-                print(f"⚠️ Prompt key not found: {prompt_key}")
-                return ""
+        value = self._flat_prompts.get(prompt_key)
+        if value is None:
+            logger.warning("⚠️ Prompt key not found: %s", prompt_key)
+            return ""
         
-        # If it's an array, join it into a string (for multi-line prompts)
-        if isinstance(value, list):
-            value = ''.join(value)
+        # No variables (e.g. system prompts): return the cached string as-is
+        if not kwargs:
+            return value
         
         # If it's a template, format it
-        if isinstance(value, str) and kwargs:
+        if isinstance(value, str):
             try:
-                return value.format(**kwargs)
+                parts = _parse_template(value)
+                if parts is None:
+                    return value.format(**kwargs)
+                return ''.join([
+                    literal if field_name is None else literal + format(kwargs[field_name])
+                    for literal, field_name in parts
+                ])
             except KeyError as e:
-                print(f"⚠️ Missing template variable: {e}")
+                logger.warning("⚠️ Missing template variable: %s", e)
                 return value
         
         return value
@@ -136,22 +228,23 @@ class PromptManager:
             True if successful
         """
         if not self.use_firestore or not self.db:
-            print("⚠️ Firestore not enabled")
+            logger.warning("⚠️ Firestore not enabled")
             return False
         
         try:
             doc_ref = self.db.collection('config').document('prompts')
             prompts['_metadata']['last_updated'] = datetime.now().isoformat()
             doc_ref.set(prompts)
-            print("✅ Prompts saved to Firestore")
+            logger.info("✅ Prompts saved to Firestore")
             
             # Clear cache to force reload
             self._prompts_cache = None
+            self._flat_prompts = {}
             self._cache_timestamp = None
             
             return True
         except Exception as e:
-            print(f"❌ Error saving to Firestore: {e}")
+            logger.error("❌ Error saving to Firestore: %s", e)
             return False
     
     def _get_default_prompts(self) -> Dict:
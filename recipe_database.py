@@ -5,26 +5,179 @@ Handles recipe storage, family preferences, and grocery list generation
 
 import sqlite3
 import json
+import queue
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+# Applied to every new connection
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",  # 64 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA foreign_keys=ON",
+)
+
+# Columns for recipe lists; the long method/tips text and nutrition
+# are only loaded for a single recipe (get_recipe / get_recipe_details)
+RECIPE_LIST_COLUMNS = (
+    "id, name, source_url, description, servings, prep_time, cook_time, total_time, "
+    "difficulty, cuisine, meal_type, image_url, is_favorite, rating, times_cooked, "
+    "created_at, last_cooked"
+)
+RECIPE_DETAIL_COLUMNS = "id, source_type, method, tips, calories, protein, carbs, fats, fiber"
+
+# Prepared-statement cache size per connection (sqlite3 default is 128).
+# Ids-list queries produce one statement per list length, so leave headroom.
+SQLITE_CACHED_STATEMENTS = 256
+
+# Statements run on every add_recipe
+INSERT_RECIPE_SQL = """
+    INSERT INTO recipes (
+        name, source_url, source_type, description, servings,
+        prep_time, cook_time, total_time, difficulty, cuisine,
+        meal_type, calories, protein, carbs, fats, fiber,
+        method, tips, image_url
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    RETURNING id
+"""
+INSERT_INGREDIENT_SQL = """
+    INSERT INTO recipe_ingredients (recipe_id, ingredient_name, quantity, unit, notes, is_optional)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+INSERT_TAG_SQL = "INSERT INTO recipe_tags (recipe_id, tag) VALUES (?, ?)"
+INSERT_FAMILY_PREFERENCE_SQL = "INSERT OR IGNORE INTO family_preferences (family_member_id, preference) VALUES (?, ?)"
+INSERT_FAMILY_DIETARY_SQL = "INSERT OR IGNORE INTO family_dietary (family_member_id, restriction) VALUES (?, ?)"
+# Data version shared by every process using the file; bumped inside each write transaction
+BUMP_FAMILY_VERSION_SQL = "UPDATE cache_versions SET version = version + 1 WHERE name = 'family'"
+FAMILY_VERSION_SQL = "SELECT version FROM cache_versions WHERE name = 'family'"
+SET_RECIPE_PREFERENCE_SQL = """
+    INSERT OR REPLACE INTO family_recipe_preferences
+    (family_member_id, recipe_id, preference_level, notes)
+    VALUES (?, ?, ?, ?)
+"""
+
+# Recipe with its ingredients and tags in one pass (joined columns follow r.*)
+RECIPE_JOIN_COLUMNS = (
+    "ri.id", "ri.ingredient_name", "ri.quantity", "ri.unit", "ri.notes", "ri.is_optional",
+    "rt.id", "rt.tag",
+)
+GET_RECIPE_SQL = f"""
+    SELECT r.*, {', '.join(RECIPE_JOIN_COLUMNS)}
+    FROM recipes r
+    LEFT JOIN recipe_ingredients ri ON ri.recipe_id = r.id
+    LEFT JOIN recipe_tags rt ON rt.recipe_id = r.id
+    WHERE r.id = ?
+    ORDER BY ri.id, rt.id
+"""
+
+# Read-only connections per database (readers run in parallel under WAL)
+SQLITE_READ_POOL_SIZE = 4
+
+# Ids per IN (...) query, below SQLite's bound-parameter limit
+SQLITE_IN_BATCH = 500
+
+# Rows pulled per fetchmany() when streaming large result sets
+SQLITE_FETCH_ARRAYSIZE = 100
+
+
+def _quantity_value(quantity) -> Optional[float]:
+    """SQL function qty_value(): numeric quantity, 0 if empty, NULL if not a number"""
+    if not quantity:
+        return 0.0
+    try:
+        return float(quantity)
+    except (ValueError, TypeError):
+        return None
+
 
 class RecipeDatabase:
     def __init__(self, db_path: str = "recipes.db"):
         self.db_path = db_path
-        self.conn = None
+        self.conn = None  # The single write connection
+        self._write_lock = threading.RLock()
+        self._read_pool = queue.Queue()
+        self._read_pool_size = 0
+        # Family members cached per instance, valid while the stored family version matches
+        self._family_cache = {}  # member name (or None for all members) -> loaded data
+        self._family_cache_ver = None
+        self._family_cache_lock = threading.Lock()
         self.init_database()
+        
+        # An in-memory database is private to its connection, so readers share the writer
+        if db_path != ':memory:':
+            for _ in range(SQLITE_READ_POOL_SIZE):
+                self._read_pool.put(self._connect())
+            self._read_pool_size = SQLITE_READ_POOL_SIZE
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with the row factory, pragmas and SQL functions applied"""
+        # Autocommit mode: multi-statement writes open their own transaction()
+        conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, cached_statements=SQLITE_CACHED_STATEMENTS,
+            isolation_level=None
+        )
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers run alongside the writer; NORMAL sync is safe under WAL
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        conn.create_function('qty_value', 1, _quantity_value, deterministic=True)
+        return conn
     
     def get_connection(self):
-        """Get database connection"""
+        """Get the write connection"""
         if self.conn is None:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row
+            self.conn = self._connect()
         return self.conn
     
+    @contextmanager
+    def acquire(self, write: bool = False):
+        """
+        Borrow a connection for one operation
+        
+        Writes are serialized on the single write connection; reads take a
+        pooled connection (blocking while all are in use) so they don't
+        queue behind each other or behind a commit.
+        """
+        if write or not self._read_pool_size:
+            with self._write_lock:
+                yield self.get_connection()
+            return
+        
+        conn = self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put(conn)
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Run a group of writes as one BEGIN IMMEDIATE ... COMMIT unit
+        
+        Connections are in autocommit mode, so single statements commit on
+        their own and anything spanning several statements goes through
+        here. IMMEDIATE takes the write lock up front instead of upgrading
+        mid-transaction.
+        """
+        with self.acquire(write=True) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+    
     def init_database(self):
         """Initialize database with tables"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
         
         # Family members table
         cursor.execute("""
@@ -38,6 +191,26 @@ class RecipeDatabase:
             )
         """)
         
+        # Family member list values, one row each (rowid keeps list order).
+        # Replaces the JSON preferences/dietary_restrictions columns above,
+        # which are only read once to migrate older databases.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS family_preferences (
+                family_member_id INTEGER NOT NULL,
+                preference TEXT NOT NULL,
+                PRIMARY KEY (family_member_id, preference),
+                FOREIGN KEY (family_member_id) REFERENCES family_members(id) ON DELETE CASCADE
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS family_dietary (
+                family_member_id INTEGER NOT NULL,
+                restriction TEXT NOT NULL,
+                PRIMARY KEY (family_member_id, restriction),
+                FOREIGN KEY (family_member_id) REFERENCES family_members(id) ON DELETE CASCADE
+            )
+        """)
+        
         # Recipes table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS recipes (
@@ -164,151 +337,279 @@ class RecipeDatabase:
             )
         """)
         
-        conn.commit()
+        # Versions of cached data, so every worker sees writes made by the others
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cache_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('family', 0)")
+        
+        # Indexes on foreign keys used for lookups and joins
+        # (family_recipe_preferences.family_member_id is already covered by its UNIQUE constraint)
+        # Covers the shopping-list aggregation, which seeks by recipe_id and
+        # reads only these columns (replaces the plain recipe_id index)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_ri_recipe_cover
+            ON recipe_ingredients(recipe_id, ingredient_name, unit, quantity, is_optional)
+        """)
+        cursor.execute("DROP INDEX IF EXISTS idx_ri_recipe")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_rt_recipe ON recipe_tags(recipe_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_frp_recipe ON family_recipe_preferences(recipe_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mpr_plan ON meal_plan_recipes(meal_plan_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mpr_recipe ON meal_plan_recipes(recipe_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sli_list ON shopping_list_items(shopping_list_id)")
+        
+        cursor.execute("COMMIT")
+        self._migrate_family_lists()
         self._insert_default_family_members()
     
+    def _migrate_family_lists(self):
+        """Copy the legacy JSON list columns into the family join tables (once)"""
+        conn = self.get_connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+            return
+        
+        preferences, restrictions = [], []
+        for member_id, prefs, diet in conn.execute(
+            "SELECT id, preferences, dietary_restrictions FROM family_members ORDER BY id"
+        ):
+            preferences.extend((member_id, value) for value in json.loads(prefs or '[]'))
+            restrictions.extend((member_id, value) for value in json.loads(diet or '[]'))
+        
+        with self.transaction() as conn:
+            conn.executemany(INSERT_FAMILY_PREFERENCE_SQL, preferences)
+            conn.executemany(INSERT_FAMILY_DIETARY_SQL, restrictions)
+            conn.execute(BUMP_FAMILY_VERSION_SQL)
+            conn.execute("PRAGMA user_version = 1")
+    
     def _insert_default_family_members(self):
         """Insert default family members if they don't exist"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         family_members = [
             {
                 "name": "ehren",
                 "display_name": "Ehren",
-                "preferences": json.dumps(["hotdogs", "pizza", "ramen noodles", "chicken nuggets", "mac and cheese"]),
-                "dietary_restrictions": json.dumps([])
+                "preferences": ["hotdogs", "pizza", "ramen noodles", "chicken nuggets", "mac and cheese"],
+                "dietary_restrictions": []
             },
             {
                 "name": "maya",
                 "display_name": "Maya",
-                "preferences": json.dumps(["pasta", "rice", "Italian dishes", "pizza", "lasagna"]),
-                "dietary_restrictions": json.dumps([])
+                "preferences": ["pasta", "rice", "Italian dishes", "pizza", "lasagna"],
+                "dietary_restrictions": []
             },
             {
                 "name": "daddy",
                 "display_name": "Daddy",
-                "preferences": json.dumps(["steak", "chicken", "protein-rich dishes", "BBQ", "burgers"]),
-                "dietary_restrictions": json.dumps([])
+                "preferences": ["steak", "chicken", "protein-rich dishes", "BBQ", "burgers"],
+                "dietary_restrictions": []
             },
             {
                 "name": "mommy",
                 "display_name": "Mommy",
-                "preferences": json.dumps(["salads", "soups", "healthy options", "fish", "vegetables"]),
-                "dietary_restrictions": json.dumps([])
+                "preferences": ["salads", "soups", "healthy options", "fish", "vegetables"],
+                "dietary_restrictions": []
             }
         ]
         
-        for member in family_members:
-            cursor.execute("""
-                INSERT OR IGNORE INTO family_members (name, display_name, preferences, dietary_restrictions)
-                VALUES (?, ?, ?, ?)
-            """, (member["name"], member["display_name"], member["preferences"], member["dietary_restrictions"]))
-        
-        conn.commit()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            inserted = False
+            for member in family_members:
+                cursor.execute("""
+                    INSERT OR IGNORE INTO family_members (name, display_name)
+                    VALUES (?, ?)
+                    RETURNING id
+                """, (member["name"], member["display_name"]))
+                row = cursor.fetchone()
+                if row is None:
+                    continue  # Already present; keep its current lists
+                
+                cursor.executemany(INSERT_FAMILY_PREFERENCE_SQL, [(row[0], value) for value in member["preferences"]])
+                cursor.executemany(INSERT_FAMILY_DIETARY_SQL, [(row[0], value) for value in member["dietary_restrictions"]])
+                inserted = True
+            
+            if inserted:
+                cursor.execute(BUMP_FAMILY_VERSION_SQL)
     
     def add_recipe(self, recipe_data: Dict) -> int:
         """Add a new recipe to the database"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO recipes (
-                name, source_url, source_type, description, servings,
-                prep_time, cook_time, total_time, difficulty, cuisine,
-                meal_type, calories, protein, carbs, fats, fiber,
-                method, tips, image_url
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            recipe_data.get('name'),
-            recipe_data.get('source_url'),
-            recipe_data.get('source_type'),
-            recipe_data.get('description'),
-            recipe_data.get('servings', 4),
-            recipe_data.get('prep_time'),
-            recipe_data.get('cook_time'),
-            recipe_data.get('total_time'),
-            recipe_data.get('difficulty'),
-            recipe_data.get('cuisine'),
-            recipe_data.get('meal_type'),
-            recipe_data.get('calories'),
-            recipe_data.get('protein'),
-            recipe_data.get('carbs'),
-            recipe_data.get('fats'),
-            recipe_data.get('fiber'),
-            recipe_data.get('method'),
-            recipe_data.get('tips'),
-            recipe_data.get('image_url')
-        ))
-        
-        recipe_id = cursor.lastrowid
-        
-        # Add ingredients
-        if 'ingredients' in recipe_data:
-            for ingredient in recipe_data['ingredients']:
-                cursor.execute("""
-                    INSERT INTO recipe_ingredients (recipe_id, ingredient_name, quantity, unit, notes, is_optional)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    recipe_id,
-                    ingredient.get('name'),
-                    ingredient.get('quantity'),
-                    ingredient.get('unit'),
-                    ingredient.get('notes'),
-                    ingredient.get('is_optional', False)
-                ))
-        
-        # Add tags
-        if 'tags' in recipe_data:
-            for tag in recipe_data['tags']:
-                cursor.execute("""
-                    INSERT INTO recipe_tags (recipe_id, tag)
-                    VALUES (?, ?)
-                """, (recipe_id, tag))
+        # One transaction for the recipe, its ingredients and tags
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(INSERT_RECIPE_SQL, (
+                recipe_data.get('name'),
+                recipe_data.get('source_url'),
+                recipe_data.get('source_type'),
+                recipe_data.get('description'),
+                recipe_data.get('servings', 4),
+                recipe_data.get('prep_time'),
+                recipe_data.get('cook_time'),
+                recipe_data.get('total_time'),
+                recipe_data.get('difficulty'),
+                recipe_data.get('cuisine'),
+                recipe_data.get('meal_type'),
+                recipe_data.get('calories'),
+                recipe_data.get('protein'),
+                recipe_data.get('carbs'),
+                recipe_data.get('fats'),
+                recipe_data.get('fiber'),
+                recipe_data.get('method'),
+                recipe_data.get('tips'),
+                recipe_data.get('image_url')
+            ))
+            
+            recipe_id = cursor.fetchone()[0]
+            
+            # Add ingredients
+            if 'ingredients' in recipe_data:
+                cursor.executemany(INSERT_INGREDIENT_SQL, [
+                    (
+                        recipe_id,
+                        ingredient.get('name'),
+                        ingredient.get('quantity'),
+                        ingredient.get('unit'),
+                        ingredient.get('notes'),
+                        ingredient.get('is_optional', False)
+                    )
+                    for ingredient in recipe_data['ingredients']
+                ])
+            
+            # Add tags
+            if 'tags' in recipe_data:
+                cursor.executemany(INSERT_TAG_SQL, [(recipe_id, tag) for tag in recipe_data['tags']])
         
-        conn.commit()
         return recipe_id
     
+    def _query_dicts(self, conn: sqlite3.Connection, query: str, params=()) -> List[Dict]:
+        """
+        Run a read query and return plain dicts
+        
+        Rows come back as tuples and are zipped with the column names once,
+        skipping the intermediate sqlite3.Row per row. Callers add keys and
+        use .get(), so results stay dicts rather than Row/namedtuple.
+        """
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    
+    def _iter_dicts(self, conn: sqlite3.Connection, query: str, params=()) -> Iterator[Dict]:
+        """Like _query_dicts, but yields rows in arraysize chunks instead of fetchall()"""
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.arraysize = SQLITE_FETCH_ARRAYSIZE
+        cursor.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+    
     def get_recipe(self, recipe_id: int) -> Optional[Dict]:
         """Get a recipe by ID with ingredients"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM recipes WHERE id = ?", (recipe_id,))
-        recipe = cursor.fetchone()
-        
-        if not recipe:
-            return None
-        
-        recipe_dict = dict(recipe)
-        
-        # Get ingredients
-        cursor.execute("""
-            SELECT * FROM recipe_ingredients WHERE recipe_id = ?
-        """, (recipe_id,))
-        ingredients = [dict(row) for row in cursor.fetchall()]
-        
-        # Map ingredient_name to name for consistency with other parts of the codebase
-        for ing in ingredients:
-            if 'ingredient_name' in ing and 'name' not in ing:
-                ing['name'] = ing['ingredient_name']
-        
-        recipe_dict['ingredients'] = ingredients
-        
-        # Get tags
-        cursor.execute("""
-            SELECT tag FROM recipe_tags WHERE recipe_id = ?
-        """, (recipe_id,))
-        recipe_dict['tags'] = [row['tag'] for row in cursor.fetchall()]
-        
-        return recipe_dict
+        with self.acquire() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(GET_RECIPE_SQL, (recipe_id,))
+            rows = cursor.fetchall()
+            
+            if not rows:
+                return None
+            
+            # Recipe columns come first, then the ingredient and tag columns
+            recipe_columns = [description[0] for description in cursor.description[:-len(RECIPE_JOIN_COLUMNS)]]
+            recipe_dict = dict(zip(recipe_columns, rows[0]))
+            
+            # The two LEFT JOINs repeat each ingredient once per tag and each
+            # tag once per ingredient, so keep the first row for each id
+            ingredients = {}
+            tags = {}
+            width = len(recipe_columns)
+            for row in rows:
+                ing_id, ing_name, quantity, unit, notes, is_optional, tag_id, tag = row[width:]
+                if ing_id is not None and ing_id not in ingredients:
+                    # 'name' mirrors ingredient_name for consistency with other parts of the codebase
+                    ingredients[ing_id] = {
+                        'id': ing_id,
+                        'recipe_id': recipe_dict['id'],
+                        'ingredient_name': ing_name,
+                        'quantity': quantity,
+                        'unit': unit,
+                        'notes': notes,
+                        'is_optional': is_optional,
+                        'name': ing_name
+                    }
+                if tag_id is not None and tag_id not in tags:
+                    tags[tag_id] = tag
+            
+            recipe_dict['ingredients'] = list(ingredients.values())
+            recipe_dict['tags'] = list(tags.values())
+            
+            return recipe_dict
+    
+    def get_recipe_details(self, recipe_id: int) -> Optional[Dict]:
+        """Get the heavy fields (method, tips, nutrition) left out of recipe lists"""
+        with self.acquire() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {RECIPE_DETAIL_COLUMNS} FROM recipes WHERE id = ?", (recipe_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+    
+    def get_ingredients_for_recipes(self, recipe_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Get ingredients for many recipes at once, keyed by recipe_id"""
+        by_recipe = defaultdict(list)
+        
+        with self.acquire() as conn:
+            for i in range(0, len(recipe_ids), SQLITE_IN_BATCH):
+                batch = recipe_ids[i:i + SQLITE_IN_BATCH]
+                for ingredient in self._query_dicts(conn, f"""
+                    SELECT * FROM recipe_ingredients
+                    WHERE recipe_id IN ({','.join('?' * len(batch))})
+                    ORDER BY id
+                """, batch):
+                    # Same name mapping as get_recipe
+                    ingredient['name'] = ingredient['ingredient_name']
+                    by_recipe[ingredient['recipe_id']].append(ingredient)
+        
+        return by_recipe
+    
+    def get_tags_for_recipes(self, recipe_ids: List[int]) -> Dict[int, List[str]]:
+        """Get tags for many recipes at once, keyed by recipe_id"""
+        with self.acquire() as conn:
+            cursor = conn.cursor()
+            by_recipe = defaultdict(list)
+            
+            for i in range(0, len(recipe_ids), SQLITE_IN_BATCH):
+                batch = recipe_ids[i:i + SQLITE_IN_BATCH]
+                cursor.execute(f"""
+                    SELECT recipe_id, tag FROM recipe_tags
+                    WHERE recipe_id IN ({','.join('?' * len(batch))})
+                    ORDER BY id
+                """, batch)
+                for row in cursor.fetchall():
+                    by_recipe[row['recipe_id']].append(row['tag'])
+            
+            return by_recipe
     
     def get_all_recipes(self, filters: Optional[Dict] = None) -> List[Dict]:
         """Get all recipes with optional filters"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        query = "SELECT * FROM recipes WHERE 1=1"
+        return list(self.iter_all_recipes(filters))
+    
+    def iter_all_recipes(self, filters: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Stream all recipes with optional filters
+        
+        Yields recipes as they are read so large libraries never sit in
+        memory twice. The read connection is held until the generator is
+        exhausted or closed.
+        """
+        query = f"SELECT {RECIPE_LIST_COLUMNS} FROM recipes WHERE 1=1"
         params = []
         
         if filters:
@@ -324,113 +625,192 @@ class RecipeDatabase:
         
         query += " ORDER BY name"
         
-        cursor.execute(query, params)
-        return [dict(row) for row in cursor.fetchall()]
+        with self.acquire() as conn:
+            yield from self._iter_dicts(conn, query, params)
     
     def update_family_member_preferences(self, member_name: str, preferences: List[str]):
         """Update family member preferences"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE family_members 
-            SET preferences = ?
-            WHERE name = ?
-        """, (json.dumps(preferences), member_name))
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT id FROM family_members WHERE name = ?", (member_name,))
+            row = cursor.fetchone()
+            if row is None:
+                return
+            
+            cursor.execute("DELETE FROM family_preferences WHERE family_member_id = ?", (row[0],))
+            cursor.executemany(INSERT_FAMILY_PREFERENCE_SQL, [(row[0], value) for value in preferences])
+            cursor.execute(BUMP_FAMILY_VERSION_SQL)
+    
+    @staticmethod
+    def _load_member_lists(conn: sqlite3.Connection, members: List[Dict], where: str = "", params=()):
+        """Attach preferences and dietary_restrictions lists from the join tables"""
+        by_id = {}
+        for member in members:
+            member['preferences'] = []
+            member['dietary_restrictions'] = []
+            by_id[member['id']] = member
         
-        conn.commit()
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        for key, table, column in (
+            ('preferences', 'family_preferences', 'preference'),
+            ('dietary_restrictions', 'family_dietary', 'restriction'),
+        ):
+            cursor.execute(
+                f"SELECT family_member_id, {column} FROM {table} {where} ORDER BY rowid", params
+            )
+            for member_id, value in cursor:
+                member = by_id.get(member_id)
+                if member is not None:
+                    member[key].append(value)
+    
+    @staticmethod
+    def _copy_member(member: Dict) -> Dict:
+        """Copy a cached family member so callers can't mutate the cache"""
+        return {
+            **member,
+            'preferences': list(member['preferences']),
+            'dietary_restrictions': list(member['dietary_restrictions'])
+        }
+    
+    def _cached_family(self, conn: sqlite3.Connection, key: Optional[str], load):
+        """
+        Family data for key from the per-instance cache, loading it on a miss
+        
+        The stored family version is read first (one primary-key lookup), so
+        a write committed by any worker or process empties the cache before
+        anything stale is served.
+        """
+        version = conn.execute(FAMILY_VERSION_SQL).fetchone()[0]
+        with self._family_cache_lock:
+            if version != self._family_cache_ver:
+                self._family_cache = {}
+                self._family_cache_ver = version
+            elif key in self._family_cache:
+                return self._family_cache[key]
+        
+        value = load(conn)
+        with self._family_cache_lock:
+            # Data read after the version check is at least that new
+            if self._family_cache_ver == version:
+                self._family_cache[key] = value
+        return value
     
     def get_family_member(self, member_name: str) -> Optional[Dict]:
         """Get family member details"""
-        conn = self.get_connection()
+        with self.acquire() as conn:
+            member = self._cached_family(
+                conn, member_name, lambda conn: self._load_family_member(conn, member_name)
+            )
+        return self._copy_member(member) if member else None
+    
+    def _load_family_member(self, conn: sqlite3.Connection, member_name: str) -> Optional[Dict]:
+        """Load a family member with its lists"""
         cursor = conn.cursor()
         
         cursor.execute("SELECT * FROM family_members WHERE name = ?", (member_name,))
         member = cursor.fetchone()
+        if member is None:
+            return None
         
-        if member:
-            member_dict = dict(member)
-            member_dict['preferences'] = json.loads(member_dict['preferences'])
-            member_dict['dietary_restrictions'] = json.loads(member_dict['dietary_restrictions'])
-            return member_dict
-        
-        return None
+        member = dict(member)
+        self._load_member_lists(conn, [member], "WHERE family_member_id = ?", (member['id'],))
+        return member
     
     def get_all_family_members(self) -> List[Dict]:
         """Get all family members"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM family_members ORDER BY id")
-        members = []
-        for row in cursor.fetchall():
-            member = dict(row)
-            member['preferences'] = json.loads(member['preferences'])
-            member['dietary_restrictions'] = json.loads(member['dietary_restrictions'])
-            members.append(member)
-        
+        with self.acquire() as conn:
+            members = self._cached_family(conn, None, self._load_all_family_members)
+        return [self._copy_member(member) for member in members]
+    
+    def _load_all_family_members(self, conn: sqlite3.Connection) -> List[Dict]:
+        """Load all family members with their lists"""
+        members = self._query_dicts(conn, "SELECT * FROM family_members ORDER BY id")
+        self._load_member_lists(conn, members)
         return members
     
     def set_recipe_preference(self, family_member_id: int, recipe_id: int, preference_level: int, notes: str = ""):
         """Set a family member's preference for a recipe (1-5 scale)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO family_recipe_preferences 
-            (family_member_id, recipe_id, preference_level, notes)
-            VALUES (?, ?, ?, ?)
-        """, (family_member_id, recipe_id, preference_level, notes))
-        
-        conn.commit()
+        with self.acquire(write=True) as conn:
+            conn.execute(SET_RECIPE_PREFERENCE_SQL, (family_member_id, recipe_id, preference_level, notes))
+    
+    def set_recipe_preferences_bulk(self, rows: Iterable[Tuple[int, int, int, str]]):
+        """
+        Set many recipe preferences in one transaction
+        
+        Each row is (family_member_id, recipe_id, preference_level, notes),
+        so a whole member x recipe matrix costs one commit instead of one per cell.
+        """
+        with self.transaction() as conn:
+            conn.executemany(SET_RECIPE_PREFERENCE_SQL, rows)
     
     def generate_shopping_list(self, recipe_ids: List[int], servings_multiplier: float = 1.0) -> List[Dict]:
         """Generate a shopping list from multiple recipes"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        if not recipe_ids:
+            return []
         
-        # Aggregate ingredients from all recipes
-        ingredients_map = {}
-        
-        for recipe_id in recipe_ids:
-            cursor.execute("""
-                SELECT ingredient_name, quantity, unit, is_optional
-                FROM recipe_ingredients
-                WHERE recipe_id = ?
-            """, (recipe_id,))
+        with self.acquire() as conn:
+            cursor = conn.cursor()
+            
+            # Aggregate ingredients from all recipes in one grouped query. The ids
+            # CTE keeps duplicates and order so a recipe listed twice counts twice
+            # and the first occurrence of each ingredient supplies its fields.
+            ids = ', '.join('(?, ?)' for _ in recipe_ids)
+            params = [value for pos, recipe_id in enumerate(recipe_ids) for value in (pos, recipe_id)]
+            cursor.execute(f"""
+                WITH ids(pos, recipe_id) AS (VALUES {ids}),
+                rows AS (
+                    SELECT ri.ingredient_name, ri.quantity, ri.unit, ri.is_optional,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY ri.ingredient_name, ri.unit ORDER BY ids.pos, ri.id
+                           ) AS rn,
+                           ROW_NUMBER() OVER (ORDER BY ids.pos, ri.id) AS seq
+                    FROM ids JOIN recipe_ingredients ri ON ri.recipe_id = ids.recipe_id
+                )
+                SELECT ingredient_name, unit,
+                       MAX(CASE WHEN rn = 1 THEN quantity END) AS quantity,
+                       MAX(CASE WHEN rn = 1 THEN is_optional END) AS is_optional,
+                       SUM(rn > 1 AND qty_value(quantity) IS NOT NULL) AS combined,
+                       TOTAL(qty_value(quantity)) AS total
+                FROM rows
+                GROUP BY ingredient_name, unit
+                ORDER BY ingredient_name, MIN(seq)
+            """, params)
             
+            shopping_list = []
             for row in cursor.fetchall():
-                ingredient = dict(row)
-                key = f"{ingredient['ingredient_name']}_{ingredient['unit']}"
+                quantity = row['quantity']
                 
-                if key in ingredients_map:
-                    # Try to combine quantities (simple addition for now)
+                # Combine quantities (simple addition for now) - rows that aren't
+                # numbers are skipped, and a non-numeric first quantity is kept as is
+                if row['combined'] and _quantity_value(quantity) is not None:
+                    quantity = str(row['total'])
+                
+                # Apply servings multiplier
+                if quantity:
                     try:
-                        existing_qty = float(ingredients_map[key]['quantity']) if ingredients_map[key]['quantity'] else 0
-                        new_qty = float(ingredient['quantity']) if ingredient['quantity'] else 0
-                        ingredients_map[key]['quantity'] = str(existing_qty + new_qty)
+                        quantity = str(float(quantity) * servings_multiplier)
                     except (ValueError, TypeError):
-                        # If quantities can't be combined, keep as is
                         pass
-                else:
-                    ingredients_map[key] = ingredient
-        
-        # Apply servings multiplier
-        shopping_list = []
-        for ingredient in ingredients_map.values():
-            if ingredient['quantity']:
-                try:
-                    qty = float(ingredient['quantity']) * servings_multiplier
-                    ingredient['quantity'] = str(qty)
-                except (ValueError, TypeError):
-                    pass
+                
+                shopping_list.append({
+                    'ingredient_name': row['ingredient_name'],
+                    'quantity': quantity,
+                    'unit': row['unit'],
+                    'is_optional': row['is_optional']
+                })
             
-            shopping_list.append(ingredient)
-        
-        return sorted(shopping_list, key=lambda x: x['ingredient_name'])
+            return shopping_list
     
     def close(self):
         """Close database connection"""
+        # Readers fall back to the write connection once the pool is closed
+        self._read_pool_size = 0
+        while not self._read_pool.empty():
+            self._read_pool.get_nowait().close()
         if self.conn:
+            # Let SQLite refresh statistics for the queries this connection ran
+            self.conn.execute("PRAGMA optimize")
             self.conn.close()
             self.conn = None
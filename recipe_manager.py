@@ -8,6 +8,14 @@ from config import Config
 class RecipeManager:
     """Unified interface for recipe database operations"""
     
+    # Public methods bound once at init to their _firestore_/_sqlite_ variant
+    _DISPATCHED_METHODS = (
+        'get_all_recipes', 'get_recipe', 'get_recipe_ingredients', 'update_recipe',
+        'delete_recipe', 'add_recipe_ingredient', 'search_recipes', 'get_family_members',
+        'update_times_cooked', 'generate_shopping_list', 'save_meal_plan',
+        'get_all_meal_plans', 'get_meal_plan', 'delete_meal_plan',
+    )
+    
     def __init__(self):
         """Initialize the appropriate database backend"""
         self.backend = None
@@ -27,39 +35,56 @@ class RecipeManager:
             from recipe_database import RecipeDatabase
             self.backend = RecipeDatabase()
             print(f"✅ Using SQLite for recipes")
+        
+        # Resolve the backend once instead of branching on db_type every call
+        prefix = '_firestore_' if self.db_type == 'firestore' else '_sqlite_'
+        for name in self._DISPATCHED_METHODS:
+            setattr(self, name, getattr(self, prefix + name))
+        self._add_recipe = getattr(self, prefix + 'add_recipe')
     
-    def get_all_recipes(self) -> List[Dict]:
+    def _firestore_get_all_recipes(self) -> List[Dict]:
         """Get all recipes"""
-        if self.db_type == 'firestore':
-            # Firestore recipes already have ingredients embedded
-            return self.backend.get_all_recipes()
-        else:
-            # SQLite recipes need ingredients fetched separately
-            recipes = self.backend.get_all_recipes()
-            # Add ingredients to each recipe if the method exists
-            if hasattr(self.backend, 'get_recipe_ingredients'):
-                for recipe in recipes:
-                    recipe['ingredients'] = self.backend.get_recipe_ingredients(recipe['id'])
-            return recipes
-    
-    def get_recipe(self, recipe_id: int) -> Optional[Dict]:
+        # Firestore recipes already have ingredients embedded
+        return self.backend.get_all_recipes()
+    
+    def _sqlite_get_all_recipes(self) -> List[Dict]:
+        """Get all recipes"""
+        # SQLite recipes need ingredients fetched separately
+        recipes = self.backend.get_all_recipes()
+        if hasattr(self.backend, 'get_ingredients_for_recipes'):
+            # One query for all ingredients and one for all tags
+            recipe_ids = [recipe['id'] for recipe in recipes]
+            ingredients = self.backend.get_ingredients_for_recipes(recipe_ids)
+            tags = self.backend.get_tags_for_recipes(recipe_ids)
+            for recipe in recipes:
+                recipe['ingredients'] = ingredients[recipe['id']]
+                recipe['tags'] = tags[recipe['id']]
+        # Add ingredients to each recipe if the method exists
+        elif hasattr(self.backend, 'get_recipe_ingredients'):
+            for recipe in recipes:
+                recipe['ingredients'] = self.backend.get_recipe_ingredients(recipe['id'])
+        return recipes
+    
+    def _firestore_get_recipe(self, recipe_id: int) -> Optional[Dict]:
         """Get a single recipe by ID"""
-        if self.db_type == 'firestore':
-            # Firestore recipes already have ingredients embedded
-            return self.backend.get_recipe_by_id(str(recipe_id))
-        else:
-            recipe = self.backend.get_recipe(recipe_id)
-            if recipe and hasattr(self.backend, 'get_recipe_ingredients'):
-                recipe['ingredients'] = self.backend.get_recipe_ingredients(recipe_id)
-            return recipe
+        # Firestore recipes already have ingredients embedded
+        return self.backend.get_recipe_by_id(str(recipe_id))
     
-    def get_recipe_ingredients(self, recipe_id: int) -> List[Dict]:
+    def _sqlite_get_recipe(self, recipe_id: int) -> Optional[Dict]:
+        """Get a single recipe by ID"""
+        recipe = self.backend.get_recipe(recipe_id)
+        if recipe and hasattr(self.backend, 'get_recipe_ingredients'):
+            recipe['ingredients'] = self.backend.get_recipe_ingredients(recipe_id)
+        return recipe
+    
+    def _firestore_get_recipe_ingredients(self, recipe_id: int) -> List[Dict]:
         """Get ingredients for a recipe"""
-        if self.db_type == 'firestore':
-            recipe = self.backend.get_recipe_by_id(str(recipe_id))
-            return recipe.get('ingredients', []) if recipe else []
-        else:
-            return self.backend.get_recipe_ingredients(recipe_id)
+        recipe = self.backend.get_recipe_by_id(str(recipe_id))
+        return recipe.get('ingredients', []) if recipe else []
+    
+    def _sqlite_get_recipe_ingredients(self, recipe_id: int) -> List[Dict]:
+        """Get ingredients for a recipe"""
+        return self.backend.get_recipe_ingredients(recipe_id)
     
     def add_recipe(self, name_or_data, **kwargs) -> Optional[int]:
         """Add a new recipe - accepts either a dict or name with kwargs"""
@@ -70,111 +95,123 @@ class RecipeManager:
             # Legacy usage: add_recipe('name', description='...', etc.)
             recipe_data = {'name': name_or_data, **kwargs}
         
-        if self.db_type == 'firestore':
-            return self.backend.add_recipe(recipe_data)
-        else:
-            return self.backend.add_recipe(recipe_data['name'], **{k: v for k, v in recipe_data.items() if k != 'name'})
+        return self._add_recipe(recipe_data)
+    
+    def _firestore_add_recipe(self, recipe_data: Dict) -> Optional[str]:
+        """Add a normalized recipe dict to Firestore"""
+        return self.backend.add_recipe(recipe_data)
     
-    def update_recipe(self, recipe_id: int, **kwargs) -> bool:
+    def _sqlite_add_recipe(self, recipe_data: Dict) -> Optional[int]:
+        """Add a normalized recipe dict to SQLite"""
+        return self.backend.add_recipe(recipe_data['name'], **{k: v for k, v in recipe_data.items() if k != 'name'})
+    
+    def _firestore_update_recipe(self, recipe_id: int, **kwargs) -> bool:
         """Update a recipe"""
-        if self.db_type == 'firestore':
-            return self.backend.update_recipe(str(recipe_id), kwargs)
-        else:
-            return self.backend.update_recipe(recipe_id, **kwargs)
+        return self.backend.update_recipe(str(recipe_id), kwargs)
+    
+    def _sqlite_update_recipe(self, recipe_id: int, **kwargs) -> bool:
+        """Update a recipe"""
+        return self.backend.update_recipe(recipe_id, **kwargs)
     
-    def delete_recipe(self, recipe_id: int) -> bool:
+    def _firestore_delete_recipe(self, recipe_id: int) -> bool:
         """Delete a recipe"""
-        if self.db_type == 'firestore':
-            return self.backend.delete_recipe(str(recipe_id))
-        else:
-            return self.backend.delete_recipe(recipe_id)
+        return self.backend.delete_recipe(str(recipe_id))
+    
+    def _sqlite_delete_recipe(self, recipe_id: int) -> bool:
+        """Delete a recipe"""
+        return self.backend.delete_recipe(recipe_id)
     
-    def add_recipe_ingredient(self, recipe_id: int, ingredient_name: str, quantity: str = "", unit: str = "", **kwargs) -> Optional[int]:
+    def _firestore_add_recipe_ingredient(self, recipe_id: int, ingredient_name: str, quantity: str = "", unit: str = "", **kwargs) -> Optional[int]:
         """Add an ingredient to a recipe"""
-        if self.db_type == 'firestore':
-            # For Firestore, update the recipe's ingredients array
-            recipe = self.backend.get_recipe_by_id(str(recipe_id))
-            if recipe:
-                ingredients = recipe.get('ingredients', [])
-                ingredients.append({
-                    'ingredient_name': ingredient_name,
-                    'quantity': quantity,
-                    'unit': unit,
-                    **kwargs
-                })
-                return self.backend.update_recipe(str(recipe_id), {'ingredients': ingredients})
-            return None
-        else:
-            return self.backend.add_recipe_ingredient(recipe_id, ingredient_name, quantity, unit, **kwargs)
+        # For Firestore, update the recipe's ingredients array
+        recipe = self.backend.get_recipe_by_id(str(recipe_id))
+        if recipe:
+            ingredients = recipe.get('ingredients', [])
+            ingredients.append({
+                'ingredient_name': ingredient_name,
+                'quantity': quantity,
+                'unit': unit,
+                **kwargs
+            })
+            return self.backend.update_recipe(str(recipe_id), {'ingredients': ingredients})
+        return None
     
-    def search_recipes(self, search_term: str = "", filters: Dict = None) -> List[Dict]:
+    def _sqlite_add_recipe_ingredient(self, recipe_id: int, ingredient_name: str, quantity: str = "", unit: str = "", **kwargs) -> Optional[int]:
+        """Add an ingredient to a recipe"""
+        return self.backend.add_recipe_ingredient(recipe_id, ingredient_name, quantity, unit, **kwargs)
+    
+    def _firestore_search_recipes(self, search_term: str = "", filters: Dict = None) -> List[Dict]:
         """Search recipes"""
-        if self.db_type == 'firestore':
-            # Get all recipes and filter client-side (Firestore doesn't support complex text search)
-            all_recipes = self.get_all_recipes()
-            if not search_term and not filters:
-                return all_recipes
-            
-            results = []
-            for recipe in all_recipes:
-                match = True
-                
-                # Text search
-                if search_term:
-                    search_lower = search_term.lower()
-                    if search_lower not in recipe.get('name', '').lower():
-                        match = False
-                
-                # Filters
-                if filters and match:
-                    for key, value in filters.items():
-                        if recipe.get(key) != value:
-                            match = False
-                            break
-                
-                if match:
-                    results.append(recipe)
-            
-            return results
-        else:
-            return self.backend.search_recipes(search_term, filters)
+        # Get all recipes and filter client-side (Firestore doesn't support complex text search)
+        all_recipes = self.get_all_recipes()
+        if not search_term and not filters:
+            return all_recipes
+        
+        # Hoist the search term and filter pairs out of the per-recipe check
+        search_lower = search_term.lower() if search_term else None
+        filter_items = tuple(filters.items()) if filters else ()
+        
+        return [
+            recipe for recipe in all_recipes
+            if (search_lower is None or search_lower in recipe.get('name', '').lower())
+            and all(recipe.get(key) == value for key, value in filter_items)
+        ]
     
-    def get_family_members(self) -> List[Dict]:
+    def _sqlite_search_recipes(self, search_term: str = "", filters: Dict = None) -> List[Dict]:
+        """Search recipes"""
+        return self.backend.search_recipes(search_term, filters)
+    
+    def _firestore_get_family_members(self) -> List[Dict]:
         """Get all family members"""
-        if self.db_type == 'firestore':
-            return self.backend.query('family_members') if hasattr(self.backend, 'query') else []
-        else:
-            return self.backend.get_family_members()
+        return self.backend.query('family_members') if hasattr(self.backend, 'query') else []
+    
+    def _sqlite_get_family_members(self) -> List[Dict]:
+        """Get all family members"""
+        return self.backend.get_family_members()
     
     def get_all_family_members(self) -> List[Dict]:
         """Get all family members (alias for get_family_members)"""
         return self.get_family_members()
     
-    def update_times_cooked(self, recipe_id: int) -> bool:
+    def _firestore_update_times_cooked(self, recipe_id: int) -> bool:
         """Increment the times_cooked counter"""
-        if self.db_type == 'firestore':
-            recipe = self.backend.get_recipe_by_id(str(recipe_id))
-            if recipe:
-                times_cooked = recipe.get('times_cooked', 0) + 1
-                return self.backend.update_recipe(str(recipe_id), {'times_cooked': times_cooked})
-            return False
-        else:
-            return self.backend.update_times_cooked(recipe_id)
+        recipe = self.backend.get_recipe_by_id(str(recipe_id))
+        if recipe:
+            times_cooked = recipe.get('times_cooked', 0) + 1
+            return self.backend.update_recipe(str(recipe_id), {'times_cooked': times_cooked})
+        return False
+    
+    def _sqlite_update_times_cooked(self, recipe_id: int) -> bool:
+        """Increment the times_cooked counter"""
+        return self.backend.update_times_cooked(recipe_id)
+    
+    def _firestore_generate_shopping_list(self, recipe_ids: List[int], servings_multiplier: float = 1.0) -> List[Dict]:
+        """Generate a shopping list from multiple recipes"""
+        recipes = (self.backend.get_recipe_by_id(str(recipe_id)) for recipe_id in recipe_ids)
+        return self._aggregate_shopping_list(
+            (recipe.get('ingredients', []) for recipe in recipes if recipe),
+            servings_multiplier
+        )
     
-    def generate_shopping_list(self, recipe_ids: List[int], servings_multiplier: float = 1.0) -> List[Dict]:
+    def _sqlite_generate_shopping_list(self, recipe_ids: List[int], servings_multiplier: float = 1.0) -> List[Dict]:
         """Generate a shopping list from multiple recipes"""
+        if hasattr(self.backend, 'generate_shopping_list'):
+            # SQLite aggregates in a single grouped query
+            return self.backend.generate_shopping_list(recipe_ids, servings_multiplier)
+        return self._aggregate_shopping_list(
+            (self.backend.get_recipe_ingredients(recipe_id) for recipe_id in recipe_ids),
+            servings_multiplier
+        )
+    
+    @staticmethod
+    def _aggregate_shopping_list(ingredient_lists, servings_multiplier: float) -> List[Dict]:
+        """Combine per-recipe ingredient lists by name and unit"""
         ingredients_map = {}
+        # Running numeric total per key; None once the first quantity isn't a number
+        totals = {}
+        combined = set()
         
-        for recipe_id in recipe_ids:
-            # Get ingredients for this recipe
-            if self.db_type == 'firestore':
-                recipe = self.backend.get_recipe_by_id(str(recipe_id))
-                if not recipe:
-                    continue
-                ingredients = recipe.get('ingredients', [])
-            else:
-                ingredients = self.backend.get_recipe_ingredients(recipe_id)
-            
+        for ingredients in ingredient_lists:
             # Aggregate ingredients
             for ingredient in ingredients:
                 ingredient_name = ingredient.get('ingredient_name', '')
@@ -182,17 +219,17 @@ class RecipeManager:
                 quantity = ingredient.get('quantity', '')
                 is_optional = ingredient.get('is_optional', False)
                 
-                key = f"{ingredient_name}_{unit}"
+                key = (ingredient_name, unit)
                 
                 if key in ingredients_map:
                     # Try to combine quantities
-                    try:
-                        existing_qty = float(ingredients_map[key]['quantity']) if ingredients_map[key]['quantity'] else 0
-                        new_qty = float(quantity) if quantity else 0
-                        ingredients_map[key]['quantity'] = str(existing_qty + new_qty)
-                    except (ValueError, TypeError):
-                        # If quantities can't be combined, keep as is
-                        pass
+                    if totals[key] is not None:
+                        try:
+                            totals[key] += float(quantity) if quantity else 0
+                            combined.add(key)
+                        except (ValueError, TypeError):
+                            # If quantities can't be combined, keep as is
+                            pass
                 else:
                     ingredients_map[key] = {
                         'ingredient_name': ingredient_name,
@@ -200,54 +237,56 @@ class RecipeManager:
                         'unit': unit,
                         'is_optional': is_optional
                     }
+                    try:
+                        totals[key] = float(quantity) if quantity else 0.0
+                    except (ValueError, TypeError):
+                        totals[key] = None
         
-        # Apply servings multiplier
-        shopping_list = []
-        for ingredient in ingredients_map.values():
-            if ingredient['quantity']:
-                try:
-                    qty = float(ingredient['quantity']) * servings_multiplier
-                    ingredient['quantity'] = str(qty)
-                except (ValueError, TypeError):
-                    pass
-            
-            shopping_list.append(ingredient)
+        # Apply servings multiplier and stringify each total once
+        for key, ingredient in ingredients_map.items():
+            total = totals[key]
+            if key in combined or (ingredient['quantity'] and total is not None):
+                ingredient['quantity'] = str(total * servings_multiplier)
         
-        return sorted(shopping_list, key=lambda x: x['ingredient_name'])
+        return sorted(ingredients_map.values(), key=lambda x: x['ingredient_name'])
     
     # Meal Plan Methods
-    def save_meal_plan(self, name: str, start_date: str, end_date: str, meals: Dict, ai_strategy: str = None) -> Optional[str]:
+    def _firestore_save_meal_plan(self, name: str, start_date: str, end_date: str, meals: Dict, ai_strategy: str = None) -> Optional[str]:
         """Save a meal plan to database"""
-        if self.db_type == 'firestore':
-            meal_plan_data = {
-                'name': name,
-                'start_date': start_date,
-                'end_date': end_date,
-                'meals': meals,
-                'ai_strategy': ai_strategy,
-                'created_at': self.backend.get_timestamp()
-            }
-            return self.backend.save_meal_plan(meal_plan_data)
-        else:
-            return self.backend.save_meal_plan(name, start_date, end_date, meals)
+        meal_plan_data = {
+            'name': name,
+            'start_date': start_date,
+            'end_date': end_date,
+            'meals': meals,
+            'ai_strategy': ai_strategy,
+            'created_at': self.backend.get_timestamp()
+        }
+        return self.backend.save_meal_plan(meal_plan_data)
+    
+    def _sqlite_save_meal_plan(self, name: str, start_date: str, end_date: str, meals: Dict, ai_strategy: str = None) -> Optional[str]:
+        """Save a meal plan to database"""
+        return self.backend.save_meal_plan(name, start_date, end_date, meals)
     
-    def get_all_meal_plans(self) -> List[Dict]:
+    def _firestore_get_all_meal_plans(self) -> List[Dict]:
         """Get all saved meal plans"""
-        if self.db_type == 'firestore':
-            return self.backend.get_all_meal_plans()
-        else:
-            return self.backend.get_all_meal_plans()
+        return self.backend.get_all_meal_plans()
+    
+    def _sqlite_get_all_meal_plans(self) -> List[Dict]:
+        """Get all saved meal plans"""
+        return self.backend.get_all_meal_plans()
     
-    def get_meal_plan(self, meal_plan_id: str) -> Optional[Dict]:
+    def _firestore_get_meal_plan(self, meal_plan_id: str) -> Optional[Dict]:
         """Get a specific meal plan by ID"""
-        if self.db_type == 'firestore':
-            return self.backend.get_meal_plan_by_id(meal_plan_id)
-        else:
-            return self.backend.get_meal_plan(int(meal_plan_id))
+        return self.backend.get_meal_plan_by_id(meal_plan_id)
+    
+    def _sqlite_get_meal_plan(self, meal_plan_id: str) -> Optional[Dict]:
+        """Get a specific meal plan by ID"""
+        return self.backend.get_meal_plan(int(meal_plan_id))
     
-    def delete_meal_plan(self, meal_plan_id: str) -> bool:
+    def _firestore_delete_meal_plan(self, meal_plan_id: str) -> bool:
         """Delete a meal plan"""
-        if self.db_type == 'firestore':
-            return self.backend.delete_meal_plan(meal_plan_id)
-        else:
-            return self.backend.delete_meal_plan(int(meal_plan_id))
+        return self.backend.delete_meal_plan(meal_plan_id)
+    
+    def _sqlite_delete_meal_plan(self, meal_plan_id: str) -> bool:
+        """Delete a meal plan"""
+        return self.backend.delete_meal_plan(int(meal_plan_id))
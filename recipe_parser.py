@@ -4,20 +4,228 @@ Extracts recipe information from various sources including websites, Instagram,
 """
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from bs4 import BeautifulSoup, SoupStrainer
 import re
-import json
-from typing import Dict, Optional, List
+import copy
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Optional, List, Tuple
 from urllib.parse import urlparse
 
+try:
+    # orjson: C decoder for the JSON-LD blobs, raises a ValueError subclass
+    import orjson as json
+except ImportError:
+    import json
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml',
+    # gzip/deflate, plus br and zstd when their decoders are installed
+    'Accept-Encoding': ACCEPT_ENCODING,
+}
+
+
+@lru_cache(maxsize=1)
+def get_http_session() -> requests.Session:
+    """Shared HTTP session so repeat fetches reuse keep-alive TCP/TLS connections"""
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# Download chunk size when streaming recipe pages
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Concurrent fetches in parse_urls (kept under the session's pool size)
+PARSE_URLS_MAX_WORKERS = 10
+
+# Parsed recipes by URL, shared by every RecipeParser (least recently used first)
+PARSED_RECIPE_CACHE_SIZE = 256
+_parsed_recipes = OrderedDict()
+_parsed_recipes_lock = threading.Lock()
+
+
+# Patterns compiled once at import
+# Class names that mark ingredient and method/instruction containers
+_INGREDIENT_CLASS_RE = re.compile(r'ingredient', re.I)
+_METHOD_CLASS_RE = re.compile(r'(instruction|method|direction|step)', re.I)
+# "2 cups flour" -> quantity, unit, name
+_INGREDIENT_LINE_RE = re.compile(r'(\d+(?:\.\d+)?(?:/\d+)?)\s*([a-zA-Z]+)?\s+(.+)')
+# Spellings of common units collapsed to one canonical form (keys are lowercase, no trailing '.')
+CANONICAL_UNITS = {
+    'tablespoon': 'tbsp', 'tablespoons': 'tbsp', 'tbsp': 'tbsp', 'tbsps': 'tbsp', 'tbs': 'tbsp',
+    'teaspoon': 'tsp', 'teaspoons': 'tsp', 'tsp': 'tsp', 'tsps': 'tsp',
+    'cup': 'cup', 'cups': 'cup',
+    'gram': 'g', 'grams': 'g', 'g': 'g',
+    'kilogram': 'kg', 'kilograms': 'kg', 'kg': 'kg',
+    'millilitre': 'ml', 'millilitres': 'ml', 'milliliter': 'ml', 'milliliters': 'ml', 'ml': 'ml',
+    'litre': 'l', 'litres': 'l', 'liter': 'l', 'liters': 'l', 'l': 'l',
+    'ounce': 'oz', 'ounces': 'oz', 'oz': 'oz',
+    'pound': 'lb', 'pounds': 'lb', 'lb': 'lb', 'lbs': 'lb',
+}
+# Section headers in pasted recipes ("Ingredients:", "Method", "Steps"); headers are short
+_SECTION_RE = re.compile(r'(ingredient|method|instruction|direction|step)s?\b', re.I)
+SECTION_HEADER_MAX_LEN = 40
+_SECTION_INITIALS = frozenset('dimsDIMS')
+# Opening <script type="application/ld+json"> tag and the closing tag of its body, in the raw page bytes
+_JSON_LD_OPEN_RE = re.compile(rb'<script[^>]*application/ld\+json[^>]*>', re.I)
+_SCRIPT_CLOSE_RE = re.compile(rb'</script>', re.I)
+_SCRIPT_CLOSE_LEN = len(b'</script>')
+
+
+class _RecipeStrainer(SoupStrainer):
+    """Keeps the tags the heuristic extractors read, plus method-step divs"""
+    
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        if name == 'div':
+            # Most pages wrap everything in divs; only keep the method containers
+            return bool(attrs and _METHOD_CLASS_RE.search(attrs.get('class') or ''))
+        return super().allow_tag_creation(nsprefix, name, attrs)
+
+
+# Parse only the tags the heuristics read instead of building the whole DOM
+HEURISTIC_STRAINER = _RecipeStrainer(['h1', 'title', 'meta', 'ul', 'ol', 'li', 'p', 'img'])
+
+
+class _JsonLdScanner:
+    """
+    Finds the schema.org Recipe among a page's JSON-LD scripts as the page streams in
+    
+    Script bodies are raw text in HTML (no entities or nested tags), so
+    they are sliced straight out of the response bytes without a DOM.
+    Each feed() only examines bytes that earlier calls could not settle:
+    an opening tag cut off by a chunk boundary is resumed from its '<',
+    and a script still waiting for </script> only has the new bytes
+    searched, so scanning a page stays linear in its size.
+    """
+    
+    def __init__(self):
+        self._pos = 0  # Offset to resume searching from
+        self._body_start = None  # Start of a script body whose closing tag hasn't arrived
+    
+    def feed(self, content) -> Optional[Dict]:
+        """Scan the page read so far (content only ever grows); the Recipe node once found"""
+        while True:
+            if self._body_start is None:
+                match = _JSON_LD_OPEN_RE.search(content, self._pos)
+                if match is None:
+                    # Resume from a tag that is still missing its '>', else past everything read
+                    tail = content.rfind(b'<', self._pos)
+                    unfinished = tail != -1 and content.find(b'>', tail) == -1
+                    self._pos = tail if unfinished else len(content)
+                    return None
+                self._body_start = self._pos = match.end()
+            
+            close = _SCRIPT_CLOSE_RE.search(content, self._pos)
+            if close is None:
+                # Only a '</script>' split across chunks can start before the new bytes
+                self._pos = max(self._body_start, len(content) - _SCRIPT_CLOSE_LEN + 1)
+                return None
+            
+            body = content[self._body_start:close.start()]
+            self._body_start = None
+            self._pos = close.end()
+            try:
+                data = json.loads(body)
+            except ValueError:
+                continue
+            recipe = _find_recipe_node(data)
+            if recipe is not None:
+                return recipe
+
+
+def _intern(value):
+    """
+    Share one string object between repeated values such as cuisines
+    
+    sys.intern's table drops strings once nothing uses them, so it stays
+    bounded. Non-strings (e.g. a JSON-LD list) are returned unchanged.
+    """
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _canonical_unit(unit: str) -> str:
+    """Canonical spelling of a known unit ('Tbsp', 'tablespoons' -> 'tbsp'), else the interned unit"""
+    return CANONICAL_UNITS.get(unit.rstrip('.').lower()) or sys.intern(unit)
+
+
+def _first_int(value, default: int) -> int:
+    """First run of digits in str(value) as an int, e.g. "Serves 6-8" -> 6 (default if none)"""
+    number = None
+    for char in str(value):
+        if char.isdecimal():
+            number = (number or 0) * 10 + int(char)
+        elif number is not None:
+            break
+    return default if number is None else number
+
+
+def _find_recipe_node(data) -> Optional[Dict]:
+    """Locate the Recipe object in a JSON-LD value (a node, a list of nodes, or an @graph)"""
+    for node in (data if isinstance(data, list) else (data,)):
+        if not isinstance(node, dict):
+            continue
+        node_type = node.get('@type')
+        if node_type == 'Recipe' or (isinstance(node_type, list) and 'Recipe' in node_type):
+            return node
+        graph = node.get('@graph')
+        if graph:
+            recipe = _find_recipe_node(graph)
+            if recipe is not None:
+                return recipe
+    return None
+
+
 class RecipeParser:
     def __init__(self):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        self.headers = dict(DEFAULT_HEADERS)
+        self.session = get_http_session()
     
     def parse_url(self, url: str) -> Optional[Dict]:
-        """Parse a recipe URL and extract recipe information"""
+        """Parse a recipe URL and extract recipe information (cached per URL)"""
+        with _parsed_recipes_lock:
+            recipe = _parsed_recipes.get(url)
+            if recipe is not None:
+                _parsed_recipes.move_to_end(url)
+        
+        if recipe is None:
+            recipe = self._parse_url_uncached(url)
+            if recipe is None:
+                return None  # Don't cache failures; they may be transient
+            
+            with _parsed_recipes_lock:
+                _parsed_recipes[url] = recipe
+                if len(_parsed_recipes) > PARSED_RECIPE_CACHE_SIZE:
+                    _parsed_recipes.popitem(last=False)
+        
+        # Callers get their own copy so edits don't leak into the cache
+        return copy.deepcopy(recipe)
+    
+    def parse_urls(self, urls: List[str]) -> List[Optional[Dict]]:
+        """
+        Parse several recipe URLs at once
+        
+        Fetches run concurrently over the shared session's connection pool,
+        so a batch costs roughly its slowest page rather than the sum.
+        Results are in the same order as urls (None where parsing failed).
+        """
+        if not urls:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(len(urls), PARSE_URLS_MAX_WORKERS)) as executor:
+            return list(executor.map(self.parse_url, urls))
+    
+    def _parse_url_uncached(self, url: str) -> Optional[Dict]:
+        """Fetch and parse a recipe URL"""
         parsed_url = urlparse(url)
         domain = parsed_url.netloc.lower()
         
@@ -29,12 +237,29 @@ class RecipeParser:
         else:
             return self._parse_generic_website(url)
     
+    def _fetch_page(self, url: str) -> Tuple[bytes, Optional[Dict]]:
+        """
+        Stream a page, stopping as soon as a JSON-LD Recipe has been read
+        
+        JSON-LD usually sits in <head>, so the rest of the page is only
+        downloaded when the heuristic fallback needs it. Returns the bytes
+        read and the Recipe node, if one was found.
+        """
+        with self.session.get(url, headers=self.headers, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            content = bytearray()
+            scanner = _JsonLdScanner()
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                content += chunk
+                recipe = scanner.feed(content)
+                if recipe is not None:
+                    return bytes(content), recipe
+        return bytes(content), None
+    
     def _parse_generic_website(self, url: str) -> Optional[Dict]:
         """Parse recipe from a standard recipe website using schema.org and heuristics"""
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
+            content, data = self._fetch_page(url)
             
             recipe_data = {
                 'source_url': url,
@@ -52,70 +277,54 @@ class RecipeParser:
                 'meal_type': None
             }
             
-            # Try to find JSON-LD schema.org Recipe data
-            json_ld = soup.find('script', type='application/ld+json')
-            if json_ld:
-                try:
-                    data = json.loads(json_ld.string)
-                    if isinstance(data, list):
-                        data = data[0]
-                    
-                    if data.get('@type') == 'Recipe':
-                        recipe_data['name'] = data.get('name')
-                        recipe_data['description'] = data.get('description')
-                        recipe_data['prep_time'] = data.get('prepTime')
-                        recipe_data['cook_time'] = data.get('cookTime')
-                        recipe_data['total_time'] = data.get('totalTime')
-                        
-                        if 'recipeYield' in data:
-                            try:
-                                recipe_data['servings'] = int(re.search(r'\d+', str(data['recipeYield'])).group())
-                            except:
-                                pass
-                        
-                        if 'image' in data:
-                            if isinstance(data['image'], dict):
-                                recipe_data['image_url'] = data['image'].get('url')
-                            elif isinstance(data['image'], list):
-                                recipe_data['image_url'] = data['image'][0] if data['image'] else None
-                            else:
-                                recipe_data['image_url'] = data['image']
-                        
-                        if 'recipeIngredient' in data:
-                            recipe_data['ingredients'] = [
-                                {'name': ing, 'quantity': '', 'unit': '', 'notes': ''}
-                                for ing in data['recipeIngredient']
-                            ]
-                        
-                        if 'recipeInstructions' in data:
-                            instructions = data['recipeInstructions']
-                            if isinstance(instructions, list):
-                                method_steps = []
-                                for step in instructions:
-                                    if isinstance(step, dict):
-                                        method_steps.append(step.get('text', ''))
-                                    else:
-                                        method_steps.append(str(step))
-                                recipe_data['method'] = '\n'.join(method_steps)
+            # schema.org JSON-LD first; on most recipe sites this skips the DOM entirely
+            if data is not None:
+                recipe_data['name'] = data.get('name')
+                recipe_data['description'] = data.get('description')
+                recipe_data['prep_time'] = data.get('prepTime')
+                recipe_data['cook_time'] = data.get('cookTime')
+                recipe_data['total_time'] = data.get('totalTime')
+                
+                recipe_data['servings'] = _first_int(data.get('recipeYield'), recipe_data['servings'])
+                
+                if 'image' in data:
+                    if isinstance(data['image'], dict):
+                        recipe_data['image_url'] = data['image'].get('url')
+                    elif isinstance(data['image'], list):
+                        recipe_data['image_url'] = data['image'][0] if data['image'] else None
+                    else:
+                        recipe_data['image_url'] = data['image']
+                
+                if 'recipeIngredient' in data:
+                    recipe_data['ingredients'] = [
+                        {'name': ing, 'quantity': '', 'unit': '', 'notes': ''}
+                        for ing in data['recipeIngredient']
+                    ]
+                
+                if 'recipeInstructions' in data:
+                    instructions = data['recipeInstructions']
+                    if isinstance(instructions, list):
+                        method_steps = []
+                        for step in instructions:
+                            if isinstance(step, dict):
+                                method_steps.append(step.get('text', ''))
                             else:
-                                recipe_data['method'] = instructions
-                        
-                        if 'recipeCuisine' in data:
-                            recipe_data['cuisine'] = data['recipeCuisine']
-                        
-                        if 'recipeCategory' in data:
-                            recipe_data['meal_type'] = data['recipeCategory']
-                        
-                        return recipe_data
-                except json.JSONDecodeError:
-                    pass
+                                method_steps.append(str(step))
+                        recipe_data['method'] = '\n'.join(method_steps)
+                    else:
+                        recipe_data['method'] = instructions
+                
+                if 'recipeCuisine' in data:
+                    recipe_data['cuisine'] = _intern(data['recipeCuisine'])
+                
+                if 'recipeCategory' in data:
+                    recipe_data['meal_type'] = _intern(data['recipeCategory'])
+                
+                return recipe_data
             
             # Fallback: Extract using heuristics
-            recipe_data['name'] = self._extract_title(soup)
-            recipe_data['description'] = self._extract_description(soup)
-            recipe_data['ingredients'] = self._extract_ingredients(soup)
-            recipe_data['method'] = self._extract_method(soup)
-            recipe_data['image_url'] = self._extract_image(soup)
+            soup = BeautifulSoup(content, 'lxml', parse_only=HEURISTIC_STRAINER)
+            recipe_data.update(self._extract_all(soup))
             
             return recipe_data if recipe_data['name'] else None
             
@@ -160,64 +369,100 @@ class RecipeParser:
         # TODO: Implement Facebook Graph API integration or Selenium-based scraping
         return recipe_data
     
-    def _extract_title(self, soup: BeautifulSoup) -> Optional[str]:
-        """Extract recipe title using heuristics"""
-        # Try h1 first
-        h1 = soup.find('h1')
-        if h1:
-            return h1.get_text().strip()
-        
-        # Try title tag
-        title = soup.find('title')
-        if title:
-            return title.get_text().strip()
+    def _extract_all(self, soup: BeautifulSoup) -> Dict:
+        """
+        Extract title, description, ingredients, method and image in one pass
         
-        return None
-    
-    def _extract_description(self, soup: BeautifulSoup) -> Optional[str]:
-        """Extract recipe description"""
-        # Try meta description
-        meta_desc = soup.find('meta', attrs={'name': 'description'})
-        if meta_desc and meta_desc.get('content'):
-            return meta_desc['content'].strip()
+        Walks the tree once and dispatches on tag name instead of running a
+        separate find/find_all per field. Precedence is unchanged: h1 before
+        <title>, meta description before the first paragraph, og:image before
+        a 'recipe' image before the first image.
+        """
+        h1 = title = meta_desc = og_image = first_p = None
+        first_image = recipe_image = None  # First <img> src, first src mentioning 'recipe'
+        seen_image = False
+        ingredients = []
+        steps = []
         
-        # Try first paragraph
-        paragraphs = soup.find_all('p')
-        if paragraphs:
-            return paragraphs[0].get_text().strip()
+        for tag in soup.find_all(True):
+            name = tag.name
+            if name == 'h1':
+                if h1 is None:
+                    h1 = tag
+            elif name == 'title':
+                if title is None:
+                    title = tag
+            elif name == 'meta':
+                if meta_desc is None and tag.get('name') == 'description':
+                    meta_desc = tag
+                if og_image is None and tag.get('property') == 'og:image':
+                    og_image = tag
+            elif name == 'p':
+                if first_p is None:
+                    first_p = tag
+            elif name == 'img' and recipe_image is None:
+                src = tag.get('src') or tag.get('data-src')
+                if not seen_image:
+                    first_image, seen_image = src, True
+                if src and 'recipe' in src.lower():
+                    recipe_image = src
+            
+            if name not in ('ul', 'ol', 'div'):
+                continue
+            classes = ' '.join(tag.get('class') or ())
+            
+            # Ingredient lists: parse quantity, unit and name from each item
+            if name != 'div' and _INGREDIENT_CLASS_RE.search(classes):
+                for item in tag.find_all('li'):
+                    text = item.get_text().strip()
+                    if text:
+                        ingredients.append(self._parse_ingredient_line(text))
+            
+            # Method/instruction containers
+            if name != 'ul' and _METHOD_CLASS_RE.search(classes):
+                for item in tag.find_all(['li', 'p']):
+                    # Join the pieces so markup indentation and <br> runs collapse to single spaces
+                    text = ' '.join(item.stripped_strings)
+                    if len(text) > 20:  # Filter out short text
+                        steps.append(text)
         
-        return None
-    
-    def _extract_ingredients(self, soup: BeautifulSoup) -> List[Dict]:
-        """Extract ingredients list"""
-        ingredients = []
+        if h1 is not None:
+            recipe_name = h1.get_text().strip()
+        else:
+            recipe_name = title.get_text().strip() if title is not None else None
         
-        # Common ingredient list selectors
-        ingredient_containers = soup.find_all(['ul', 'ol'], class_=re.compile(r'ingredient', re.I))
+        if meta_desc is not None and meta_desc.get('content'):
+            description = meta_desc['content'].strip()
+        else:
+            description = first_p.get_text().strip() if first_p is not None else None
         
-        for container in ingredient_containers:
-            items = container.find_all('li')
-            for item in items:
-                text = item.get_text().strip()
-                if text:
-                    # Try to parse quantity, unit, and ingredient name
-                    parsed = self._parse_ingredient_line(text)
-                    ingredients.append(parsed)
+        # Open Graph image, else the first 'recipe' image, else the first image
+        if og_image is not None and og_image.get('content'):
+            image_url = og_image['content']
+        else:
+            image_url = recipe_image or first_image
         
-        return ingredients
+        return {
+            'name': recipe_name,
+            'description': description,
+            'ingredients': ingredients,
+            'method': '\n\n'.join(steps) if steps else None,
+            'image_url': image_url
+        }
     
     def _parse_ingredient_line(self, line: str) -> Dict:
         """Parse an ingredient line into components"""
         # Simple regex to extract quantity and unit
         # Example: "2 cups flour" -> quantity: 2, unit: cups, name: flour
         
-        match = re.match(r'(\d+(?:\.\d+)?(?:/\d+)?)\s*([a-zA-Z]+)?\s+(.+)', line)
+        # The pattern needs a leading digit; skip it for text-only lines like "salt to taste"
+        match = _INGREDIENT_LINE_RE.match(line) if line[:1].isdigit() else None
         
         if match:
             quantity, unit, name = match.groups()
             return {
                 'quantity': quantity,
-                'unit': unit or '',
+                'unit': _canonical_unit(unit) if unit else '',
                 'name': name.strip(),
                 'notes': ''
             }
@@ -229,45 +474,10 @@ class RecipeParser:
                 'notes': ''
             }
     
-    def _extract_method(self, soup: BeautifulSoup) -> Optional[str]:
-        """Extract cooking method/instructions"""
-        # Common method/instruction selectors
-        method_containers = soup.find_all(['ol', 'div'], class_=re.compile(r'(instruction|method|direction|step)', re.I))
-        
-        steps = []
-        for container in method_containers:
-            items = container.find_all(['li', 'p'])
-            for item in items:
-                text = item.get_text().strip()
-                if text and len(text) > 20:  # Filter out short text
-                    steps.append(text)
-        
-        return '\n\n'.join(steps) if steps else None
-    
-    def _extract_image(self, soup: BeautifulSoup) -> Optional[str]:
-        """Extract recipe image URL"""
-        # Try Open Graph image
-        og_image = soup.find('meta', property='og:image')
-        if og_image and og_image.get('content'):
-            return og_image['content']
-        
-        # Try first large image
-        images = soup.find_all('img')
-        for img in images:
-            src = img.get('src') or img.get('data-src')
-            if src and 'recipe' in src.lower():
-                return src
-        
-        # Return first image if nothing else found
-        if images:
-            return images[0].get('src') or images[0].get('data-src')
-        
-        return None
-    
     def parse_manual_recipe(self, recipe_text: str) -> Dict:
         """Parse a manually pasted recipe text"""
         # Simple text-based parsing for copy-pasted recipes
-        lines = recipe_text.strip().split('\n')
+        lines = recipe_text.strip().splitlines()
         
         recipe_data = {
             'source_url': None,
@@ -289,13 +499,12 @@ class RecipeParser:
             if not line:
                 continue
             
-            lower_line = line.lower()
-            if 'ingredient' in lower_line:
-                current_section = 'ingredients'
-                continue
-            elif any(word in lower_line for word in ['method', 'instruction', 'direction', 'step']):
-                current_section = 'method'
-                continue
+            # Only short lines starting like a header word reach the regex
+            if len(line) < SECTION_HEADER_MAX_LEN and line[0] in _SECTION_INITIALS:
+                header = _SECTION_RE.match(line)
+                if header:
+                    current_section = 'ingredients' if header.group(1).lower() == 'ingredient' else 'method'
+                    continue
             
             if current_section == 'ingredients':
                 ingredients_lines.append(line)
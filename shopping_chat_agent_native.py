@@ -5,15 +5,234 @@ No LangChain dependency needed!
 """
 
 import anthropic
-import json
 import os
-from typing import Dict, List, Optional
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
 from prompt_manager import get_prompt_manager
 
+try:
+    # orjson: C decoder for the model's JSON replies, raises a ValueError subclass
+    import orjson as json
+except ImportError:
+    import json
+
+# Conversation turns (user + assistant message pairs) kept for context
+MAX_HISTORY_TURNS = 10
+# Rough prompt-token budget for replayed history (~4 chars per token)
+HISTORY_TOKEN_BUDGET = 6000
+# Facts kept from evicted turns for the "Prior context" summary
+MAX_SUMMARY_LINES = 40
+# Prompt-caching breakpoint: everything up to and including the marked block is cached
+CACHE_CONTROL = {"type": "ephemeral"}
+# Concurrent product-detail lookups when saving several preferred products at once
+PREFERRED_LOOKUP_MAX_WORKERS = 8
+# Reply budget: short requests get the smaller cap unless they ask for something long
+MAX_REPLY_TOKENS = 2048
+SHORT_REPLY_MAX_TOKENS = 1024
+SHORT_MESSAGE_CHARS = 80
+_LONG_REPLY_WORDS = ("list", "show", "all", "optimize", "summary", "recipe", "ingredients", "suggest", "plan")
+# Leading ```/```json and trailing ``` markdown fences around a JSON reply
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+# Stand-in for {list_text} used to split the system template into static and live parts
+_LIST_TEXT_MARKER = "\x00list_text\x00"
+
+
+def _estimate_tokens(message: Dict) -> int:
+    """Cheap token estimate for a history message (chars / 4)"""
+    return len(str(message["content"])) // 4
+
+
+def _summarize_tool_call(name: str, tool_input: Dict) -> Optional[str]:
+    """One-line fact recording what an evicted tool call did, if worth keeping"""
+    if name == "add_items":
+        names = [item.get("name", "") for item in tool_input.get("items", [])]
+        return f"added: {', '.join(names)}" if names else None
+    if name == "remove_items":
+        names = tool_input.get("item_names", [])
+        return f"removed: {', '.join(names)}" if names else None
+    if name == "modify_quantity":
+        return f"quantity: {tool_input.get('item_name')}→{tool_input.get('new_quantity')}"
+    if name == "set_preferred_product":
+        return f"set preferred: {tool_input.get('ingredient')}→{tool_input.get('stockcode')}"
+    if name == "remove_preferred_product":
+        return f"removed preferred: {tool_input.get('ingredient')}"
+    return None
+
+
+# Tools Claude can use; one shared, read-only schema list for every agent
+TOOLS = [
+    {
+        "name": "add_items",
+        "description": "Add one or more items to the shopping list",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "items": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {"type": "string", "description": "Item name"},
+                            "quantity": {"type": "string", "description": "Quantity (e.g., '2', '500g', '1L')"},
+                            "category": {"type": "string", "description": "Category (Fresh Produce, Dairy & Eggs, Meat & Protein, Pantry Staples, Frozen, Bakery, Other)"}
+                        },
+                        "required": ["name", "quantity", "category"]
+                    }
+                }
+            },
+            "required": ["items"]
+        }
+    },
+    {
+        "name": "remove_items",
+        "description": "Remove items from the shopping list",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "item_names": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Names of items to remove"
+                }
+            },
+            "required": ["item_names"]
+        }
+    },
+    {
+        "name": "modify_quantity",
+        "description": "Change the quantity of an item",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "item_name": {"type": "string", "description": "Name of the item"},
+                "new_quantity": {"type": "string", "description": "New quantity"}
+            },
+            "required": ["item_name", "new_quantity"]
+        }
+    },
+    {
+        "name": "search_woolworths",
+        "description": "Search for products in Woolworths catalog",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Search term"},
+                "category": {"type": "string", "description": "Optional category filter"}
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "set_preferred_product",
+        "description": "Set or update a preferred Woolworths product for an ingredient. Saves permanently to user preferences.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "ingredient": {"type": "string", "description": "Ingredient name (e.g., 'greek yogurt', 'bananas')"},
+                "stockcode": {"type": "integer", "description": "Woolworths stockcode"},
+                "fallback_stockcodes": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "description": "Optional list of fallback stockcodes if primary is unavailable"
+                }
+            },
+            "required": ["ingredient", "stockcode"]
+        }
+    },
+    {
+        "name": "get_preferred_products",
+        "description": "Get all saved preferred products for the user",
+        "input_schema": {
+            "type": "object",
+            "properties": {},
+            "required": []
+        }
+    },
+    {
+        "name": "remove_preferred_product",
+        "description": "Remove a preferred product preference",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "ingredient": {"type": "string", "description": "Ingredient name to remove preference for"}
+            },
+            "required": ["ingredient"]
+        }
+    }
+]
+# The tool schemas never change, so cache them as part of the prompt prefix.
+# Claude 3 Haiku only caches prefixes of 2048+ tokens and silently ignores
+# shorter breakpoints: the tools (2.5k chars) plus the static system text
+# (2.5k chars) come to about 1.2k tokens, so this breakpoint and the static
+# one are inactive on their own. The stable-list breakpoint crosses the
+# minimum once the list adds ~850 tokens (about 150 items at ~21 chars each).
+TOOLS[-1]["cache_control"] = CACHE_CONTROL
+
+
+def _estimate_max_tokens(user_message: str) -> int:
+    """Output-token cap for a reply to user_message"""
+    if len(user_message) < SHORT_MESSAGE_CHARS:
+        lowered = user_message.lower()
+        if not any(word in lowered for word in _LONG_REPLY_WORDS):
+            return SHORT_REPLY_MAX_TOKENS
+    return MAX_REPLY_TOKENS
+
+
+def _item_name(item) -> str:
+    """Display name of a shopping list entry (dict or plain string)"""
+    if isinstance(item, dict):
+        return item.get('item', item.get('name', ''))
+    return str(item)
+
+
+def _format_list_item(item) -> str:
+    """One '  - name (qty) - notes' line of the formatted shopping list"""
+    if not isinstance(item, dict):
+        return f"  - {item}"
+    if 'item' in item:
+        name = item['item']
+    elif 'name' in item:
+        name = item['name']
+    else:
+        name = item.get('ingredient_name', 'Unknown')
+    qty = item.get('quantity')
+    notes = item.get('notes')
+    return f"  - {name}{f' ({qty})' if qty else ''}{f' - {notes}' if notes else ''}"
+
+
+def _normalize_name(name: str) -> str:
+    """Case- and whitespace-insensitive key for matching item names"""
+    return name.strip().casefold()
+
+
+def _find_item(name_index: Dict, removed: set, item_name: str, dicts_only: bool = False):
+    """
+    First live (category, item) entry matching item_name, or None
+    
+    Exact (normalized) names are a dict lookup; only when there is none does
+    it fall back to the old substring match, scanning names in list order.
+    """
+    key = _normalize_name(item_name)
+    candidates = name_index.get(key, ())
+    if not any(id(item) not in removed for _, item in candidates):
+        candidates = (
+            entry
+            for name, entries in name_index.items() if key in name
+            for entry in entries
+        )
+    for category, item in candidates:
+        if id(item) not in removed and (not dicts_only or isinstance(item, dict)):
+            return category, item
+    return None
+
 
 class ShoppingListChatAgent:
     """AI Chat Agent using Claude's native tool use capabilities"""
     
+    tools = TOOLS
+    
     def __init__(self):
         api_key = os.getenv('ANTHROPIC_API_KEY')
         if not api_key:
@@ -25,109 +244,15 @@ class ShoppingListChatAgent:
             max_retries=2  # Retry on failures
         )
         self.model = "claude-3-haiku-20240307"
-        self.conversation_history = []
-        
-        # Define tools that Claude can use
-        self.tools = [
-            {
-                "name": "add_items",
-                "description": "Add one or more items to the shopping list",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "items": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "name": {"type": "string", "description": "Item name"},
-                                    "quantity": {"type": "string", "description": "Quantity (e.g., '2', '500g', '1L')"},
-                                    "category": {"type": "string", "description": "Category (Fresh Produce, Dairy & Eggs, Meat & Protein, Pantry Staples, Frozen, Bakery, Other)"}
-                                },
-                                "required": ["name", "quantity", "category"]
-                            }
-                        }
-                    },
-                    "required": ["items"]
-                }
-            },
-            {
-                "name": "remove_items",
-                "description": "Remove items from the shopping list",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "item_names": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "Names of items to remove"
-                        }
-                    },
-                    "required": ["item_names"]
-                }
-            },
-            {
-                "name": "modify_quantity",
-                "description": "Change the quantity of an item",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "item_name": {"type": "string", "description": "Name of the item"},
-                        "new_quantity": {"type": "string", "description": "New quantity"}
-                    },
-                    "required": ["item_name", "new_quantity"]
-                }
-            },
-            {
-                "name": "search_woolworths",
-                "description": "Search for products in Woolworths catalog",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "query": {"type": "string", "description": "Search term"},
-                        "category": {"type": "string", "description": "Optional category filter"}
-                    },
-                    "required": ["query"]
-                }
-            },
-            {
-                "name": "set_preferred_product",
-                "description": "Set or update a preferred Woolworths product for an ingredient. Saves permanently to user preferences.",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "ingredient": {"type": "string", "description": "Ingredient name (e.g., 'greek yogurt', 'bananas')"},
-                        "stockcode": {"type": "integer", "description": "Woolworths stockcode"},
-                        "fallback_stockcodes": {
-                            "type": "array",
-                            "items": {"type": "integer"},
-                            "description": "Optional list of fallback stockcodes if primary is unavailable"
-                        }
-                    },
-                    "required": ["ingredient", "stockcode"]
-                }
-            },
-            {
-                "name": "get_preferred_products",
-                "description": "Get all saved preferred products for the user",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {},
-                    "required": []
-                }
-            },
-            {
-                "name": "remove_preferred_product",
-                "description": "Remove a preferred product preference",
-                "input_schema": {
-                    "type": "object",
-                    "properties": {
-                        "ingredient": {"type": "string", "description": "Ingredient name to remove preference for"}
-                    },
-                    "required": ["ingredient"]
-                }
-            }
-        ]
+        # Tool-call helpers, created on first use
+        self._matcher = None
+        self._preferences_manager = None
+        # Trimmed (and summarized) by _trim_history rather than a deque maxlen,
+        # so no turn is evicted without its facts reaching the summary
+        self.conversation_history = deque()
+        self._summary_lines = deque(maxlen=MAX_SUMMARY_LINES)
+        self._rolling_summary = ""
+        self._last_live_text = None  # List block sent on the previous turn
     
     def chat(self, user_message: str, current_shopping_list: Dict) -> Dict:
         """
@@ -140,32 +265,59 @@ class ShoppingListChatAgent:
         Returns:
             Dict with response and any actions taken
         """
+        result = None
+        for event in self.chat_stream(user_message, current_shopping_list):
+            if "result" in event:
+                result = event["result"]
+        return result
+    
+    def chat_stream(self, user_message: str, current_shopping_list: Dict) -> Iterator[Dict]:
+        """
+        Process user message, streaming Claude's reply as it is generated
+        
+        Args:
+            user_message: User's message
+            current_shopping_list: Current shopping list by category
+            
+        Yields:
+            {"delta": text} for each chunk of reply text, then a single
+            {"result": Dict} shaped exactly like chat()'s return value
+        """
         
         print(f"🤖 Chat request: '{user_message}'")
         print(f"📋 Shopping list categories: {len(current_shopping_list)} categories")
         
+        # Trim first so turns evicted now are already in the summary the system message carries
+        self._trim_history()
+        
         # Build system message with current list context
         system_message = self._build_system_message(current_shopping_list)
-        print(f"📝 System message length: {len(system_message)} chars")
+        print(f"📝 System message length: {sum(len(block['text']) for block in system_message)} chars")
         
-        # Build messages array
-        messages = self.conversation_history + [
+        # Build messages array from the trimmed history window
+        messages = list(self.conversation_history) + [
             {"role": "user", "content": user_message}
         ]
         
         try:
-            # Call Claude with tool use
+            # Call Claude with tool use; text is forwarded as it arrives
             print(f"🔄 Calling Claude API (model: {self.model})...")
-            response = self.client.messages.create(
+            with self.client.messages.stream(
                 model=self.model,
-                max_tokens=2048,
+                max_tokens=_estimate_max_tokens(user_message),
                 system=system_message,
                 tools=self.tools,
                 messages=messages
-            )
-            print(f"✅ Claude API responded (stop_reason: {response.stop_reason})")
+            ) as stream:
+                for text in stream.text_stream:
+                    yield {"delta": text}
+                response = stream.get_final_message()
+            usage = response.usage
+            print(f"✅ Claude API responded (stop_reason: {response.stop_reason}, "
+                  f"cache read {getattr(usage, 'cache_read_input_tokens', 0) or 0} / "
+                  f"written {getattr(usage, 'cache_creation_input_tokens', 0) or 0} tokens)")
             
-            # Process response
+            # Process response (tool calls are only complete once the stream ends)
             result = self._process_response(response, current_shopping_list)
             print(f"📤 Response action: {result.get('action', 'none')}")
             
@@ -176,76 +328,123 @@ class ShoppingListChatAgent:
                 "content": response.content
             })
             
-            return result
-            
         except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"Chat error: {e}")
-            print(error_trace)
-            
-            # Provide more specific error messages
-            error_message = "I encountered an error. "
-            
-            if "rate_limit" in str(e).lower():
-                error_message += "API rate limit reached. Please wait a moment and try again."
-            elif "timeout" in str(e).lower():
-                error_message += "Request timed out. Please try again."
-            elif "authentication" in str(e).lower() or "api_key" in str(e).lower():
-                error_message += "API authentication issue. Please check your API key."
-            elif "firestore" in str(e).lower() or "database" in str(e).lower():
-                error_message += "Database connection issue. Your message was received but couldn't be saved."
-            elif "tool" in str(e).lower() and "input" in str(e).lower():
-                error_message += "Invalid tool parameters. Could you rephrase your request?"
-            else:
-                # Include error type for debugging
-                error_type = type(e).__name__
-                error_message += f"({error_type}: {str(e)[:100]}...)" if len(str(e)) > 100 else f"({error_type}: {str(e)})"
-            
-            return {
-                "response": error_message,
-                "action": "none",
-                "changes_made": None,
-                "error": str(e)
-            }
+            result = self._error_result(e)
+        
+        yield {"result": result}
+    
+    def _error_result(self, e: Exception) -> Dict:
+        """Log a chat failure and build a user-facing error result"""
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"Chat error: {e}")
+        print(error_trace)
+        
+        # Provide more specific error messages
+        error_message = "I encountered an error. "
+        error_text = str(e)
+        lowered = error_text.lower()
+        
+        if "rate_limit" in lowered:
+            error_message += "API rate limit reached. Please wait a moment and try again."
+        elif "timeout" in lowered:
+            error_message += "Request timed out. Please try again."
+        elif "authentication" in lowered or "api_key" in lowered:
+            error_message += "API authentication issue. Please check your API key."
+        elif "firestore" in lowered or "database" in lowered:
+            error_message += "Database connection issue. Your message was received but couldn't be saved."
+        elif "tool" in lowered and "input" in lowered:
+            error_message += "Invalid tool parameters. Could you rephrase your request?"
+        else:
+            # Include error type for debugging
+            error_type = type(e).__name__
+            error_message += f"({error_type}: {error_text[:100]}...)" if len(error_text) > 100 else f"({error_type}: {error_text})"
+        
+        return {
+            "response": error_message,
+            "action": "none",
+            "changes_made": None,
+            "error": error_text
+        }
     
-    def _build_system_message(self, shopping_list: Dict) -> str:
-        """Build system message with shopping list context"""
+    def _trim_history(self, budget_tokens: int = HISTORY_TOKEN_BUDGET):
+        """
+        Drop the oldest turns until the history fits the turn and token limits
+        
+        History is stored as user/assistant pairs, so turns are evicted a
+        pair at a time and an assistant tool_use is never left without the
+        user message that prompted it. Tool calls in evicted turns are kept
+        as one-line facts in the rolling summary instead of being lost.
+        """
+        history = self.conversation_history
+        total = sum(_estimate_tokens(message) for message in history)
+        evicted = False
+        while history and (len(history) > 2 * MAX_HISTORY_TURNS or total > budget_tokens):
+            for _ in range(2):
+                if history:
+                    message = history.popleft()
+                    total -= _estimate_tokens(message)
+                    self._summarize_evicted(message)
+            evicted = True
+        
+        if evicted:
+            self._rolling_summary = "\n".join(self._summary_lines)
+    
+    def _summarize_evicted(self, message: Dict):
+        """Record the tool calls of an evicted assistant message as summary facts"""
+        if message["role"] != "assistant" or isinstance(message["content"], str):
+            return
+        for block in message["content"]:
+            if getattr(block, "type", None) == "tool_use":
+                fact = _summarize_tool_call(block.name, block.input)
+                if fact:
+                    self._summary_lines.append(fact)
+    
+    def _build_system_message(self, shopping_list: Dict) -> List[Dict]:
+        """
+        Build system message blocks with shopping list context
+        
+        The template text before {list_text} is identical on every turn, so
+        it goes in its own block with a cache breakpoint; the list and
+        whatever follows it come after it. When the list block is unchanged
+        since the last turn it gets a breakpoint too, so a stable list is
+        read from the prompt cache instead of billed again.
+        """
         list_text = self._format_shopping_list(shopping_list)
+        if self._rolling_summary:
+            # Facts from turns that fell out of the history window
+            list_text = f"Prior context:\n{self._rolling_summary}\n\n{list_text}"
         
         # Load prompt from prompt manager
         pm = get_prompt_manager()
-        return pm.get_prompt("shopping_chat_assistant.system_template", list_text=list_text)
+        template = pm.get_prompt("shopping_chat_assistant.system_template", list_text=_LIST_TEXT_MARKER)
+        static_text, found, tail = template.partition(_LIST_TEXT_MARKER)
+        live_text = list_text + tail if found else ""
+        
+        blocks = []
+        if static_text:
+            blocks.append({"type": "text", "text": static_text, "cache_control": CACHE_CONTROL})
+        if live_text:
+            live_block = {"type": "text", "text": live_text}
+            if live_text == self._last_live_text:
+                live_block["cache_control"] = CACHE_CONTROL
+            blocks.append(live_block)
+        self._last_live_text = live_text
+        return blocks
     
     def _format_shopping_list(self, shopping_list: Dict) -> str:
         """Format shopping list for display"""
         if not shopping_list:
             return "Shopping list is empty."
         
-        lines = []
-        total_items = 0
-        
-        for category, items in shopping_list.items():
-            if items:
-                lines.append(f"\n{category}:")
-                for item in items:
-                    if isinstance(item, dict):
-                        name = item.get('item', item.get('name', item.get('ingredient_name', 'Unknown')))
-                        qty = item.get('quantity', '')
-                        notes = item.get('notes', '')
-                        item_text = f"  - {name}"
-                        if qty:
-                            item_text += f" ({qty})"
-                        if notes:
-                            item_text += f" - {notes}"
-                        lines.append(item_text)
-                        total_items += 1
-                    else:
-                        lines.append(f"  - {item}")
-                        total_items += 1
+        def lines():
+            yield f"Total items: {sum(len(items) for items in shopping_list.values() if items)}"
+            for category, items in shopping_list.items():
+                if items:
+                    yield f"\n{category}:"
+                    yield from map(_format_list_item, items)
         
-        lines.insert(0, f"Total items: {total_items}")
-        return "\n".join(lines)
+        return "\n".join(lines())
     
     def _process_response(self, response, current_shopping_list: Dict) -> Dict:
         """Process Claude's response and execute any tool calls"""
@@ -273,6 +472,16 @@ class ShoppingListChatAgent:
         updated_list = current_shopping_list.copy()
         action_type = "none"
         
+        # Normalized name -> [(category, item), ...] in list order, built once per
+        # response; removals are recorded by id and applied after all tool calls
+        name_index = {}
+        for category, items in updated_list.items():
+            for item in items or ():
+                name_index.setdefault(_normalize_name(_item_name(item)), []).append((category, item))
+        removed_ids = set()
+        # (changes index, ingredient, stockcode, fallback stockcodes) awaiting one batched write
+        pending_preferences = []
+        
         for tool_call in tool_calls:
             tool_name = tool_call.name
             tool_input = tool_call.input
@@ -281,48 +490,32 @@ class ShoppingListChatAgent:
                 action_type = "add"
                 for item in tool_input.get("items", []):
                     category = item.get("category", "Other")
-                    if category not in updated_list:
-                        updated_list[category] = []
-                    
-                    updated_list[category].append({
+                    new_item = {
                         "item": item["name"],
                         "quantity": item.get("quantity", ""),
                         "notes": ""
-                    })
+                    }
+                    updated_list.setdefault(category, []).append(new_item)
+                    name_index.setdefault(_normalize_name(item["name"]), []).append((category, new_item))
                     changes.append(f"Added {item['name']} to {category}")
             
             elif tool_name == "remove_items":
                 action_type = "remove"
                 for item_name in tool_input.get("item_names", []):
-                    removed = False
-                    for category, items in updated_list.items():
-                        for i, item in enumerate(items):
-                            if isinstance(item, dict):
-                                name = item.get('item', item.get('name', '')).lower()
-                            else:
-                                name = str(item).lower()
-                            
-                            if item_name.lower() in name:
-                                items.pop(i)
-                                changes.append(f"Removed {item_name}")
-                                removed = True
-                                break
-                        if removed:
-                            break
+                    found = _find_item(name_index, removed_ids, item_name)
+                    if found:
+                        removed_ids.add(id(found[1]))
+                        changes.append(f"Removed {item_name}")
             
             elif tool_name == "modify_quantity":
                 action_type = "modify"
                 item_name = tool_input.get("item_name")
                 new_qty = tool_input.get("new_quantity")
                 
-                for category, items in updated_list.items():
-                    for item in items:
-                        if isinstance(item, dict):
-                            name = item.get('item', item.get('name', '')).lower()
-                            if item_name.lower() in name:
-                                item['quantity'] = new_qty
-                                changes.append(f"Changed {item_name} quantity to {new_qty}")
-                                break
+                found = _find_item(name_index, removed_ids, item_name, dicts_only=True)
+                if found:
+                    found[1]['quantity'] = new_qty
+                    changes.append(f"Changed {item_name} quantity to {new_qty}")
             
             elif tool_name == "search_woolworths":
                 # This would integrate with your Woolworths MCP
@@ -336,43 +529,23 @@ class ShoppingListChatAgent:
                 stockcode = tool_input.get("stockcode")
                 fallback_codes = tool_input.get("fallback_stockcodes", [])
                 
-                # Actually save to Firestore
+                # Queued and saved to Firestore in one batch; the change message
+                # is filled in at this position once the batch is written
                 try:
-                    from preferred_products_manager import get_preferred_products_manager
-                    from shopping_list_matcher import ShoppingListMatcher
-                    
-                    manager = get_preferred_products_manager()
-                    
-                    # Get product details from Woolworths
-                    matcher = ShoppingListMatcher(use_preferences=False)
-                    product_details = matcher.get_product_details(str(stockcode))
-                    
-                    if product_details:
-                        success = manager.set_preferred_product(
-                            ingredient_name=ingredient,
-                            stockcode=int(stockcode),
-                            product_name=product_details.get('display_name', ''),
-                            price=product_details.get('price', 0),
-                            image_url=product_details.get('imageUrl', ''),
-                            fallback_stockcodes=[int(code) for code in fallback_codes] if fallback_codes else []
-                        )
-                        
-                        if success:
-                            fallback_text = f" with {len(fallback_codes)} fallback(s)" if fallback_codes else ""
-                            changes.append(f"✅ Saved preference: {ingredient} → {product_details.get('display_name', stockcode)}{fallback_text}")
-                        else:
-                            changes.append(f"❌ Failed to save preference for {ingredient}")
-                    else:
-                        changes.append(f"❌ Could not find product details for stockcode {stockcode}")
-                        
+                    pending_preferences.append((
+                        len(changes), ingredient, int(stockcode),
+                        [int(code) for code in fallback_codes] if fallback_codes else []
+                    ))
+                    changes.append(None)
                 except Exception as e:
                     changes.append(f"❌ Error saving preference: {str(e)}")
             
             elif tool_name == "get_preferred_products":
                 action_type = "get_preferred"
+                # Earlier set_preferred_product calls must be visible to the listing
+                self._save_preferred_products(pending_preferences, changes)
                 try:
-                    from preferred_products_manager import get_preferred_products_manager
-                    manager = get_preferred_products_manager()
+                    manager = self._get_preferences_manager()
                     prefs = manager.list_all_preferences()
                     
                     if prefs:
@@ -389,9 +562,9 @@ class ShoppingListChatAgent:
             elif tool_name == "remove_preferred_product":
                 action_type = "remove_preferred"
                 ingredient = tool_input.get("ingredient")
+                self._save_preferred_products(pending_preferences, changes)
                 try:
-                    from preferred_products_manager import get_preferred_products_manager
-                    manager = get_preferred_products_manager()
+                    manager = self._get_preferences_manager()
                     success = manager.remove_preferred_product(ingredient)
                     
                     if success:
@@ -401,6 +574,13 @@ class ShoppingListChatAgent:
                 except Exception as e:
                     changes.append(f"❌ Error removing preference: {str(e)}")
         
+        self._save_preferred_products(pending_preferences, changes)
+        
+        if removed_ids:
+            for category, items in updated_list.items():
+                if items:
+                    updated_list[category] = [item for item in items if id(item) not in removed_ids]
+        
         return {
             "response": text_response or "I've updated your shopping list!",
             "action": action_type,
@@ -409,9 +589,76 @@ class ShoppingListChatAgent:
             "tool_calls": [{"name": tc.name, "input": tc.input} for tc in tool_calls]
         }
     
+    def _save_preferred_products(self, pending: List, changes: List):
+        """
+        Write queued set_preferred_product calls with one Firestore batch
+        
+        Product details for all queued stockcodes are looked up concurrently,
+        then every preference is saved with a single set_preferred_product_many
+        commit. Each call's change message replaces its placeholder in changes.
+        """
+        if not pending:
+            return
+        
+        try:
+            manager = self._get_preferences_manager()
+            matcher = self._get_matcher()
+            
+            # Get product details from Woolworths
+            stockcodes = [str(stockcode) for _, _, stockcode, _ in pending]
+            with ThreadPoolExecutor(max_workers=min(len(stockcodes), PREFERRED_LOOKUP_MAX_WORKERS)) as executor:
+                all_details = list(executor.map(matcher.get_product_details, stockcodes))
+            
+            preferences = []
+            found = []
+            for (index, ingredient, stockcode, fallback_codes), product_details in zip(pending, all_details):
+                if product_details:
+                    preferences.append({
+                        'ingredient_name': ingredient,
+                        'stockcode': stockcode,
+                        'product_name': product_details.get('display_name', ''),
+                        'price': product_details.get('price', 0),
+                        'image_url': product_details.get('imageUrl', ''),
+                        'fallback_stockcodes': fallback_codes
+                    })
+                    found.append((index, ingredient, stockcode, fallback_codes, product_details))
+                else:
+                    changes[index] = f"❌ Could not find product details for stockcode {stockcode}"
+            
+            success = bool(preferences) and manager.set_preferred_product_many(preferences) > 0
+            for index, ingredient, stockcode, fallback_codes, product_details in found:
+                if success:
+                    fallback_text = f" with {len(fallback_codes)} fallback(s)" if fallback_codes else ""
+                    changes[index] = f"✅ Saved preference: {ingredient} → {product_details.get('display_name', stockcode)}{fallback_text}"
+                else:
+                    changes[index] = f"❌ Failed to save preference for {ingredient}"
+        
+        except Exception as e:
+            for index, *_ in pending:
+                if changes[index] is None:
+                    changes[index] = f"❌ Error saving preference: {str(e)}"
+        
+        pending.clear()
+    
+    def _get_matcher(self):
+        """Product matcher reused across tool calls for this agent"""
+        if self._matcher is None:
+            from shopping_list_matcher import ShoppingListMatcher
+            self._matcher = ShoppingListMatcher(use_preferences=False)
+        return self._matcher
+    
+    def _get_preferences_manager(self):
+        """Preferred products manager reused across tool calls for this agent"""
+        if self._preferences_manager is None:
+            from preferred_products_manager import get_preferred_products_manager
+            self._preferences_manager = get_preferred_products_manager()
+        return self._preferences_manager
+    
     def reset_conversation(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self._summary_lines.clear()
+        self._rolling_summary = ""
 
 
 # Standalone function for simple optimization without tools
@@ -484,10 +731,7 @@ Rules:
         content = response.content[0].text.strip()
         
         # Clean markdown if present
-        if content.startswith('```json'):
-            content = content.replace('```json', '').replace('```', '').strip()
-        elif content.startswith('```'):
-            content = content.replace('```', '').strip()
+        content = _FENCE_RE.sub('', content)
         
         result = json.loads(content)
         
@@ -5,8 +5,78 @@ Searches Woolworths for each ingredient and matches to real products
 
 import requests
 import os
+import threading
+import time
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
 from typing import List, Dict, Optional
 
+# Concurrent product searches per shopping list (bounded to be polite to the MCP server)
+MATCH_MAX_WORKERS = 16
+
+# Product lookups remembered process-wide (prices/availability go stale, hence the TTL)
+PRODUCT_CACHE_SIZE = 4096
+PRODUCT_CACHE_TTL = 900.0
+# stockcode -> (cached_at, product details); search term -> (cached_at, top product)
+_product_details = OrderedDict()
+_search_results = OrderedDict()
+_product_cache_lock = threading.Lock()
+
+# Rules used by export_to_local_format
+_SEPARATOR = "=" * 80
+_SECTION_BREAK = f"\n{_SEPARATOR}"
+
+WOOLWORTHS_API_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+    'Accept': 'application/json'
+}
+
+
+@lru_cache(maxsize=1)
+def get_http_session() -> requests.Session:
+    """Shared HTTP session so Woolworths/MCP lookups reuse keep-alive TCP/TLS connections"""
+    session = requests.Session()
+    # Product lookups and searches are read-only, so POST is safe to retry too
+    retries = Retry(
+        total=2,
+        backoff_factor=0.2,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=['GET', 'POST'],
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _cache_get(cache: OrderedDict, key) -> Optional[Dict]:
+    """Fresh cached value for key, or None"""
+    with _product_cache_lock:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= PRODUCT_CACHE_TTL:
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return entry[1]
+
+
+def _cache_put(cache: OrderedDict, key, value: Dict):
+    """Store value for key, evicting the least recently used entry when full"""
+    with _product_cache_lock:
+        cache[key] = (time.monotonic(), value)
+        cache.move_to_end(key)
+        if len(cache) > PRODUCT_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
 class ShoppingListMatcher:
     """Matches shopping list ingredients to Woolworths products"""
     
@@ -14,6 +84,7 @@ class ShoppingListMatcher:
         self.mcp_url = mcp_url or os.getenv('WOOLWORTHS_MCP_URL', 'https://woolies-mcp-server-dk2j6ogx4a-uc.a.run.app')
         self.use_preferences = use_preferences
         self.preferences_manager = None
+        self.session = get_http_session()
         
         # Initialize preferences manager if enabled
         if self.use_preferences:
@@ -27,16 +98,16 @@ class ShoppingListMatcher:
     
     def get_product_details(self, stockcode: str) -> Optional[Dict]:
         """Get product details by stockcode from Woolworths using direct API"""
+        stockcode = str(stockcode)
+        cached = _cache_get(_product_details, stockcode)
+        if cached is not None:
+            return dict(cached)
+        
         try:
             # Call Woolworths API directly
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-                'Accept': 'application/json'
-            }
-            
-            response = requests.get(
+            response = self.session.get(
                 f'https://www.woolworths.com.au/apis/ui/products/{stockcode}',
-                headers=headers,
+                headers=WOOLWORTHS_API_HEADERS,
                 timeout=10
             )
             
@@ -50,7 +121,7 @@ class ShoppingListMatcher:
                 print(f"No product data for stockcode {stockcode}")
                 return None
             
-            return {
+            details = {
                 'name': product.get('Name', ''),
                 'display_name': product.get('DisplayName', ''),
                 'stockcode': product.get('Stockcode', stockcode),
@@ -61,6 +132,8 @@ class ShoppingListMatcher:
                 'isOrganic': 'organic' in product.get('Name', '').lower(),
                 'isAvailable': product.get('IsAvailable', True)
             }
+            _cache_put(_product_details, stockcode, details)
+            return dict(details)
             
         except Exception as e:
             print(f"Error getting product details for {stockcode}: {e}")
@@ -138,23 +211,8 @@ class ShoppingListMatcher:
                         print(f"⚠️ Preferred product unavailable, no fallbacks specified, searching...")
             
             # Fall back to search if no preference or preference not available
-            response = requests.post(
-                f'{self.mcp_url}/api/search',
-                json={'searchTerm': search_query, 'pageSize': 3},
-                timeout=10
-            )
-            
-            if response.status_code != 200:
-                return None
-            
-            data = response.json()
-            if not data.get('success') or not data.get('products'):
-                return None
-            
-            first_result = data['products'][0]
-            if 'Products' in first_result and len(first_result['Products']) > 0:
-                product = first_result['Products'][0]
-                
+            product = self._search_catalog(search_query)
+            if product:
                 return {
                     'ingredient': ingredient,
                     'quantity': quantity,
@@ -177,32 +235,67 @@ class ShoppingListMatcher:
             print(f"Error searching for {ingredient}: {e}")
             return None
     
+    def _search_catalog(self, search_query: str) -> Optional[Dict]:
+        """Top Woolworths search result for a term via the MCP server (cached)"""
+        cached = _cache_get(_search_results, search_query)
+        if cached is not None:
+            return cached
+        
+        response = self.session.post(
+            f'{self.mcp_url}/api/search',
+            json={'searchTerm': search_query, 'pageSize': 3},
+            timeout=10
+        )
+        
+        if response.status_code != 200:
+            return None
+        
+        data = response.json()
+        if not data.get('success') or not data.get('products'):
+            return None
+        
+        first_result = data['products'][0]
+        if 'Products' in first_result and len(first_result['Products']) > 0:
+            product = first_result['Products'][0]
+            _cache_put(_search_results, search_query, product)
+            return product
+        
+        return None
+    
+    def _search_item(self, item: Dict) -> Optional[Dict]:
+        """Search for one shopping list item (worker for match_shopping_list)"""
+        ingredient = item.get('ingredient_name') or item.get('name', '')
+        return self.search_product(ingredient, str(item.get('quantity', '')), item.get('unit', ''))
+    
     def match_shopping_list(self, shopping_list_items: List[Dict]) -> Dict:
         """Match all items in shopping list to Woolworths products
         
         NOTE: Assumes the shopping list has already been optimized by AI.
         No duplicate detection or substitutions here - AI should have handled that.
+        
+        Searches run concurrently, so a list costs roughly its slowest lookup
+        rather than the sum; results keep the shopping list's order.
         """
         matched_items = []
         unmatched_items = []
-        total_cost = 0.0
         
-        for item in shopping_list_items:
+        if shopping_list_items:
+            with ThreadPoolExecutor(max_workers=min(len(shopping_list_items), MATCH_MAX_WORKERS)) as executor:
+                results = list(executor.map(self._search_item, shopping_list_items))
+        else:
+            results = []
+        
+        for item, matched in zip(shopping_list_items, results):
             ingredient = item.get('ingredient_name') or item.get('name', '')
             quantity = item.get('quantity', '')
             unit = item.get('unit', '')
             category = item.get('category', 'Other')
             
-            matched = self.search_product(ingredient, str(quantity), unit)
-            
             if matched:
                 matched['category'] = category
                 matched['original_quantity'] = quantity
                 matched['original_unit'] = unit
                 matched_items.append(matched)
-                # Handle None prices
-                price = matched.get('price') or 0
-                total_cost += price
             else:
                 unmatched_items.append({
                     'ingredient': ingredient,
@@ -212,60 +305,60 @@ class ShoppingListMatcher:
                     'matched': False
                 })
         
+        # Handle None prices
+        total_cost = sum((matched.get('price') or 0 for matched in matched_items), 0.0)
+        total_matched = len(matched_items)
+        total_items = len(shopping_list_items)
+        
         return {
             'matched_items': matched_items,
             'unmatched_items': unmatched_items,
-            'total_matched': len(matched_items),
+            'total_matched': total_matched,
             'total_unmatched': len(unmatched_items),
-            'total_items': len(shopping_list_items),
+            'total_items': total_items,
             'estimated_cost': total_cost,
-            'match_rate': len(matched_items) / len(shopping_list_items) * 100 if shopping_list_items else 0
+            'match_rate': total_matched / total_items * 100 if total_items else 0
         }
     
     def export_to_local_format(self, match_results: Dict) -> str:
         """Export matched products to a simple text format"""
-        output = []
-        output.append("=" * 80)
-        output.append("WOOLWORTHS SHOPPING LIST - MATCHED PRODUCTS")
-        output.append("=" * 80)
-        output.append(f"Match Rate: {match_results['match_rate']:.1f}%")
-        output.append(f"Total Cost: ${match_results['estimated_cost']:.2f}")
-        output.append("")
-        
-        categories = {}
-        for item in match_results['matched_items']:
-            cat = item['category']
-            if cat not in categories:
-                categories[cat] = []
-            categories[cat].append(item)
-        
-        for category, items in sorted(categories.items()):
-            output.append(f"\n{'=' * 80}")
-            output.append(f"{category.upper()}")
-            output.append(f"{'=' * 80}")
+        def lines():
+            yield _SEPARATOR
+            yield "WOOLWORTHS SHOPPING LIST - MATCHED PRODUCTS"
+            yield _SEPARATOR
+            yield f"Match Rate: {match_results['match_rate']:.1f}%"
+            yield f"Total Cost: ${match_results['estimated_cost']:.2f}"
+            yield ""
             
-            for item in items:
-                output.append(f"\n✓ {item['ingredient']}")
-                output.append(f"  Need: {item['original_quantity']} {item['original_unit']}")
-                output.append(f"  Product: {item['display_name']}")
-                output.append(f"  Price: ${item['price']:.2f}")
-                output.append(f"  Stockcode: {item['stockcode']}")
-                if item['cup_string']:
-                    output.append(f"  Unit Price: {item['cup_string']}")
-        
-        if match_results['unmatched_items']:
-            output.append(f"\n{'=' * 80}")
-            output.append("UNMATCHED ITEMS (Manual Search Required)")
-            output.append(f"{'=' * 80}")
-            for item in match_results['unmatched_items']:
-                output.append(f"\n✗ {item['ingredient']}")
-                output.append(f"  Need: {item['quantity']} {item['unit']}")
-        
-        output.append(f"\n{'=' * 80}")
-        output.append("END OF SHOPPING LIST")
-        output.append(f"{'=' * 80}")
+            # Stable sort keeps each category's items in match order
+            by_category = sorted(match_results['matched_items'], key=itemgetter('category'))
+            for category, items in groupby(by_category, key=itemgetter('category')):
+                yield _SECTION_BREAK
+                yield category.upper()
+                yield _SEPARATOR
+                
+                for item in items:
+                    yield f"\n✓ {item['ingredient']}"
+                    yield f"  Need: {item['original_quantity']} {item['original_unit']}"
+                    yield f"  Product: {item['display_name']}"
+                    yield f"  Price: ${item['price']:.2f}"
+                    yield f"  Stockcode: {item['stockcode']}"
+                    if item['cup_string']:
+                        yield f"  Unit Price: {item['cup_string']}"
+            
+            if match_results['unmatched_items']:
+                yield _SECTION_BREAK
+                yield "UNMATCHED ITEMS (Manual Search Required)"
+                yield _SEPARATOR
+                for item in match_results['unmatched_items']:
+                    yield f"\n✗ {item['ingredient']}"
+                    yield f"  Need: {item['quantity']} {item['unit']}"
+            
+            yield _SECTION_BREAK
+            yield "END OF SHOPPING LIST"
+            yield _SEPARATOR
         
-        return "\n".join(output)
+        return "\n".join(lines())
     
     def export_to_json(self, match_results: Dict) -> Dict:
         """Export matched products to JSON format"""
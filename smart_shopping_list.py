@@ -3,75 +3,148 @@ Smart Shopping List Generator - Rule-based approach (no AI needed!)
 Combines ingredients, applies preferences, and categorizes intelligently
 """
 
-from typing import List, Dict
+from typing import Dict, Iterator, List, Tuple
 import re
 from collections import defaultdict
+from functools import lru_cache
+from operator import itemgetter
+
+try:
+    # pyahocorasick: one automaton pass per item name instead of a substring test per keyword
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Distinct item names whose category is remembered per generator
+CATEGORY_CACHE_SIZE = 4096
+# Distinct organic preference sets whose compiled regex is remembered
+ORGANIC_REGEX_CACHE_SIZE = 256
+# First number in a quantity string ("2 cups" -> 2, "1.5kg" -> 1.5)
+_QTY_RE = re.compile(r'(\d+\.?\d*)')
+# Items that push the bill up enough to suggest buying on special
+_EXPENSIVE_RE = re.compile('beef|lamb|salmon|prawns|shrimp|organic')
+
+
+def _ingredient_name(item: Dict) -> str:
+    """Name of a raw ingredient, read from 'name' or else 'ingredient_name'"""
+    # Explicit test: a .get() default would look up ingredient_name every time
+    return item['name'] if 'name' in item else item.get('ingredient_name', '')
+
+
+# Display order of categories in the generated list (Other last)
+CATEGORY_ORDER = (
+    'Fresh Produce',
+    'Dairy & Eggs',
+    'Meat & Seafood',
+    'Bakery',
+    'Pantry Staples',
+    'Frozen',
+    'Beverages',
+    'Snacks',
+    'Other'
+)
+
+# Category mappings with extensive keywords (earlier categories win ties)
+CATEGORY_MAP = {
+    'Fresh Produce': (
+        'lettuce', 'spinach', 'kale', 'arugula', 'salad', 'greens',
+        'tomato', 'cucumber', 'carrot', 'celery', 'onion', 'garlic', 'ginger',
+        'potato', 'sweet potato', 'pumpkin', 'squash', 'zucchini', 'eggplant',
+        'capsicum', 'pepper', 'chili', 'jalapeno',
+        'broccoli', 'cauliflower', 'cabbage', 'brussels sprout',
+        'apple', 'banana', 'orange', 'lemon', 'lime', 'avocado',
+        'strawberry', 'strawberries', 'blueberry', 'blueberries', 'raspberry', 'raspberries',
+        'grape', 'mango', 'pineapple', 'berry', 'berries',
+        'melon', 'watermelon', 'peach', 'pear', 'plum', 'cherry', 'cherries',
+        'mushroom', 'corn', 'peas', 'bean', 'beans', 'asparagus', 'beetroot',
+        'parsley', 'cilantro', 'coriander', 'basil', 'mint', 'dill', 'thyme', 'rosemary',
+        'oregano', 'sage', 'tarragon', 'chives',
+        'produce', 'vegetable', 'fruit', 'herb', 'fresh', 'zest'
+    ),
+    'Dairy & Eggs': (
+        'milk', 'cream', 'yogurt', 'yoghurt', 'cheese', 'butter', 'egg',
+        'sour cream', 'cottage cheese', 'ricotta', 'mozzarella', 'parmesan',
+        'cheddar', 'feta', 'brie', 'cream cheese', 'whipped cream'
+    ),
+    'Meat & Seafood': (
+        'chicken', 'beef', 'pork', 'lamb', 'turkey', 'duck',
+        'bacon', 'ham', 'sausage', 'salami', 'prosciutto',
+        'fish', 'salmon', 'tuna', 'cod', 'prawns', 'shrimp', 'seafood',
+        'mince', 'steak', 'chop', 'roast', 'fillet', 'breast', 'thigh', 'wing',
+        'meat', 'protein'
+    ),
+    'Pantry Staples': (
+        'flour', 'sugar', 'salt', 'pepper', 'oil', 'vinegar',
+        'rice', 'pasta', 'noodle', 'macaroni', 'couscous', 'quinoa',
+        'sauce', 'paste', 'stock', 'broth', 'bouillon',
+        'spice', 'seasoning', 'cumin', 'paprika', 'turmeric', 'curry',
+        'cinnamon', 'nutmeg', 'vanilla', 'extract',
+        'honey', 'syrup', 'jam', 'peanut butter', 'tahini',
+        'canned', 'tin', 'chickpea', 'lentil', 'kidney bean', 'black bean',
+        'coconut milk', 'condensed milk', 'evaporated milk', 'almond milk',
+        'baking powder', 'baking soda', 'yeast', 'cornstarch', 'cornflour',
+        'breadcrumb', 'panko', 'chia seed', 'chia', 'flax', 'sesame',
+        'clove', 'cloves', 'mustard', 'chili powder', 'garlic powder', 'onion powder',
+        'italian herb', 'dried herb', 'chili flakes', 'stevia'
+    ),
+    'Bakery': (
+        'bread', 'roll', 'bun', 'bagel', 'croissant', 'muffin',
+        'tortilla', 'wrap', 'pita', 'naan', 'flatbread',
+        'cake', 'pastry', 'cookie', 'biscuit'
+    ),
+    'Frozen': (
+        'frozen', 'ice cream', 'sorbet', 'gelato',
+        'frozen vegetables', 'frozen fruit', 'frozen meal'
+    ),
+    'Beverages': (
+        'water', 'juice', 'soda', 'soft drink', 'tea', 'coffee',
+        'wine', 'beer', 'spirits', 'alcohol', 'drink', 'beverage'
+    ),
+    'Snacks': (
+        'chip', 'crisp', 'cracker', 'popcorn', 'pretzel',
+        'chocolate', 'candy', 'lolly', 'snack', 'nut', 'almond', 'cashew'
+    )
+}
 
 class SmartShoppingListGenerator:
     """Intelligent rule-based shopping list generator"""
     
+    # Shared keyword table; the matchers built from it in __init__ assume it is fixed
+    category_map = CATEGORY_MAP
+    
     def __init__(self):
-        # Category mappings with extensive keywords
-        self.category_map = {
-            'Fresh Produce': [
-                'lettuce', 'spinach', 'kale', 'arugula', 'salad', 'greens',
-                'tomato', 'cucumber', 'carrot', 'celery', 'onion', 'garlic', 'ginger',
-                'potato', 'sweet potato', 'pumpkin', 'squash', 'zucchini', 'eggplant',
-                'capsicum', 'pepper', 'chili', 'jalapeno',
-                'broccoli', 'cauliflower', 'cabbage', 'brussels sprout',
-                'apple', 'banana', 'orange', 'lemon', 'lime', 'avocado',
-                'strawberry', 'strawberries', 'blueberry', 'blueberries', 'raspberry', 'raspberries',
-                'grape', 'mango', 'pineapple', 'berry', 'berries',
-                'melon', 'watermelon', 'peach', 'pear', 'plum', 'cherry', 'cherries',
-                'mushroom', 'corn', 'peas', 'bean', 'beans', 'asparagus', 'beetroot',
-                'parsley', 'cilantro', 'coriander', 'basil', 'mint', 'dill', 'thyme', 'rosemary',
-                'oregano', 'sage', 'tarragon', 'chives',
-                'produce', 'vegetable', 'fruit', 'herb', 'fresh', 'zest'
-            ],
-            'Dairy & Eggs': [
-                'milk', 'cream', 'yogurt', 'yoghurt', 'cheese', 'butter', 'egg',
-                'sour cream', 'cottage cheese', 'ricotta', 'mozzarella', 'parmesan',
-                'cheddar', 'feta', 'brie', 'cream cheese', 'whipped cream'
-            ],
-            'Meat & Seafood': [
-                'chicken', 'beef', 'pork', 'lamb', 'turkey', 'duck',
-                'bacon', 'ham', 'sausage', 'salami', 'prosciutto',
-                'fish', 'salmon', 'tuna', 'cod', 'prawns', 'shrimp', 'seafood',
-                'mince', 'steak', 'chop', 'roast', 'fillet', 'breast', 'thigh', 'wing',
-                'meat', 'protein'
-            ],
-            'Pantry Staples': [
-                'flour', 'sugar', 'salt', 'pepper', 'oil', 'vinegar',
-                'rice', 'pasta', 'noodle', 'macaroni', 'couscous', 'quinoa',
-                'sauce', 'paste', 'stock', 'broth', 'bouillon',
-                'spice', 'seasoning', 'cumin', 'paprika', 'turmeric', 'curry',
-                'cinnamon', 'nutmeg', 'vanilla', 'extract',
-                'honey', 'syrup', 'jam', 'peanut butter', 'tahini',
-                'canned', 'tin', 'chickpea', 'lentil', 'kidney bean', 'black bean',
-                'coconut milk', 'condensed milk', 'evaporated milk', 'almond milk',
-                'baking powder', 'baking soda', 'yeast', 'cornstarch', 'cornflour',
-                'breadcrumb', 'panko', 'chia seed', 'chia', 'flax', 'sesame',
-                'clove', 'cloves', 'mustard', 'chili powder', 'garlic powder', 'onion powder',
-                'italian herb', 'dried herb', 'chili flakes', 'stevia'
-            ],
-            'Bakery': [
-                'bread', 'roll', 'bun', 'bagel', 'croissant', 'muffin',
-                'tortilla', 'wrap', 'pita', 'naan', 'flatbread',
-                'cake', 'pastry', 'cookie', 'biscuit'
-            ],
-            'Frozen': [
-                'frozen', 'ice cream', 'sorbet', 'gelato',
-                'frozen vegetables', 'frozen fruit', 'frozen meal'
-            ],
-            'Beverages': [
-                'water', 'juice', 'soda', 'soft drink', 'tea', 'coffee',
-                'wine', 'beer', 'spirits', 'alcohol', 'drink', 'beverage'
-            ],
-            'Snacks': [
-                'chip', 'crisp', 'cracker', 'popcorn', 'pretzel',
-                'chocolate', 'candy', 'lolly', 'snack', 'nut', 'almond', 'cashew'
-            ]
-        }
+        self._category_automaton = self._build_category_automaton() if ahocorasick else None
+        if self._category_automaton is None:
+            self._category_re, self._group_to_category = self._build_category_regex()
+        # Repeat ingredients (onion, garlic, ...) are classified once per generator
+        self._cached_category = lru_cache(maxsize=CATEGORY_CACHE_SIZE)(self._match_category)
+    
+    def _build_category_automaton(self):
+        """Aho-Corasick automaton mapping every keyword to (category priority, category)"""
+        automaton = ahocorasick.Automaton()
+        for priority, (category, keywords) in enumerate(self.category_map.items()):
+            for keyword in keywords:
+                # Keywords listed under several categories keep the earliest one
+                if keyword not in automaton:
+                    automaton.add_word(keyword, (priority, category))
+        automaton.make_automaton()
+        return automaton
+    
+    def _build_category_regex(self):
+        """
+        One regex whose named group identifies an item's category
+        
+        Each branch is a lookahead for any of a category's keywords, tried
+        in category order at the start of the name, so the earliest matching
+        category wins (a plain alternation would return the leftmost keyword).
+        """
+        branches = []
+        group_to_category = {}
+        for i, (category, keywords) in enumerate(self.category_map.items()):
+            alternation = '|'.join(map(re.escape, keywords))
+            branches.append(f'(?=.*?(?:{alternation}))(?P<g{i}>)')
+            group_to_category[f'g{i}'] = category
+        return re.compile('|'.join(branches), re.S), group_to_category
     
     def generate_optimized_list(self, 
                                raw_ingredients: List[Dict],
@@ -95,31 +168,27 @@ class SmartShoppingListGenerator:
         substitutions = substitutions or []
         staples = staples or []
         
-        # Step 1: Normalize and combine duplicates
-        combined = self._combine_duplicates(raw_ingredients)
-        
-        # Step 2: Apply substitutions
-        combined = self._apply_substitutions(combined, substitutions)
-        
-        # Step 3: Apply organic preferences
-        combined = self._apply_organic_preferences(combined, organic_preferences)
+        # Steps 1-3: Combine duplicates, apply substitutions and organic preferences
+        combined = self._normalize_and_merge(raw_ingredients, substitutions, organic_preferences)
         
         # Step 4: Add unchecked staples
         for staple in staples:
             if not staple.get('in_stock', False):
-                combined.append({
-                    'name': staple['name'],
+                name = staple['name']
+                combined.append(({
+                    'name': name,
                     'quantity': staple['quantity'],
                     'unit': staple.get('unit', ''),
                     'notes': 'Staple item'
-                })
+                }, name, name.lower()))
         
         # Step 5: Categorize intelligently
         categories = self._categorize_items(combined)
         
         # Step 6: Generate helpful tips
-        tips = self._generate_tips(combined, organic_preferences)
-        cost_saving = self._generate_cost_saving_tips(combined)
+        names = [name_lower for _, _, name_lower in combined]
+        tips = self._generate_tips(names, organic_preferences, categories)
+        cost_saving = self._generate_cost_saving_tips(names, categories)
         
         return {
             'categories': categories,
@@ -128,34 +197,77 @@ class SmartShoppingListGenerator:
             'total_items': len(combined)
         }
     
-    def _combine_duplicates(self, ingredients: List[Dict]) -> List[Dict]:
-        """Combine duplicate ingredients intelligently"""
+    def _normalize_and_merge(self, ingredients: List[Dict], substitutions: List[Dict],
+                             organic_prefs: List[str]) -> List[Tuple[Dict, str, str]]:
+        """
+        Combine duplicates, then apply substitutions and organic preferences
+        
+        Returns (item, name, lowercased name) triples, so later stages never
+        re-derive the name from the item dict.
+        
+        The substitution map and organic regex are built once and each
+        combined item goes through both rules as it is produced. Dicts the
+        combiner created are updated in place; an item passed through from
+        the caller is copied once, and only if a rule changes it.
+        """
+        sub_map = self._build_substitution_map(substitutions)
+        organic_re = self._build_organic_regex(organic_prefs)
+        
+        if not sub_map and not organic_re:
+            return [(item, name, name_lower)
+                    for item, name, name_lower, _ in self._iter_combined(ingredients)]
+        
+        result = []
+        for item, name, name_lower, owned in self._iter_combined(ingredients):
+            name, name_lower, note = self._rewrite_name(name, name_lower, sub_map, organic_re)
+            if note:
+                if not owned:
+                    item = item.copy()
+                item['name'] = name
+                item['notes'] = item.get('notes', '') + note
+            result.append((item, name, name_lower))
+        
+        return result
+    
+    def _iter_combined(self, ingredients: List[Dict]) -> Iterator[Tuple[Dict, str, str, bool]]:
+        """
+        Combine duplicate ingredients intelligently
         
-        # Group by normalized name
+        Yields (item, name, lowercased name, owned): owned is False when item
+        is the caller's own dict, passed through unchanged, and must be
+        copied before mutation.
+        """
+        
+        # Group by normalized name, remembering each item's name as read
         groups = defaultdict(list)
         
         for item in ingredients:
-            name = item.get('name', item.get('ingredient_name', '')).lower().strip()
+            raw_name = _ingredient_name(item)
+            name_lower = raw_name.lower()
             # Normalize name (remove extra spaces, etc)
-            name = ' '.join(name.split())
-            groups[name].append(item)
+            name = ' '.join(name_lower.split())
+            groups[name].append((item, raw_name, name_lower))
         
-        combined = []
-        for name, items in groups.items():
-            if len(items) == 1:
-                combined.append(items[0])
+        for name, entries in groups.items():
+            if len(entries) == 1:
+                item, raw_name, name_lower = entries[0]
+                yield item, raw_name, name_lower, False
             else:
+                items = [item for item, _, _ in entries]
                 # Multiple items with same name - combine quantities if possible
                 total_qty = 0
                 unit = items[0].get('unit', '')
-                notes = []
                 
                 # Try to sum numeric quantities
                 can_sum = True
                 for item in items:
-                    qty_str = str(item.get('quantity', '1'))
+                    qty = item.get('quantity', 1)
+                    if type(qty) in (int, float) and qty >= 0:
+                        # Already numeric: no str() round trip or regex
+                        total_qty += qty
+                        continue
                     # Extract number from quantity
-                    match = re.search(r'(\d+\.?\d*)', qty_str)
+                    match = _QTY_RE.search(str(qty))
                     if match:
                         total_qty += float(match.group(1))
                     else:
@@ -164,195 +276,170 @@ class SmartShoppingListGenerator:
                 
                 if can_sum and total_qty > 0:
                     # Successfully combined
-                    combined.append({
+                    yield {
                         'name': name,
                         'quantity': f"{total_qty:.1f}".rstrip('0').rstrip('.'),
                         'unit': unit,
                         'notes': f'Combined from {len(items)} recipes'
-                    })
+                    }, name, name, True
                 else:
                     # Can't combine - keep separate
-                    for idx, item in enumerate(items, 1):
+                    for idx, (item, raw_name, name_lower) in enumerate(entries, 1):
                         item_copy = item.copy()
                         item_copy['notes'] = f'From recipe {idx}'
-                        combined.append(item_copy)
-        
-        return combined
+                        yield item_copy, raw_name, name_lower, True
     
-    def _apply_substitutions(self, ingredients: List[Dict], substitutions: List[Dict]) -> List[Dict]:
-        """Apply ingredient substitutions"""
-        
-        if not substitutions:
-            return ingredients
-        
-        # Build substitution map
+    @staticmethod
+    def _build_substitution_map(substitutions: List[Dict]) -> Dict[str, str]:
+        """Lowercased original ingredient -> replacement"""
         sub_map = {}
         for sub in substitutions:
             original = sub.get('original_ingredient', '').lower()
             replacement = sub.get('replacement', '')
             if original and replacement:
                 sub_map[original] = replacement
-        
-        # Apply substitutions
-        result = []
-        for item in ingredients:
-            name = item.get('name', item.get('ingredient_name', '')).lower()
-            
-            if name in sub_map:
-                item_copy = item.copy()
-                item_copy['name'] = sub_map[name]
-                item_copy['notes'] = item_copy.get('notes', '') + f' (Substituted from {name})'
-                result.append(item_copy)
-            else:
-                result.append(item)
-        
-        return result
+        return sub_map
     
-    def _apply_organic_preferences(self, ingredients: List[Dict], organic_prefs: List[str]) -> List[Dict]:
-        """Add organic prefix to preferred items"""
-        
+    @staticmethod
+    def _build_organic_regex(organic_prefs: List[str]):
+        """One alternation over the lowercased preferences, or None if there are none"""
         if not organic_prefs:
-            return ingredients
+            return None
+        return _compile_organic_regex(frozenset(pref.lower() for pref in organic_prefs))
+    
+    @staticmethod
+    def _rewrite_name(name: str, name_lower: str, sub_map: Dict[str, str],
+                      organic_re) -> Tuple[str, str, str]:
+        """
+        Apply the substitution and organic rules to one item name
         
-        organic_set = {pref.lower() for pref in organic_prefs}
+        Returns (new name, new lowercased name, text to append to the item's
+        notes); the note is empty when neither rule applies.
+        """
+        note = ''
         
-        result = []
-        for item in ingredients:
-            name = item.get('name', item.get('ingredient_name', ''))
+        if name_lower in sub_map:
+            note = f' (Substituted from {name_lower})'
+            name = sub_map[name_lower]
             name_lower = name.lower()
-            
-            # Check if any organic preference matches
-            should_be_organic = any(pref in name_lower for pref in organic_set)
-            
-            if should_be_organic and 'organic' not in name_lower:
-                item_copy = item.copy()
-                item_copy['name'] = f'organic {name}'
-                item_copy['notes'] = item_copy.get('notes', '') + ' 🌱'
-                result.append(item_copy)
-            else:
-                result.append(item)
         
-        return result
+        # Check if any organic preference matches (one regex scan, not one test per preference)
+        if organic_re and 'organic' not in name_lower and organic_re.search(name_lower):
+            name = f'organic {name}'
+            name_lower = f'organic {name_lower}'
+            note += ' 🌱'
+        
+        return name, name_lower, note
     
-    def _categorize_items(self, ingredients: List[Dict]) -> Dict[str, List[Dict]]:
-        """Categorize items into shopping categories"""
+    def _categorize_items(self, ingredients: List[Tuple[Dict, str, str]]) -> Dict[str, List[Dict]]:
+        """Categorize (item, name, lowercased name) triples into shopping categories"""
         
-        categories = defaultdict(list)
+        # Buckets preseeded in display order, so no reordering pass is needed
+        buckets = {category: [] for category in CATEGORY_ORDER}
         
-        for item in ingredients:
-            name = item.get('name', item.get('ingredient_name', '')).lower()
-            category = self._get_category(name)
+        for item, name, name_lower in ingredients:
+            category = self._cached_category(name_lower)
             
             # Format item for display
             formatted_item = {
-                'item': item.get('name', item.get('ingredient_name', '')),
+                'item': name,
                 'quantity': item.get('quantity', '1'),
                 'unit': item.get('unit', ''),
                 'notes': item.get('notes', '')
             }
             
-            categories[category].append(formatted_item)
-        
-        # Sort items within each category
-        for category in categories:
-            categories[category].sort(key=lambda x: x['item'].lower())
-        
-        # Convert to regular dict and sort by category importance
-        category_order = [
-            'Fresh Produce',
-            'Dairy & Eggs',
-            'Meat & Seafood',
-            'Bakery',
-            'Pantry Staples',
-            'Frozen',
-            'Beverages',
-            'Snacks',
-            'Other'
-        ]
+            # Any category missing from CATEGORY_ORDER lands after it, in first-seen order
+            buckets.setdefault(category, []).append((name_lower, formatted_item))
         
+        # Sort items within each non-empty category by the already-lowercased name
         sorted_categories = {}
-        for cat in category_order:
-            if cat in categories:
-                sorted_categories[cat] = categories[cat]
-        
-        # Add any remaining categories
-        for cat, items in categories.items():
-            if cat not in sorted_categories:
-                sorted_categories[cat] = items
+        for category, entries in buckets.items():
+            if entries:
+                entries.sort(key=itemgetter(0))
+                sorted_categories[category] = [formatted_item for _, formatted_item in entries]
         
         return sorted_categories
     
     def _get_category(self, item_name: str) -> str:
         """Determine the category for an item"""
+        return self._cached_category(item_name.lower())
+    
+    def _match_category(self, item_name: str) -> str:
+        """Category for an already-lowercased item name (memoized per generator)"""
+        if self._category_automaton is not None:
+            # Earliest category with any keyword in the name wins
+            best = None
+            for _, match in self._category_automaton.iter(item_name):
+                if best is None or match[0] < best[0]:
+                    best = match
+                    if best[0] == 0:
+                        break
+            return best[1] if best else 'Other'
         
-        item_name = item_name.lower()
-        
-        # Check each category's keywords
-        for category, keywords in self.category_map.items():
-            for keyword in keywords:
-                if keyword in item_name:
-                    return category
-        
-        return 'Other'
+        match = self._category_re.match(item_name)
+        return self._group_to_category[match.lastgroup] if match else 'Other'
     
-    def _generate_tips(self, ingredients: List[Dict], organic_prefs: List[str]) -> List[str]:
-        """Generate helpful shopping tips"""
+    def _generate_tips(self, names: List[str], organic_prefs: List[str],
+                       categories: Dict[str, List[Dict]]) -> List[str]:
+        """Generate helpful shopping tips (names: lowercased item names, categories: output of _categorize_items)"""
         
         tips = []
         
-        # Count categories
-        categories = set()
-        for item in ingredients:
-            name = item.get('name', item.get('ingredient_name', '')).lower()
-            categories.add(self._get_category(name))
-        
         # Tip about produce section
-        if 'Fresh Produce' in [self._get_category(item.get('name', '').lower()) for item in ingredients]:
+        if 'Fresh Produce' in categories:
             tips.append("🥬 Start with fresh produce to ensure best quality")
         
         # Organic tip
-        organic_count = sum(1 for item in ingredients if 'organic' in item.get('name', '').lower())
+        organic_count = sum(1 for name in names if 'organic' in name)
         if organic_count > 0:
             tips.append(f"🌱 {organic_count} organic items marked with preference")
         
         # Shopping efficiency
-        if len(ingredients) > 20:
-            tips.append(f"📝 {len(ingredients)} items total - consider shopping online or using a list app")
+        if len(names) > 20:
+            tips.append(f"📝 {len(names)} items total - consider shopping online or using a list app")
         
         return tips
     
-    def _generate_cost_saving_tips(self, ingredients: List[Dict]) -> List[str]:
-        """Generate cost-saving suggestions"""
+    def _generate_cost_saving_tips(self, names: List[str],
+                                   categories: Dict[str, List[Dict]]) -> List[str]:
+        """Generate cost-saving suggestions (names: lowercased item names, categories: output of _categorize_items)"""
         
         tips = []
         
         # Check for expensive items
-        expensive_keywords = ['beef', 'lamb', 'salmon', 'prawns', 'shrimp', 'organic']
-        expensive_items = [
-            item for item in ingredients
-            if any(kw in item.get('name', '').lower() for kw in expensive_keywords)
-        ]
+        expensive_count = sum(1 for name in names if _EXPENSIVE_RE.search(name))
         
-        if len(expensive_items) > 3:
+        if expensive_count > 3:
             tips.append("💰 Consider buying meat/seafood on special or in bulk")
         
         # Seasonal produce tip
         tips.append("🌿 Buy seasonal produce for better prices and quality")
         
         # Bulk buying
-        pantry_count = sum(1 for item in ingredients 
-                          if self._get_category(item.get('name', '').lower()) == 'Pantry Staples')
+        pantry_count = len(categories.get('Pantry Staples', ()))
         if pantry_count > 5:
             tips.append("📦 Pantry staples often cheaper in bulk")
         
         return tips
 
 
+@lru_cache(maxsize=ORGANIC_REGEX_CACHE_SIZE)
+def _compile_organic_regex(prefs: frozenset):
+    """Compiled alternation for a preference set (a user's set rarely changes between lists)"""
+    return re.compile('|'.join(map(re.escape, prefs)))
+
+
 # Helper function for Flask app
+@lru_cache(maxsize=1)
+def get_smart_shopping_list_generator() -> SmartShoppingListGenerator:
+    """Shared generator, so the keyword matcher and category cache are built once per process"""
+    return SmartShoppingListGenerator()
+
+
 def generate_smart_shopping_list(raw_ingredients, organic_preferences=None, 
                                  substitutions=None, staples=None):
     """Convenience function for Flask app"""
-    generator = SmartShoppingListGenerator()
+    generator = get_smart_shopping_list_generator()
     return generator.generate_optimized_list(
         raw_ingredients, 
         organic_preferences, 
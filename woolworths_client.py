@@ -5,9 +5,30 @@ Connects to the remote MCP service for product search and cart management
 
 import requests
 import os
+import copy
+import threading
+import time
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 from functools import lru_cache
 
+try:
+    # orjson: C encoder/decoder for MCP payloads, raises a ValueError subclass
+    import orjson as json
+except ImportError:
+    import json
+
+# Concurrent searches in search_products_many (matches the session pool size)
+SEARCH_MAX_WORKERS = 16
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# Read-only responses remembered per client (prices/specials go stale, hence the TTL)
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 900.0
+
 class WoolworthsClient:
     """Client for interacting with Woolworths MCP service"""
     
@@ -16,21 +37,71 @@ class WoolworthsClient:
         self.service_url = service_url or os.environ.get('MCP_SERVICE_URL', 'http://localhost:8080')
         self.timeout = 30
         
+        # Keep-alive session so back-to-back calls reuse the same TCP/TLS connection
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._session.headers['Accept'] = 'application/json'
+        
+        # Every call goes to the same service, so resolve proxy and CA bundle
+        # settings from the environment once; with trust_env on, requests
+        # re-reads them (and ~/.netrc) on each call
+        self._session.proxies.update(requests.utils.get_environ_proxies(self.service_url))
+        ca_bundle = os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE')
+        if ca_bundle:
+            self._session.verify = ca_bundle
+        self._session.trust_env = False
+        
+        # (endpoint, params) -> (cached_at, response) for search/details/categories
+        self._response_cache = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+        
     def _request(self, endpoint: str, method: str = 'GET', data: dict = None) -> dict:
         """Make HTTP request to MCP service"""
         url = f"{self.service_url}{endpoint}"
         
         try:
             if method == 'GET':
-                response = requests.get(url, params=data, timeout=self.timeout)
+                response = self._session.get(url, params=data, timeout=self.timeout)
             else:
-                response = requests.post(url, json=data, timeout=self.timeout)
+                body = json.dumps(data) if data is not None else None
+                response = self._session.post(url, data=body, headers=JSON_HEADERS, timeout=self.timeout)
             
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            return json.loads(response.content) if response.content else {}
+        except (requests.exceptions.RequestException, ValueError) as e:
             return {"error": str(e), "success": False}
     
+    def _cached_request(self, key: tuple, endpoint: str, method: str = 'GET', data: dict = None) -> dict:
+        """_request for read-only endpoints, served from the response cache when fresh"""
+        with self._response_cache_lock:
+            entry = self._response_cache.get(key)
+            if entry is not None:
+                if time.monotonic() - entry[0] < RESPONSE_CACHE_TTL:
+                    self._response_cache.move_to_end(key)
+                    return copy.deepcopy(entry[1])
+                del self._response_cache[key]
+        
+        result = self._request(endpoint, method, data)
+        # Errors are not cached so the next call retries the service
+        if isinstance(result, dict) and 'error' not in result:
+            with self._response_cache_lock:
+                self._response_cache[key] = (time.monotonic(), copy.deepcopy(result))
+                self._response_cache.move_to_end(key)
+                if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                    self._response_cache.popitem(last=False)
+        return result
+    
+    def clear_cache(self):
+        """Drop all cached search, product and category responses"""
+        with self._response_cache_lock:
+            self._response_cache.clear()
+    
+    def close(self):
+        """Close pooled HTTP connections"""
+        self._session.close()
+    
     def health_check(self) -> bool:
         """Check if MCP service is healthy"""
         try:
@@ -50,10 +121,31 @@ class WoolworthsClient:
         Returns:
             dict with products array and metadata
         """
-        return self._request('/api/search', 'POST', {
+        data = {
             'searchTerm': search_term,
             'pageSize': page_size
-        })
+        }
+        if not search_term:
+            return self._request('/api/search', 'POST', data)
+        return self._cached_request(('search', search_term, page_size), '/api/search', 'POST', data)
+    
+    def search_products_many(self, search_terms: List[str], page_size: int = 20) -> List[dict]:
+        """
+        Search for several products concurrently
+        
+        Args:
+            search_terms: Product search queries
+            page_size: Number of results to return per search
+            
+        Returns:
+            list of search results, in the same order as search_terms
+        """
+        if len(search_terms) <= 1:
+            return [self.search_products(term, page_size) for term in search_terms]
+        
+        workers = min(SEARCH_MAX_WORKERS, len(search_terms))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda term: self.search_products(term, page_size), search_terms))
     
     def get_product_details(self, stockcode: str) -> dict:
         """
@@ -65,11 +157,11 @@ class WoolworthsClient:
         Returns:
             dict with product details
         """
-        return self._request(f'/api/product/{stockcode}', 'GET')
+        return self._cached_request(('product', str(stockcode)), f'/api/product/{stockcode}', 'GET')
     
     def get_categories(self) -> dict:
         """Get all product categories"""
-        return self._request('/api/categories', 'GET')
+        return self._cached_request(('categories',), '/api/categories', 'GET')
     
     def get_specials(self, category: str = None, page_size: int = 20) -> dict:
         """